@@ -0,0 +1,89 @@
+# Stress call/cc with generators, coroutine ping-pong and amb style
+# backtracking. Usage:
+#
+#   python bench/callcc_stress.py [-r REPEAT]
+#
+# The generators and ping-pong programs only invoke each continuation
+# once, so they are also run with call/1cc. Each program is run with a
+# value stack per context and with the shared value stack. At last, the
+# time of capturing and invoking a continuation at increasing recursion
+# depths is reported, it should not grow with the depth.
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from skime.vm import VM
+
+SCHEME_DIR = os.path.join(os.path.dirname(__file__), 'scheme')
+
+# program => whether it can use one-shot continuations
+PROGRAMS = [('generators.scm', True),
+            ('pingpong.scm', True),
+            ('amb.scm', False)]
+
+DEEP = """
+(define (escape n)
+  (if (= n 0)
+      0
+      (begin
+        (%s (lambda (k) (k 0)))
+        (escape (- n 1)))))
+(define (deep n)
+  (if (= n 0)
+      (escape 1000)
+      (+ 1 (deep (- n 1)))))
+"""
+
+def best_time(vm, script, repeat):
+    times = []
+    result = None
+    for i in range(repeat):
+        start = time.time()
+        result = vm.eval_string(script)
+        times.append(time.time()-start)
+    return min(times), result
+
+def run_programs(repeat):
+    print '%-16s %-9s %10s %10s' % ('program', 'call', 'list', 'shared')
+    for name, one_shot in PROGRAMS:
+        io = open(os.path.join(SCHEME_DIR, name))
+        content = io.read()
+        io.close()
+
+        calls = ['call/cc']
+        if one_shot:
+            calls.append('call/1cc')
+        for call in calls:
+            script = '(begin %s)' % content.replace('call/cc', call)
+            t_list, r_list = best_time(VM(), script, repeat)
+            t_shared, r_shared = best_time(VM(shared_stack=True), script, repeat)
+            assert r_list == r_shared
+            print '%-16s %-9s %9.3fs %9.3fs' % (name, call, t_list, t_shared)
+
+def run_depths(repeat):
+    print
+    print '%-16s %-9s %10s %10s' % ('depth', 'call', 'list', 'shared')
+    for depth in [10, 100, 1000]:
+        for call in ['call/cc', 'call/1cc']:
+            times = []
+            for shared_stack in [False, True]:
+                vm = VM(shared_stack=shared_stack)
+                vm.eval_string('(begin %s)' % (DEEP % call))
+                times.append(best_time(vm, '(deep %d)' % depth, repeat)[0])
+            print '%-16d %-9s %9.3fs %9.3fs' % (depth, call, times[0], times[1])
+
+def main(argv):
+    parser = OptionParser(usage="%prog [-r REPEAT]")
+    parser.add_option('-r', '--repeat', type='int', default=3,
+                      help="the number of runs of each program")
+    options, args = parser.parse_args(argv)
+
+    run_programs(options.repeat)
+    run_depths(options.repeat)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,102 @@
+# Measure the memory used by the frames of procedure calls, in deep
+# recursion and with many live closures. Usage:
+#
+#   python bench/frame_memory.py [N]
+#
+# The frames alive at the end of each workload are collected, and their
+# sizes are summed with sys.getsizeof. The size of each frame is also
+# computed as if it were an Environment copied by Environment.dup, with its
+# own list of names and name to index dict, which is how frames used to be
+# represented.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from skime.vm        import VM
+from skime.env       import Frame, Environment
+from skime.call_cc   import Continuation
+from skime.types.pair import Pair
+
+DEEP = """
+(define k #f)
+(define (deep n)
+  (if (= n 0)
+      (call/cc (lambda (c) (set! k c) 0))
+      (+ 1 (deep (- n 1)))))
+(deep %d)
+"""
+
+CLOSURES = """
+(define (make-closures n acc)
+  (if (= n 0)
+      acc
+      (make-closures (- n 1)
+                     (cons (let ((x n) (y (* n 2)))
+                             (lambda () (+ x y)))
+                           acc))))
+(define closures (make-closures %d '()))
+"""
+
+def frame_size(frame):
+    return sys.getsizeof(frame) + sys.getsizeof(frame.locals)
+
+def environment_size(frame):
+    "The size of the frame as an Environment with copied names."
+    n = len(frame.locals)
+    env = Environment()
+    env.locals = list(frame.locals)
+    env.locals_name = [None] * n
+    env.locals_map = dict([(i, i) for i in range(n)])
+    return sys.getsizeof(env) + sys.getsizeof(env.__dict__) + \
+           sys.getsizeof(env.locals) + sys.getsizeof(env.locals_name) + \
+           sys.getsizeof(env.locals_map)
+
+def collect_frames(envs):
+    "Collect all the frames reachable from envs through lexical parents."
+    frames = {}
+    for env in envs:
+        while isinstance(env, Frame) and id(env) not in frames:
+            frames[id(env)] = env
+            env = env.parent
+    return frames.values()
+
+def report(name, frames):
+    before = sum([environment_size(f) for f in frames])
+    after = sum([frame_size(f) for f in frames])
+    print '%-10s %8d frames  %6.1f bytes/frame before  %6.1f bytes/frame after  (%.1f%%)' % \
+          (name, len(frames), float(before)/len(frames), float(after)/len(frames),
+           100.0*after/before)
+
+def deep_recursion(n):
+    vm = VM()
+    vm.eval_string('(begin %s)' % (DEEP % n))
+    k = vm.env.read_local(vm.env.find_local('k'))
+    assert isinstance(k, Continuation)
+
+    envs = []
+    ctx = k.ctx
+    while ctx is not None:
+        envs.append(ctx.env)
+        ctx = ctx.parent
+    report('recursion', collect_frames(envs))
+
+def live_closures(n):
+    vm = VM()
+    vm.eval_string('(begin %s)' % (CLOSURES % n))
+    lst = vm.env.read_local(vm.env.find_local('closures'))
+
+    envs = []
+    while isinstance(lst, Pair):
+        envs.append(lst.first.lexical_parent)
+        lst = lst.rest
+    report('closures', collect_frames(envs))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+    else:
+        n = 500
+    deep_recursion(n)
+    live_closures(n)
@@ -0,0 +1,88 @@
+# Measure map, for-each and apply on long lists. Usage:
+#
+#   python bench/higher_order.py [-r REPEAT] [-e ENGINE] [N ...]
+#
+# Each program is run on lists of N elements (1e5 and 1e6 by default),
+# with the primitives calling the procedures in the dispatch loop, and
+# with the same primitives running each call in a nested engine through
+# VM.apply, as they did before (nested-map and nested-for-each). The best
+# time of REPEAT runs is reported. The nested primitives fail on the
+# programs recursing through map, which exhaust the Python stack.
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from skime.vm   import VM
+from skime.prim import PyPrimitive, prim_map, prim_for_each
+
+LIBRARY = """
+(begin
+  (define (iota i acc) (if (= i 0) acc (iota (- i 1) (cons i acc))))
+  (define (nest i acc) (if (= i 0) acc (nest (- i 1) (list acc))))
+  (define total 0))
+"""
+
+# The procedure recursing through map, with map or nested-map
+DEPTH = """
+(define (depth tree)
+  (if (pair? tree)
+      (+ 1 (apply max (%smap depth tree)))
+      0))
+"""
+
+PROGRAMS = [
+    ('map lambda', "(MAP (lambda (x) (+ x 1)) lst)"),
+    ('map primitive', "(MAP car (MAP list lst))"),
+    ('map 2 lists', "(MAP (lambda (x y) (+ x y)) lst lst)"),
+    ('for-each', "(FOR-EACH (lambda (x) (set! total (+ total x))) lst)"),
+    ('apply', "(apply + lst)"),
+    ('depth', "(depth deep)"),
+]
+
+def main(argv):
+    parser = OptionParser(usage="%prog [-r REPEAT] [-e ENGINE] [N ...]")
+    parser.add_option('-r', '--repeat', type='int', default=1,
+                      help="the number of runs of each program")
+    parser.add_option('-e', '--engine', default='table',
+                      help="the engine to run the programs with")
+    options, sizes = parser.parse_args(argv)
+    sizes = [int(float(n)) for n in sizes] or [100000, 1000000]
+
+    vm = VM(engine=options.engine)
+    vm.env.alloc_local('nested-map', PyPrimitive(prim_map, (2, -1)))
+    vm.env.alloc_local('nested-for-each', PyPrimitive(prim_for_each, (2, -1)))
+    vm.eval_string(LIBRARY)
+
+    print '%-14s %10s %12s %12s' % ('program', 'N', 'dispatch', 'nested')
+    for n in sizes:
+        vm.eval_string("(define lst (iota %d '()))" % n)
+        # deep enough for the Python stack
+        vm.eval_string("(define deep (nest %d '()))" % min(n, 10000))
+        for name, program in PROGRAMS:
+            times = []
+            for prefix in ['', 'nested-']:
+                source = program.replace('MAP', prefix + 'map') \
+                                .replace('FOR-EACH', prefix + 'for-each')
+                vm.eval_string(DEPTH % prefix)
+                best = None
+                for i in range(options.repeat):
+                    start = time.time()
+                    try:
+                        vm.eval_string(source)
+                    except RuntimeError:
+                        best = 'RuntimeError'
+                        break
+                    elapsed = time.time() - start
+                    if best is None or elapsed < best:
+                        best = elapsed
+                if isinstance(best, float):
+                    best = '%.3fs' % best
+                times.append(best)
+            print '%-14s %10d %12s %12s' % ((name, n) + tuple(times))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,98 @@
+# Measure the speed of the parser on a large generated file. Usage:
+#
+#   python bench/parse.py [-r REPEAT] [-s SIZE] [file.scm ...]
+#
+# The source is the given files, or else a generated one of about SIZE
+# megabytes of definitions, data lists, strings and comments. It is
+# parsed by:
+#  - parse() of the whole text in memory, as a single list
+#  - a Reader reading the top level data from the file in chunks
+# The best time of REPEAT runs is reported.
+
+import os
+import sys
+import time
+import tempfile
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from skime.compiler.parser import parse, Reader
+
+FORMS = [
+"""
+; procedure %d
+(define (proc-%d lst acc)
+  (if (null? lst)
+      (let ((avg (/ acc 2)))
+        (list acc avg "done\\n"))
+      (proc-%d (cdr lst) (+ acc (car lst)))))
+""",
+"""
+(define data-%d
+  '((name . "row %d") (values 1 2.5 -3 1/2 4+2i)
+    (tags alpha beta gamma) (nested (deep (deeper #t #f)))))
+""",
+"""
+(define-syntax swap-%d!
+  (syntax-rules ()
+    ((_ a b) (let ((tmp a)) (set! a b) (set! b tmp)))))
+(define (quasi-%d x) `(a ,x ,@(list x %d)))
+"""]
+
+def generate(path, size):
+    io = open(path, 'w')
+    i = 0
+    while io.tell() < size:
+        form = FORMS[i % len(FORMS)]
+        io.write(form % ((i,) * form.count('%d')))
+        i += 1
+    io.close()
+
+def best_time(run, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        run()
+        times.append(time.time()-start)
+    return min(times)
+
+def main(argv):
+    parser = OptionParser(usage="%prog [-r REPEAT] [-s SIZE] [file.scm ...]")
+    parser.add_option('-r', '--repeat', type='int', default=3,
+                      help="the number of runs of each way")
+    parser.add_option('-s', '--size', type='float', default=2,
+                      help="the size of the generated file in megabytes")
+    options, files = parser.parse_args(argv)
+
+    tmp = None
+    if not files:
+        fd, tmp = tempfile.mkstemp(suffix='.scm')
+        os.close(fd)
+        generate(tmp, int(options.size * 1024 * 1024))
+        files = [tmp]
+    try:
+        size = sum([os.path.getsize(path) for path in files])
+        texts = [open(path).read() for path in files]
+
+        def parse_all():
+            for path, text in zip(files, texts):
+                parse("(%s)" % text, path)
+        def read_all():
+            for path in files:
+                io = open(path)
+                for expr in Reader(io, path):
+                    pass
+                io.close()
+
+        print '%.2fMB' % (size / 1024.0 / 1024)
+        for name, run in [('parse', parse_all),
+                          ('reader', read_all)]:
+            t = best_time(run, options.repeat)
+            print '%-8s %8.3fs %8.2fMB/s' % (name, t, size / t / 1024 / 1024)
+    finally:
+        if tmp is not None:
+            os.remove(tmp)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,43 @@
+; Backtracking with amb style choice points: find all the pythagorean
+; triples up to n. A continuation is captured at each choice point, and
+; invoked again for each alternative, so this needs multi-shot
+; continuations.
+(define fail-stack '())
+
+(define (fail)
+  (let ((back (car fail-stack)))
+    (set! fail-stack (cdr fail-stack))
+    (back)))
+
+(define (choose lst)
+  (if (null? lst)
+      (fail)
+      (call/cc
+        (lambda (k)
+          (set! fail-stack
+                (cons (lambda () (k (choose (cdr lst)))) fail-stack))
+          (car lst)))))
+
+(define (range a b)
+  (if (< b a)
+      '()
+      (cons a (range (+ a 1) b))))
+
+(define (triple n)
+  (let* ((a (choose (range 1 n)))
+         (b (choose (range a n)))
+         (c (choose (range b n))))
+    (if (= (+ (* a a) (* b b)) (* c c))
+        (list a b c)
+        (fail))))
+
+(define (all-triples n)
+  (define results '())
+  (call/cc
+    (lambda (done)
+      (set! fail-stack (list (lambda () (done #f))))
+      (set! results (cons (triple n) results))
+      (fail)))
+  results)
+
+(all-triples 20)
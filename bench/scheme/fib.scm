@@ -0,0 +1,7 @@
+; Doubly recursive fibonacci: call and arithmetic heavy.
+(define (fib n)
+  (if (< n 2)
+      n
+      (+ (fib (- n 1)) (fib (- n 2)))))
+
+(fib 20)
@@ -0,0 +1,35 @@
+; Generators made with call/cc: sum the elements of a list produced one
+; at a time by a generator. Each element is one capture and one resume
+; on both sides.
+(define (make-gen lst)
+  (define return #f)
+  (define resume #f)
+  (define (walk lst)
+    (if (null? lst)
+        (return 'done)
+        (begin
+          (call/cc
+            (lambda (next)
+              (set! resume next)
+              (return (car lst))))
+          (walk (cdr lst)))))
+  (lambda ()
+    (call/cc
+      (lambda (r)
+        (set! return r)
+        (if resume
+            (resume #f)
+            (walk lst))))))
+
+(define (range a b acc)
+  (if (< b a)
+      acc
+      (range a (- b 1) (cons b acc))))
+
+(define (sum-gen gen acc)
+  (let ((x (gen)))
+    (if (eq? x 'done)
+        acc
+        (sum-gen gen (+ acc x)))))
+
+(sum-gen (make-gen (range 1 3000 '())) 0)
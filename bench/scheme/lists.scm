@@ -0,0 +1,25 @@
+; List construction and traversal with let and do loops.
+(define (iota n)
+  (do ((i (- n 1) (- i 1))
+       (acc '() (cons i acc)))
+      ((< i 0) acc)))
+
+(define (sum-iter lst acc)
+  (if (null? lst)
+      acc
+      (sum-iter (cdr lst) (+ acc (car lst)))))
+
+(define (sum lst)
+  (sum-iter lst 0))
+
+(define (rev lst)
+  (do ((lst lst (cdr lst))
+       (acc '() (cons (car lst) acc)))
+      ((null? lst) acc)))
+
+(define (repeat n)
+  (do ((i 0 (+ i 1))
+       (total 0 (+ total (sum (rev (iota 200))))))
+      ((= i n) total)))
+
+(repeat 50)
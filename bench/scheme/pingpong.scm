@@ -0,0 +1,26 @@
+; Coroutine ping-pong: two loops passing control to each other with
+; call/cc, each transfer captures a continuation and resumes the other.
+(define ping-k #f)
+(define pong-k #f)
+(define hits 0)
+
+(define (pong-loop v)
+  (set! hits (+ hits v))
+  (pong-loop (call/cc
+               (lambda (k)
+                 (set! pong-k k)
+                 (ping-k v)))))
+
+(define (ping n)
+  (if (= n 0)
+      hits
+      (begin
+        (call/cc
+          (lambda (k)
+            (set! ping-k k)
+            (if pong-k
+                (pong-k 1)
+                (pong-loop 1))))
+        (ping (- n 1)))))
+
+(ping 3000)
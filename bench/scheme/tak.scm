@@ -0,0 +1,9 @@
+; Takeuchi function: deep non-tail recursion with three arguments.
+(define (tak x y z)
+  (if (not (< y x))
+      z
+      (tak (tak (- x 1) y z)
+           (tak (- y 1) z x)
+           (tak (- z 1) x y))))
+
+(tak 18 12 6)
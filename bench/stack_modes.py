@@ -0,0 +1,52 @@
+# Compare the speed of call heavy programs with a value stack per context
+# and with one value stack shared by all the contexts. Usage:
+#
+#   python bench/stack_modes.py [-r REPEAT] [file.scm ...]
+#
+# Each program is run under both engines in both modes, the best time of
+# REPEAT runs is reported. By default fib, ack and tak in bench/scheme are
+# run.
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from skime.vm import VM
+
+SCHEME_DIR = os.path.join(os.path.dirname(__file__), 'scheme')
+PROGRAMS = ['fib.scm', 'ack.scm', 'tak.scm']
+
+def best_time(path, engine, shared_stack, repeat):
+    vm = VM(engine=engine, shared_stack=shared_stack)
+    times = []
+    result = None
+    for i in range(repeat):
+        start = time.time()
+        result = vm.load(path)
+        times.append(time.time()-start)
+    return min(times), result
+
+def main(argv):
+    parser = OptionParser(usage="%prog [-r REPEAT] [file.scm ...]")
+    parser.add_option('-r', '--repeat', type='int', default=3,
+                      help="the number of runs of each program")
+    options, files = parser.parse_args(argv)
+    if not files:
+        files = [os.path.join(SCHEME_DIR, name) for name in PROGRAMS]
+
+    print '%-10s %-10s %10s %10s %8s' % ('program', 'engine', 'list', 'shared',
+                                         'ratio')
+    for path in files:
+        for engine in ['table', 'threaded']:
+            t_list, r_list = best_time(path, engine, False, options.repeat)
+            t_shared, r_shared = best_time(path, engine, True, options.repeat)
+            assert r_list == r_shared
+            print '%-10s %-10s %9.3fs %9.3fs %8.2f' % \
+                  (os.path.basename(path), engine, t_list, t_shared,
+                   t_shared/t_list)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
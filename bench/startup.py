@@ -0,0 +1,82 @@
+# Measure the time of getting a VM with a library loaded. Usage:
+#
+#   python bench/startup.py [-r REPEAT] [-n PROCEDURES] [file.scm ...]
+#
+# The library is the given files, or else a generated one defining
+# PROCEDURES procedures. The VM is made by:
+#  - VM() and loading the library without the bytecode cache
+#  - VM() and loading the library from the bytecode cache
+#  - VM(image=...) from a snapshot of a VM with the library loaded
+#  - VM(image=...) from an image saved to a file and loaded again
+# The best time of REPEAT runs is reported.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from skime.vm    import VM
+from skime.image import load_image
+
+PROCEDURE = """
+(define (proc-%d lst acc)
+  (if (null? lst)
+      (let ((avg (/ acc 2)))
+        (list acc avg))
+      (proc-%d (cdr lst) (+ acc (car lst)))))
+"""
+
+def best_time(make, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        make()
+        times.append(time.time()-start)
+    return min(times)
+
+def main(argv):
+    parser = OptionParser(usage="%prog [-r REPEAT] [-n PROCEDURES] [file.scm ...]")
+    parser.add_option('-r', '--repeat', type='int', default=10,
+                      help="the number of runs of each way")
+    parser.add_option('-n', '--procedures', type='int', default=200,
+                      help="the number of procedures of the generated library")
+    options, files = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        if not files:
+            path = os.path.join(tmp, 'library.scm')
+            io = open(path, 'w')
+            for i in range(options.procedures):
+                io.write(PROCEDURE % (i, i))
+            io.close()
+            files = [path]
+        cache_dir = os.path.join(tmp, 'cache')
+
+        def make_vm(cache_dir):
+            vm = VM(cache_dir=cache_dir)
+            for path in files:
+                vm.load(path)
+            return vm
+        image = make_vm(None).snapshot()
+        image_path = os.path.join(tmp, 'library.img')
+        image.save(image_path)
+        saved = load_image(image_path)
+        # fill the cache
+        make_vm(cache_dir)
+
+        for name, make in [('VM()', lambda: VM(cache_dir=None)),
+                           ('compile', lambda: make_vm(None)),
+                           ('cache', lambda: make_vm(cache_dir)),
+                           ('snapshot', lambda: VM(image=image)),
+                           ('image file', lambda: VM(image=saved))]:
+            print '%-12s %9.3fms' % (name, best_time(make, options.repeat)*1000)
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,116 @@
+# Run tail-recursive loops through each kind of tail position under a
+# memory cap. Usage:
+#
+#   python bench/tail_calls.py [-n ITERATIONS] [-m MEGABYTES] [-e ENGINE] [-s]
+#
+# Each loop is run in a child process whose address space is limited to
+# MEGABYTES, so a loop whose contexts grow with the iterations fails with
+# a MemoryError (or a RuntimeError when it nests the Python stack) instead
+# of taking the machine down. The time and the peak resident memory of
+# each run are reported, the memory should be the same for all the loops
+# and not grow with ITERATIONS.
+
+import os
+import sys
+import time
+import resource
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from skime.vm import VM
+
+LOOPS = [
+    ('if', """
+(define (loop n) (if (= n 0) 'done (loop (- n 1))))"""),
+    ('cond', """
+(define (loop n)
+  (cond ((= n 0) 'done)
+        ((odd? n) (loop (- n 1)))
+        (else (loop (- n 1)))))"""),
+    ('cond =>', """
+(define (loop n)
+  (cond ((= n 0) 'done)
+        ((- n 1) => loop)))"""),
+    ('and', """
+(define (loop n) (and #t (if (= n 0) 'done (loop (- n 1)))))"""),
+    ('or', """
+(define (loop n) (or (= n -1) (if (= n 0) 'done (loop (- n 1)))))"""),
+    ('when', """
+(define-syntax my-when
+  (syntax-rules () ((_ test e ...) (if test (begin e ...) #f))))
+(define (loop n) (if (= n 0) 'done (my-when #t (loop (- n 1)))))"""),
+    ('let', """
+(define (loop n) (let ((m (- n 1))) (if (< m 0) 'done (loop m))))"""),
+    ('mutual', """
+(define (ping n) 'done)
+(define (loop n) (if (= n 0) 'done (ping (- n 1))))
+(define (ping n) (loop n))"""),
+    ('apply', """
+(define (loop n) (if (= n 0) 'done (apply loop (list (- n 1)))))"""),
+    ('call/cc', """
+(define (loop n) (if (= n 0) 'done (call/cc (lambda (k) (loop (- n 1))))))"""),
+    ('call/1cc', """
+(define (loop n) (if (= n 0) 'done (call/1cc (lambda (k) (loop (- n 1))))))"""),
+    ('event loop', """
+(define (handle event state)
+  (cond ((eq? event 'inc) (+ state 1))
+        ((eq? event 'dec) (- state 1))
+        (else state)))
+(define (loop n)
+  (let ((state (handle (if (odd? n) 'inc 'dec) n)))
+    (or (and (= n 0) 'done)
+        (call/cc (lambda (k) (apply loop (list (- n 1))))))))"""),
+]
+
+def run(source, n, options):
+    vm = VM(engine=options.engine, shared_stack=options.shared_stack)
+    vm.eval_string('(begin %s)' % source)
+    start = time.time()
+    result = vm.eval_string('(loop %d)' % n)
+    assert str(result) == 'done', result
+    return time.time()-start
+
+def run_child(source, n, options):
+    """\
+    Run the loop in a child process under the memory cap. Return the
+    time or the error, and the peak resident memory in kilobytes.
+    """
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        cap = options.megabytes * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (cap, cap))
+        try:
+            msg = '%.3fs' % run(source, n, options)
+        except BaseException, e:
+            msg = e.__class__.__name__
+        os.write(wfd, msg)
+        os._exit(0)
+    os.close(wfd)
+    msg = os.read(rfd, 1024)
+    os.close(rfd)
+    pid, status, usage = os.wait4(pid, 0)
+    if not msg:
+        msg = 'killed'
+    return msg, usage.ru_maxrss
+
+def main(argv):
+    parser = OptionParser(usage="%prog [-n ITERATIONS] [-m MEGABYTES] [-e ENGINE] [-s]")
+    parser.add_option('-n', '--iterations', type='int', default=1000000,
+                      help="the number of iterations of each loop")
+    parser.add_option('-m', '--megabytes', type='int', default=512,
+                      help="the cap on the address space of each run")
+    parser.add_option('-e', '--engine', default='table',
+                      help="the engine to run the loops with")
+    parser.add_option('-s', '--shared-stack', action='store_true', default=False,
+                      help="run with the value stack shared by the contexts")
+    options, args = parser.parse_args(argv)
+
+    for name, source in LOOPS:
+        msg, rss = run_child(source, options.iterations, options)
+        print '%-12s %12s %8.1fMB' % (name, msg, rss/1024.0)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
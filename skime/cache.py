@@ -0,0 +1,325 @@
+# The forms compiled from the files loaded by VM.load are cached on disk,
+# so that a VM loading the same files again (e.g. scheme/prim.scm, which is
+# loaded by every VM) doesn't parse and compile them.
+#
+# A cache file is a sequence of pickles, one for each top level form of
+# the source file with the macros defined while compiling it, ended by
+# None. Its name is a hash of everything the compiled code depends on:
+# the source, the instruction set, the source and the optimization
+# settings of the compiler, and the global variables the compiler consults (macros,
+# primitives, and procedures that can be inlined). The VM, its global
+# environment and the cells of the global variables are not pickled, they
+# are referred to by name and looked up in the VM loading the form.
+#
+# The forms are run one by one as they are compiled or read, like VM.load
+# does without the cache. A form is only read after the forms before it
+# are run, so that the procedures they define are found.
+
+import os
+import hashlib
+import tempfile
+import cPickle as pickle
+
+from .iset              import ISET_VERSION
+from .ctx               import is_threaded
+from .env               import GlobalEnvironment, Cell
+from .proc              import Procedure
+from .prim              import PyPrimitive
+from .macro             import Macro
+
+from .compiler.parser   import Reader
+from .compiler          import compiler as compiler_module, builder, analysis
+from .                  import macro
+
+# The version of the layout of the cache files
+FORMAT = 5
+
+def source_digest(modules):
+    "Hash the source files of the modules."
+    digest = hashlib.sha1()
+    for module in modules:
+        path = module.__file__
+        if path.endswith(('.pyc', '.pyo')) and os.path.exists(path[:-1]):
+            path = path[:-1]
+        io = open(path, 'rb')
+        try:
+            digest.update(io.read())
+        finally:
+            io.close()
+    return digest.hexdigest()
+
+# The forms compiled by another version of the compiler are outdated
+COMPILER_VERSION = source_digest([compiler_module, builder, analysis,
+                                  macro])
+
+class BytecodeCache(object):
+    "The cache of compiled forms in a directory."
+    def __init__(self, directory):
+        self.directory = directory
+
+    def load(self, vm, path):
+        """\
+        Load a file into vm, reading the forms from the cache if there,
+        or else compiling and caching them. Return the value of the last
+        form.
+        """
+        cache_path = os.path.join(self.directory, self.key(vm, path) + '.skc')
+        count, result, done = self.read(vm, cache_path)
+        if done:
+            return result
+
+        io = open(path)
+        try:
+            reader = Reader(io, path)
+            if count > 0:
+                # The cache file is broken after the forms already run,
+                # the rest of the source is just compiled
+                for i in range(count):
+                    reader.next()
+                writer = None
+            else:
+                writer = Writer(self.directory, vm)
+            try:
+                for expr in reader:
+                    form = self.compile(vm, expr, reader.positions, path,
+                                        writer)
+                    if writer is not None and not writer.write(form):
+                        writer = None
+                    result = vm.run(form)
+            except:
+                if writer is not None:
+                    writer.abort()
+                raise
+        finally:
+            io.close()
+        if writer is not None:
+            writer.commit(cache_path)
+        return result
+
+    def compile(self, vm, expr, positions, path, writer):
+        "Compile expr, telling writer the macros it defines."
+        if writer is None:
+            return vm.compiler.compile(expr, vm.env, positions, path)
+        env = vm.env
+        before = [cell.value for cell in env.cells]
+        form = vm.compiler.compile(expr, env, positions, path)
+        # the macros are defined at compile time
+        macros = []
+        for idx in range(len(env.cells)):
+            val = env.cells[idx].value
+            if isinstance(val, Macro) and \
+                   (idx >= len(before) or before[idx] is not val):
+                macros.append((env.locals_name[idx], val))
+        writer.macros = macros
+        return form
+
+    def key(self, vm, path):
+        "Hash the source file and what compiling it depends on."
+        compiler = vm.compiler
+        digest = hashlib.sha1()
+        # The path is in the code, for the tracebacks
+        digest.update('%d %s %s %d %d %s\n' % (FORMAT, ISET_VERSION,
+                                               COMPILER_VERSION,
+                                               compiler.optimize,
+                                               compiler.inline_budget,
+                                               os.path.abspath(path)))
+        env = vm.env
+        # The cells are created in another order when loading forms
+        # from the cache
+        lines = []
+        for idx in range(len(env.cells)):
+            name = env.locals_name[idx]
+            val = env.cells[idx].value
+            if isinstance(val, Macro):
+                token = 'macro %s' % val.source
+            elif isinstance(val, PyPrimitive):
+                token = 'primitive %s.%s' % (val.proc.__module__,
+                                             val.proc.__name__)
+            elif isinstance(val, Procedure) and \
+                     isinstance(val.lexical_parent, GlobalEnvironment) and \
+                     compiler.inlinable(val.code, str(name)):
+                token = 'procedure %s' % val.code.source
+            else:
+                token = ''
+            lines.append('%s %s\n' % (name, token))
+        lines.sort()
+        digest.update(''.join(lines))
+
+        io = open(path, 'rb')
+        try:
+            while True:
+                chunk = io.read(65536)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        finally:
+            io.close()
+        return digest.hexdigest()
+
+    def read(self, vm, path):
+        """\
+        Run the forms in a cache file, defining the macros defined while
+        compiling each one before running it. Return (count, result,
+        done): the number of forms run, the value of the last one, and
+        whether the whole file is read. Nothing is read if the file
+        doesn't exist, and only the forms before the error if it is
+        broken.
+        """
+        env = vm.env
+        # A procedure inlined in a form is only valid if the global
+        # variable still holds a procedure of the same source, or else
+        # the guard of the inlined code must always fail
+        stale = object()
+        inlined = {}
+
+        def persistent_load(pid):
+            kind, sep, name = pid.partition(' ')
+            if kind == 'vm':
+                return vm
+            if kind == 'env':
+                return env
+            if kind == 'threaded':
+                return None
+            if kind == 'cell':
+                return env.get_cell(env.alloc_local(name))
+            if kind == 'prim':
+                # the guard of a folded call, the primitives are
+                # in the key
+                prim = env.read_local(env.alloc_local(name))
+                if isinstance(prim, PyPrimitive):
+                    return prim
+                return stale
+            proc = env.read_local(env.alloc_local(name))
+            if isinstance(proc, Procedure):
+                inlined[name] = proc
+                return proc
+            return stale
+
+        try:
+            io = open(path, 'rb')
+        except EnvironmentError:
+            return (0, None, False)
+        count = 0
+        result = None
+        try:
+            unpickler = pickle.Unpickler(io)
+            unpickler.persistent_load = persistent_load
+            while True:
+                inlined.clear()
+                # the forms are pickled separately
+                unpickler.memo = {}
+                try:
+                    record = unpickler.load()
+                except Exception:
+                    # a broken or outdated file is compiled again
+                    return (count, result, False)
+                if record is None:
+                    return (count, result, True)
+
+                form, macros, sources = record
+                for name, proc in inlined.items():
+                    if str(proc.code.source) != sources.get(name):
+                        self.replace_literal(form, proc, stale)
+                for name, macro in macros:
+                    env.alloc_local(name, macro)
+                result = vm.run(form)
+                count += 1
+        finally:
+            io.close()
+
+    def replace_literal(self, form, old, new):
+        "Replace a literal of form, shared by the code in it."
+        for i in range(len(form.literals)):
+            if form.literals[i] is old:
+                form.literals[i] = new
+
+class Writer(object):
+    """\
+    Write a cache file. It is written to a temporary file renamed at
+    last, so that the VMs loading the file concurrently never see a
+    partial file. Errors are ignored, the file is given up and the source
+    is just not cached.
+    """
+    def __init__(self, directory, vm):
+        self.vm = vm
+        # The macros defined while compiling the next form
+        self.macros = []
+        # The sources of the procedures inlined in the form written, by
+        # the names of the global variables
+        self.sources = {}
+        self.io = None
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, self.path = tempfile.mkstemp(dir=directory)
+        except EnvironmentError:
+            return
+        self.io = os.fdopen(fd, 'wb')
+        self.pickler = pickle.Pickler(self.io, pickle.HIGHEST_PROTOCOL)
+        self.pickler.persistent_id = self.persistent_id
+
+    def persistent_id(self, obj):
+        vm = self.vm
+        env = vm.env
+        if obj is vm:
+            return 'vm'
+        if obj is env:
+            return 'env'
+        if is_threaded(obj):
+            # made again when unpickled
+            return 'threaded'
+        if isinstance(obj, Cell):
+            # the cells of the aliases inserted by macros are not named
+            idx = env.locals_map.get(obj.name)
+            if idx is not None and env.cells[idx] is obj:
+                return 'cell %s' % obj.name
+            return None
+        if isinstance(obj, Procedure):
+            for idx in range(len(env.cells)):
+                name = env.locals_name[idx]
+                if env.cells[idx].value is obj and isinstance(name, basestring):
+                    self.sources[name] = str(obj.code.source)
+                    return 'proc %s' % name
+        if isinstance(obj, PyPrimitive):
+            for idx in range(len(env.cells)):
+                name = env.locals_name[idx]
+                if env.cells[idx].value is obj and isinstance(name, basestring):
+                    return 'prim %s' % name
+        return None
+
+    def write(self, form):
+        "Write a form. Return False if the file is given up."
+        if self.io is None:
+            return False
+        self.sources = {}
+        try:
+            self.pickler.dump((form, self.macros, self.sources))
+            self.pickler.clear_memo()
+            return True
+        except (EnvironmentError, pickle.PicklingError, TypeError,
+                RuntimeError):
+            # e.g. unpicklable literals, or nesting too deep
+            self.abort()
+            return False
+
+    def commit(self, path):
+        "End the file and move it to path."
+        if self.io is None:
+            return
+        try:
+            self.pickler.dump(None)
+            self.io.close()
+            os.rename(self.path, path)
+        except EnvironmentError:
+            self.abort()
+
+    def abort(self):
+        "Give up the file."
+        if self.io is None:
+            return
+        try:
+            self.io.close()
+            os.remove(self.path)
+        except EnvironmentError:
+            pass
+        self.io = None
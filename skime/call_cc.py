@@ -1,11 +1,58 @@
 from .errors import WrongArgNumber
+from .errors import MiscError
+
+class Expiry(object):
+    """\
+    Shared by the one-shot continuations whose calls return to the same
+    context, see Context.returned_to.
+    """
+    __slots__ = ['expired']
+
+    def __init__(self):
+        self.expired = False
 
 class Continuation(object):
-    def __init__(self, ctx, ip_displacement, n_pop):
-        self.ctx = ctx.clone()
+    """\
+    A continuation captures the current context. The parent contexts are
+    not copied, but marked shared, so that they are copied when returned
+    to (see Context.unshare).
+
+    A one-shot continuation (made by call/1cc) can only be invoked once.
+    The parent contexts are not marked shared (but see
+    StackContext.capture), and the captured context is resumed without
+    copying. Invoking it after the call/1cc has
+    returned is not allowed either: the context the call returns to
+    expires the continuation when returned to.
+    """
+    def __init__(self, ctx, ip_displacement, n_pop, one_shot=False, tail=False):
+        self.ctx = ctx.capture(one_shot)
         self.ctx.ip += ip_displacement
         if n_pop > 0:
             self.ctx.pop_n(n_pop)
 
+        self.one_shot = one_shot
+        if one_shot:
+            # A tail call returns to the parent
+            if tail:
+                ctx = ctx.parent
+            if ctx.one_shot is None:
+                ctx.one_shot = Expiry()
+            self.expiry = ctx.one_shot
+
+    def resume(self, ctx):
+        """\
+        Get the context to continue running when the continuation is
+        invoked from ctx.
+        """
+        if not self.one_shot:
+            return self.ctx.resume(ctx)
+        if self.ctx is None:
+            raise MiscError("One-shot continuation can only be invoked once")
+        if self.expiry.expired:
+            raise MiscError("One-shot continuation can't be invoked after call/1cc has returned")
+        nctx = self.ctx.resume(ctx, copy=False)
+        self.ctx = None
+        return nctx
+
     def __str__(self):
         return '<Continuation ctx=%s>' % self.ctx
@@ -0,0 +1,437 @@
+from ..types.symbol import Symbol as sym
+from ..types.pair   import Pair as pair
+from ..macro        import Macro, SymbolClosure
+from ..prim         import PyPrimitive
+
+from ..errors       import SyntaxError
+
+class Binding(object):
+    """\
+    What the analysis finds out about a variable.
+
+    attributes are:
+     - name: the name of the variable, or the alias if it is inserted
+       by a macro.
+     - form: the kind of binding form, e.g. 'lambda', 'let', 'define'.
+     - expression: the binding form.
+     - level: the number of lambdas the binding form is nested in.
+     - captured: referenced or assigned in a lambda nested in the scope.
+     - mutated: assigned by set!.
+     - escaping: the variable might outlive the frame where it is bound,
+       because it is captured by a closure that is not called in place,
+       or a continuation might be captured in its scope: by call/cc, or
+       by any procedure called there but the primitives.
+     - reasons: the expressions making the above true, for debugging.
+    """
+    def __init__(self, name, form, expression, level):
+        self.name = name
+        self.form = form
+        self.expression = expression
+        self.level = level
+        self.captured = False
+        self.mutated = False
+        self.escaping = False
+        self.reasons = []
+
+    def needs_environment(self):
+        """\
+        An escaping variable needs an environment of its own, created
+        each time its scope is entered. Others can be kept in the frame
+        of the enclosing procedure.
+        """
+        return self.escaping
+
+    def note(self, reason):
+        if reason not in self.reasons:
+            self.reasons.append(reason)
+
+    def __str__(self):
+        facts = [fact for fact in ['captured', 'mutated', 'escaping']
+                 if getattr(self, fact)]
+        res = '%s (%s): %s' % (self.name, self.form, ', '.join(facts) or 'local')
+        for reason in self.reasons:
+            res += '\n    %s' % reason
+        return res
+
+class LambdaInfo(object):
+    """\
+    What the analysis finds out about a lambda expression.
+
+    attributes are:
+     - expression: the lambda expression.
+     - free: the names of the non-global variables referenced in the
+       lambda and bound outside of it, in the order of first reference.
+     - escaping: whether the closure is not only called in place.
+    """
+    def __init__(self, expression, escaping):
+        self.expression = expression
+        self.escaping = escaping
+        self.free = []
+
+    def __str__(self):
+        return '%s: free (%s)%s' % (self.expression,
+                                    ' '.join([str(x) for x in self.free]),
+                                    self.escaping and ', escaping' or '')
+
+class Analysis(object):
+    "The result of analyzing an expression, see Analyzer."
+    def __init__(self):
+        self.bindings = []
+        self.lambdas = []
+        # The let, let*, letrec and do forms walked
+        self.forms = []
+
+    def bindings_of(self, form):
+        "Get the Bindings made by the binding form."
+        return [b for b in self.bindings if b.expression is form]
+
+    def in_frame(self):
+        """\
+        Get the forms walked and whether none of their variables need
+        an environment, as a list of (form, in_frame).
+        """
+        escaping = set()
+        for b in self.bindings:
+            if b.needs_environment():
+                escaping.add(id(b.expression))
+        return [(form, id(form) not in escaping) for form in self.forms]
+
+    def report(self):
+        "Describe all the bindings and lambdas, for debugging."
+        return '\n'.join([str(x) for x in self.bindings + self.lambdas])
+
+class Analyzer(object):
+    """\
+    Find out which variables are captured by inner lambdas, mutated by
+    set! or escaping, and the free variables of each lambda. Macro uses
+    are expanded the same way as the compiler does, so the analysis
+    applies to the code that is actually compiled.
+
+    Only the variables bound in the analyzed expression are tracked.
+    """
+    # The special forms walked like calls, see calls_primitive
+    keywords = ['if', 'begin', 'or', 'and']
+
+    def __init__(self, compiler, env):
+        self.compiler = compiler
+        # The environment where the expression is compiled, used to
+        # find macros
+        self.env = env
+
+        self.result = Analysis()
+        # The stack of scopes, each is a (key => Binding or Macro)
+        # dict. The first one holds the variables defined in env.
+        self.scopes = [{}]
+        # The stack of LambdaInfo of the lambdas being analyzed
+        self.lambdas = []
+
+    def analyze(self, expr):
+        self.walk(expr)
+        return self.result
+
+    ########################################
+    # Scopes
+    ########################################
+    def push_scope(self):
+        self.scopes.append({})
+
+    def pop_scope(self):
+        self.scopes.pop()
+
+    def bind(self, name, form, expression):
+        try:
+            key = self.compiler.binding_key(name)
+        except SyntaxError:
+            return
+        binding = Binding(key, form, expression, len(self.lambdas))
+        self.scopes[-1][key] = binding
+        self.result.bindings.append(binding)
+
+    def lookup(self, key):
+        for scope in reversed(self.scopes):
+            binding = scope.get(key)
+            if binding is not None:
+                return binding
+        return None
+
+    def get_macro(self, name):
+        binding = self.lookup(self.compiler.binding_key(name))
+        if binding is None:
+            return self.compiler.get_macro(self.env, name)
+        if isinstance(binding, Macro):
+            return binding
+        return None
+
+    def reference(self, name, expr, mutate=False):
+        key = self.compiler.binding_key(name)
+        binding = self.lookup(key)
+        if isinstance(binding, Macro):
+            return
+        if binding is None:
+            loc = self.env.lookup_location(key)
+            if loc is None or loc.env.parent is None:
+                return  # global or unbound
+            level = 0
+        else:
+            level = binding.level
+            if mutate:
+                binding.mutated = True
+                binding.note('assigned by %s' % expr)
+
+        for info in self.lambdas[level:]:
+            if key not in info.free:
+                info.free.append(key)
+        if binding is None or level == len(self.lambdas):
+            return
+
+        binding.captured = True
+        binding.note('captured by %s' % self.lambdas[level].expression)
+        for info in self.lambdas[level:]:
+            if info.escaping:
+                binding.escaping = True
+                binding.note('escaping with the closure of %s' % info.expression)
+                break
+
+    def calls_primitive(self, expr):
+        """\
+        Whether a call of expr is a special form, or calls the primitive
+        held by a global variable. These don't capture continuations,
+        any other procedure might, e.g. by calling call/cc itself.
+        """
+        if not isinstance(expr, (sym, SymbolClosure)):
+            return False
+        head = self.compiler.keyword(expr)
+        if isinstance(head, sym) and head.name in Analyzer.keywords:
+            return True
+        key = self.compiler.binding_key(expr)
+        if self.lookup(key) is not None:
+            return False
+        loc = self.env.lookup_location(key)
+        if loc is None or loc.env.parent is not None:
+            return False
+        # map and the like call procedures
+        return type(loc.env.read_local(loc.idx)) is PyPrimitive
+
+    def call(self, proc, expr):
+        "expr calls proc, which might capture a continuation."
+        if not self.calls_primitive(proc):
+            self.escape_all('a continuation might be captured by %s' % expr)
+
+    def escape_all(self, reason):
+        "All the visible variables escape, e.g. with a continuation."
+        for scope in self.scopes:
+            for binding in scope.values():
+                if isinstance(binding, Binding):
+                    binding.escaping = True
+                    binding.note(reason)
+
+    ########################################
+    # Walking expressions
+    ########################################
+    def walk_body(self, body):
+        while isinstance(body, pair):
+            self.walk(body.first)
+            body = body.rest
+
+    def walk(self, expr):
+        comp = self.compiler
+        if isinstance(expr, (sym, SymbolClosure)):
+            self.reference(expr, expr)
+            return
+        if not isinstance(expr, pair):
+            return
+
+        head = comp.keyword(expr.first)
+        handler = None
+        if isinstance(head, sym):
+            handler = self.handlers.get(head.name)
+        if handler is not None:
+            handler(self, expr)
+            return
+
+        if isinstance(expr.first, (sym, SymbolClosure)):
+            macro = self.get_macro(expr.first)
+            if macro is not None:
+                try:
+                    expansion = macro.transform(self.env, expr)[0]
+                except SyntaxError:
+                    self.escape_all('%s can not be expanded' % expr)
+                    return
+                self.walk(expansion)
+                return
+
+        # a lambda called in place doesn't escape
+        if isinstance(expr.first, pair) and \
+               comp.keyword(expr.first.first) == comp.sym_lambda:
+            self.walk_lambda(expr.first, escaping=False)
+        else:
+            self.call(expr.first, expr)
+            self.walk(expr.first)
+        self.walk_body(expr.rest)
+
+    def walk_lambda(self, expr, escaping=True):
+        if not isinstance(expr.rest, pair):
+            return
+        info = LambdaInfo(expr, escaping)
+        self.result.lambdas.append(info)
+        self.lambdas.append(info)
+        self.push_scope()
+
+        arglst = expr.rest.first
+        while isinstance(arglst, pair):
+            self.bind(arglst.first, 'lambda', expr)
+            arglst = arglst.rest
+        if arglst is not None:
+            self.bind(arglst, 'lambda', expr)
+        self.walk_body(expr.rest.rest)
+
+        self.pop_scope()
+        self.lambdas.pop()
+
+    def walk_quote(self, expr):
+        pass
+
+    def walk_define(self, expr):
+        if not isinstance(expr.rest, pair):
+            return
+        var = expr.rest.first
+        if isinstance(var, pair):
+            # (define (name . args) body ...)
+            self.bind(var.first, 'define', expr)
+            self.walk_lambda(pair(self.compiler.sym_lambda,
+                                  pair(var.rest, expr.rest.rest)))
+        else:
+            self.bind(var, 'define', expr)
+            self.walk_body(expr.rest.rest)
+
+    def walk_set_x(self, expr):
+        if not isinstance(expr.rest, pair):
+            return
+        var = expr.rest.first
+        if isinstance(var, (sym, SymbolClosure)):
+            self.reference(var, expr, mutate=True)
+        self.walk_body(expr.rest.rest)
+
+    def bindings(self, expr):
+        "Get the list of (name, init) of a binding list."
+        res = []
+        while isinstance(expr, pair):
+            binding = expr.first
+            if isinstance(binding, pair) and isinstance(binding.rest, pair):
+                res.append((binding.first, binding.rest.first))
+            expr = expr.rest
+        return res
+
+    def walk_let(self, expr):
+        if not isinstance(expr.rest, pair):
+            return
+        self.result.forms.append(expr)
+        bindings = self.bindings(expr.rest.first)
+        for name, init in bindings:
+            self.walk(init)
+        self.push_scope()
+        for name, init in bindings:
+            self.bind(name, 'let', expr)
+        self.walk_body(expr.rest.rest)
+        self.pop_scope()
+
+    def walk_letstar(self, expr):
+        if not isinstance(expr.rest, pair):
+            return
+        self.result.forms.append(expr)
+        bindings = self.bindings(expr.rest.first)
+        for name, init in bindings:
+            self.walk(init)
+            self.push_scope()
+            self.bind(name, 'let*', expr)
+        self.walk_body(expr.rest.rest)
+        for i in range(len(bindings)):
+            self.pop_scope()
+
+    def walk_letrec(self, expr):
+        if not isinstance(expr.rest, pair):
+            return
+        self.result.forms.append(expr)
+        bindings = self.bindings(expr.rest.first)
+        self.push_scope()
+        for name, init in bindings:
+            self.bind(name, 'letrec', expr)
+        for name, init in bindings:
+            self.walk(init)
+        self.walk_body(expr.rest.rest)
+        self.pop_scope()
+
+    def walk_do(self, expr):
+        if not isinstance(expr.rest, pair):
+            return
+        self.result.forms.append(expr)
+        specs = self.bindings(expr.rest.first)
+        for spec in specs:
+            self.walk(spec[1])
+        self.push_scope()
+        for spec in specs:
+            self.bind(spec[0], 'do', expr)
+        # the steps
+        spec = expr.rest.first
+        while isinstance(spec, pair):
+            if isinstance(spec.first, pair) and isinstance(spec.first.rest, pair):
+                self.walk_body(spec.first.rest.rest)
+            spec = spec.rest
+        # the test, the result and the body
+        if isinstance(expr.rest.rest, pair):
+            self.walk_body(expr.rest.rest.first)
+            self.walk_body(expr.rest.rest.rest)
+        self.pop_scope()
+
+    def walk_cond(self, expr):
+        clauses = expr.rest
+        while isinstance(clauses, pair):
+            clause = clauses.first
+            if isinstance(clause, pair):
+                if self.compiler.keyword(clause.first) != sym('else'):
+                    self.walk(clause.first)
+                body = clause.rest
+                if isinstance(body, pair) and \
+                       self.compiler.keyword(body.first) == sym('=>'):
+                    # the value of the test is passed to a procedure
+                    if isinstance(body.rest, pair):
+                        self.call(body.rest.first, clause)
+                        self.walk(body.rest.first)
+                else:
+                    self.walk_body(body)
+            clauses = clauses.rest
+
+    def walk_call_cc(self, expr):
+        self.escape_all('a continuation is captured by %s' % expr)
+        self.walk_body(expr.rest)
+
+    def walk_define_syntax(self, expr):
+        # The symbols inserted by the macro are not resolved where the
+        # macro is defined here, so they are not tracked
+        self.escape_all('%s is not analyzed' % expr)
+        if not isinstance(expr.rest, pair) or \
+               not isinstance(expr.rest.rest, pair) or \
+               not isinstance(expr.rest.rest.first, pair):
+            return
+        try:
+            key = self.compiler.binding_key(expr.rest.first)
+            macro = Macro(self.env, expr.rest.rest.first.rest)
+        except SyntaxError:
+            return
+        self.scopes[-1][key] = macro
+
+    handlers = {
+        'lambda' : lambda self, expr: self.walk_lambda(expr),
+        'quote' : walk_quote,
+        'define' : walk_define,
+        'set!' : walk_set_x,
+        'let' : walk_let,
+        'let*' : walk_letstar,
+        'letrec' : walk_letrec,
+        'do' : walk_do,
+        'cond' : walk_cond,
+        'call/cc' : walk_call_cc,
+        'call-with-current-continuation' : walk_call_cc,
+        'call/1cc' : walk_call_cc,
+        'define-syntax' : walk_define_syntax
+        }
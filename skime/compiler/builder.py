@@ -1,18 +1,60 @@
 from array    import array
 
-from ..iset   import INSN_MAP
+from ..iset   import INSN_MAP, INSTRUCTIONS, SUPERINSTRUCTIONS
+from ..insns  import thread_bytecode
 from ..form   import Form
-from ..proc   import Procedure
-from ..env    import Environment
+from ..proc   import Code
+from ..env    import Environment, GlobalEnvironment, Scope, Cell
+from ..prim   import PyPrimitive
 from ..errors import UnboundVariable
 
+class LiteralPool(object):
+    """\
+    The literals of a form, shared by the procedures in it. The numbers,
+    strings and booleans are found by value, but 42 and 42.0 are
+    different literals. The other literals, e.g. symbols, quoted lists
+    and cells, are found by identity.
+    """
+    atoms = (int, long, float, complex, bool, str, unicode)
+
+    def __init__(self):
+        self.literals = []
+        # The index of each literal by its key, see key
+        self.indexes = {}
+
+    def key(self, lit):
+        t = type(lit)
+        if t in LiteralPool.atoms:
+            return (t, lit)
+        return id(lit)
+
+    def index(self, lit):
+        """\
+        Return the index of the literal in the pool if there. Or else
+        append it to the pool.
+        """
+        key = self.key(lit)
+        idx = self.indexes.get(key)
+        if idx is None:
+            idx = self.indexes[key] = len(self.literals)
+            self.literals.append(lit)
+        return idx
+
+    def reserve(self):
+        "Append a slot for a literal to be set later. Return its index."
+        self.literals.append(None)
+        return len(self.literals)-1
+
 class Builder(object):
     "Builder is a helper of building the bytecode for a form."
-    def __init__(self, env, result_t=Form):
+    def __init__(self, env, result_t=Form, optimize=0, pool=None,
+                 filename=None, line=None):
         # The lexical environment where the form is compiled
         self.env = env
         # The type of the generate result
         self.result_t = result_t
+        # The optimization level, see Compiler
+        self.optimize = optimize
 
         # The instruction stream
         self.stream = []
@@ -20,11 +62,35 @@ class Builder(object):
         self.ip = 0
         # The lable name => ip mapping
         self.labels = {}
-        # The literals
-        self.literals = []
+        # The literals, shared by the builders of the procedures in
+        # the form
+        if pool is None:
+            pool = LiteralPool()
+        self.pool = pool
+        self.literals = pool.literals
+        # Whether the next instruction can be run. It can't after
+        # an unconditional jump until a label is defined.
+        self.reachable = True
+
+        # The file the code is read from, or None
+        self.filename = filename
+        # The line the code starts at, and the line of the instructions
+        # emitted next, or None
+        self.first_line = line
+        self.line = None
+        # The line numbers of the instructions: the ips where the line
+        # changes, each followed by the new line number
+        self.lines = []
+        if line is not None:
+            self.set_line(line)
 
     def emit(self, insn_name, *args):
-        "Emit an instruction"
+        """\
+        Emit an instruction. When optimizing, the instructions that
+        can't be run are dropped.
+        """
+        if not self.reachable:
+            return
         insn = INSN_MAP.get(insn_name)
         if insn is None:
             raise TypeError, "No such instruction: %s" % insn_name
@@ -55,30 +121,61 @@ class Builder(object):
 
         self.stream.append((insn_name, args))
         self.ip += len(args)+1
+        if self.optimize and insn_name in ['goto', 'ret', 'tail_call']:
+            self.reachable = False
 
     def def_local(self, name):
         "Define a local variable."
         return self.env.alloc_local(name)
 
+    def push_scope(self):
+        """\
+        Enter a new Scope. The variables defined until pop_scope are
+        kept in the frame of the procedure being built. The scope can
+        only be pushed when building a procedure, see can_push_scope.
+        """
+        self.env = Scope(self.env)
+        return self.env
+
+    def pop_scope(self):
+        "Leave the Scope entered by push_scope."
+        self.env = self.env.parent
+
+    def can_push_scope(self):
+        """\
+        Whether the builder is building a procedure. The toplevel forms
+        are run in the Environment of the VM, whose slots live forever.
+        """
+        return self.result_t is Code
+
+    def set_line(self, line):
+        "The instructions emitted next are from line."
+        if line == self.line:
+            return
+        self.line = line
+        if self.lines and self.lines[-2] == self.ip:
+            self.lines[-1] = line
+        else:
+            self.lines.extend((self.ip, line))
+
     def def_label(self, name):
         "Define a label at current ip."
         if self.labels.get(name) is not None:
             raise TypeError, "Duplicated label: %s" % name
         self.labels[name] = self.ip
+        self.reachable = True
 
-    def emit_local(self, action, name, dyn_env=None):
+    def emit_local(self, action, name):
         """\
         Emit an instruction to push or set local variable. The local variable
         is automatically searched in the current context and parents.
+        A global variable is accessed through its Cell.
         """
-        if dyn_env is None:
-            env = self.env
-            dyn = ""
-        else:
-            env = dyn_env
-            dyn = "dynamic_"
-
-        depth, idx = self.find_local_depth(name, env)
+        cell = self.find_global(name)
+        if cell is not None:
+            self.emit('%s_global' % action, cell)
+            return
+        depth, idx = self.find_local_depth(name, self.env)
         if depth is None:
             raise UnboundVariable(name, "Unbound variable %s" % name)
         if depth == 0:
@@ -87,16 +184,31 @@ class Builder(object):
         else:
             postfix = '_depth'
             args = (depth, idx)
-        self.emit('%s%s_local%s' % (dyn, action, postfix), *args)
+        self.emit('%s_local%s' % (action, postfix), *args)
 
-    def push_proc(self, args=[], rest_arg=False, parent_env=None):
+    def find_primitive(self, name, func):
+        """\
+        Find the global variable holding the primitive implemented by the
+        Python function func. Return (cell,) of the variable, or None if
+        name is not bound to it or is shadowed by a local variable.
+        """
+        cell = self.find_global(name)
+        if cell is None:
+            return None
+        val = cell.value
+        if not isinstance(val, PyPrimitive) or val.proc is not func:
+            return None
+        return (cell,)
+
+    def push_proc(self, args=[], rest_arg=False, parent_env=None, source=None):
         """\
         Return a builder for building a procedure. The returned builder
         is used to build the body of the procedure.
 
         Later when self.generate is called, builder.generate will be called
-        automatically to get the procedure object, add it to the literals
-        and push to the operand stack.
+        automatically to get the code object and add it to the literals. A
+        make_closure instruction is emitted to create a procedure from the
+        code at run time and push it to the operand stack.
         """
         if parent_env is None:
             parent_env = self.env
@@ -106,29 +218,38 @@ class Builder(object):
         for x in args:
             env.alloc_local(x)
 
-        bdr = Builder(env, result_t=Procedure)
+        bdr = Builder(env, result_t=Code, optimize=self.optimize,
+                      pool=self.pool, filename=self.filename, line=self.line)
         # Those properties are recorded in the builder and used
         # to construct the procedure later
         bdr.args = args
         bdr.rest_arg = rest_arg
+        # The lambda expression (args . body) if built from one
+        bdr.source = source
+        # The name of the variable defined as the procedure, if any
+        bdr.name = None
 
         # generate_proc is a pseudo instruction
-        self.stream.append(('generate_proc', bdr))
-        self.ip += 3 # push_literal + fix_lexical (2+1)
+        if self.reachable:
+            self.stream.append(('generate_proc', bdr))
+            self.ip += 2 # make_closure
         
         return bdr
 
     def generate(self):
         """\
-        Generate a form with emitted instructions.
+        Generate a form with emitted instructions. Sequences of
+        instructions are fused into superinstructions, and the bytecode is
+        also pre-decoded into threaded code for the threaded engine.
         """
         bc = array('i')
         for insn_name, args in self.stream:
             # pseudo instructions
             if insn_name == 'generate_proc':
-                idx = len(self.literals)
-                self.literals.append(args.generate())
-                bc.append(INSN_MAP['push_literal'].opcode)
+                # the literals of the procedure are added after it
+                idx = self.pool.reserve()
+                self.literals[idx] = args.generate()
+                bc.append(INSN_MAP['make_closure'].opcode)
                 bc.append(idx)
             # real instructions
             else:
@@ -137,43 +258,85 @@ class Builder(object):
                 
                 if insn_name in ['goto', 'goto_if_false', 'goto_if_not_false']:
                     bc.append(self.labels[args[0]])
+                elif insn_name == 'goto_if_rebound':
+                    cell, proc, label = args
+                    bc.append(self.get_literal_idx(cell))
+                    bc.append(self.get_literal_idx(proc))
+                    bc.append(self.labels[label])
                 elif insn_name == 'push_literal':
                     bc.append(self.get_literal_idx(args[0]))
                 else:
                     for x in args:
+                        if isinstance(x, Cell):
+                            x = self.get_literal_idx(x)
                         bc.append(x)
 
-        return self.result_t(self, bc)
+        self.fuse_superinstructions(bc)
+
+        result = self.result_t(self, bc)
+        result.threaded = thread_bytecode(bc)
+        return result
 
         
     ########################################
     # Helpers used internally
     ########################################
+    def fuse_superinstructions(self, bc):
+        """\
+        Peephole pass rewriting sequences of instructions into
+        superinstructions. Only the opcode of the first instruction of a
+        sequence is replaced, the others are left in place. So labels
+        pointing into the middle of a sequence are still valid.
+        """
+        if not SUPERINSTRUCTIONS:
+            return
+        longest = max([len(seq) for seq in SUPERINSTRUCTIONS])
+
+        starts = []
+        ip = 0
+        while ip < len(bc):
+            starts.append(ip)
+            ip += INSTRUCTIONS[bc[ip]].length
+
+        opcodes = [bc[ip] for ip in starts]
+        for i in range(len(starts)):
+            for n in range(min(longest, len(starts)-i), 1, -1):
+                fused = SUPERINSTRUCTIONS.get(tuple(opcodes[i:i+n]))
+                if fused is not None:
+                    bc[starts[i]] = fused
+                    break
+
     def find_local_depth(self, name, env):
         """\
         Find the depth and index of a local variable. If no variable
         with the given name is found, return (None, None).
         """
+        loc = env.lookup_location(name)
+        if loc is None:
+            return (None, None)
+        # A symbol inserted by a macro might be found where the macro
+        # is defined, which is always an ancestor of env. The scopes
+        # are in the same frame as their parents.
         depth = 0
-        while env is not None:
-            idx = env.find_local(name)
-            if idx is not None:
-                return (depth, idx)
-            depth += 1
+        while env is not loc.env:
+            if not isinstance(env, Scope):
+                depth += 1
             env = env.parent
-        return (None, None)
+        return (depth, loc.idx)
+
+    def find_global(self, name):
+        """\
+        Get the Cell of the global variable with the given name. Return
+        None if there is no such variable or it is shadowed.
+        """
+        loc = self.env.lookup_location(name)
+        if loc is None or not isinstance(loc.env, GlobalEnvironment):
+            return None
+        return loc.env.get_cell(loc.idx)
 
     def get_literal_idx(self, lit):
         """\
         Return the index in literals list if there. Or else append
         the literal to the literals list.
         """
-        for i in range(len(self.literals)):
-            # make sure type is the same so that 42 and 42.0 will be
-            # different literals
-            l = self.literals[i]
-            if type(l) is type(lit) and \
-               l == lit:
-                return i
-        self.literals.append(lit)
-        return len(self.literals)-1
+        return self.pool.index(lit)
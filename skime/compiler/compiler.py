@@ -2,13 +2,18 @@ from types          import NoneType
                       
 from ..types.symbol import Symbol as sym
 from ..types.pair   import Pair as pair
-from ..macro        import Macro, DynamicClosure, SymbolClosure
+from ..types.vector import Vector
+from ..macro        import Macro, SymbolClosure, Renamer
 from ..form         import Form
+from ..proc         import Procedure
+from ..env          import GlobalEnvironment
+from ..             import prim
                      
 from ..errors       import CompileError
 from ..errors       import SyntaxError
 
 from .builder       import Builder
+from .analysis      import Analyzer
 
 class Compiler(object):
     """\
@@ -32,35 +37,219 @@ class Compiler(object):
     sym_cond = sym("cond")
     sym_call_cc = sym("call/cc")
     sym_call_cc2 = sym("call-with-current-continuation")
+    sym_call_1cc = sym("call/1cc")
+
+    # Calls of these primitives with the given number of arguments are
+    # compiled into dedicated instructions:
+    #   name => (argc, instruction, Python function of the primitive)
+    inline_primitives = {
+        '+' : (2, 'add2', prim.plus),
+        '-' : (2, 'sub2', prim.minus),
+        '*' : (2, 'mul2', prim.mul),
+        '<' : (2, 'lt2', prim.less),
+        '>' : (2, 'gt2', prim.more),
+        '<=' : (2, 'le2', prim.less_equal),
+        '>=' : (2, 'ge2', prim.more_equal),
+        '=' : (2, 'num_eq2', prim.equal),
+        'car' : (1, 'car', prim.prim_first),
+        'first' : (1, 'car', prim.prim_first),
+        'cdr' : (1, 'cdr', prim.prim_rest),
+        'rest' : (1, 'cdr', prim.prim_rest),
+        'cons' : (2, 'cons', prim.prim_pair),
+        'pair' : (2, 'cons', prim.prim_pair),
+        'null?' : (1, 'null_p', prim.prim_null_p),
+        'not' : (1, 'not', prim.prim_not),
+        'eq?' : (2, 'eq_p', prim.prim_eqv),
+        'eqv?' : (2, 'eq_p', prim.prim_eqv),
+        'vector-ref' : (2, 'vector_ref', prim.prim_vector_ref),
+        'vector-set!' : (3, 'vector_set', prim.prim_vector_set_x)
+        }
     
-    def __init__(self):
+    # Calls of these primitives on constant arguments are computed at
+    # compile time when optimizing. Their results only depend on the
+    # arguments and are never mutable objects.
+    pure_primitives = [prim.plus, prim.minus, prim.mul, prim.div,
+                       prim.equal, prim.less, prim.more, prim.less_equal,
+                       prim.more_equal, prim.prim_positive_p,
+                       prim.prim_negative_p, prim.prim_odd_p,
+                       prim.prim_even_p, prim.prim_zero_p, prim.prim_max,
+                       prim.prim_min, prim.prim_quotient,
+                       prim.prim_remainder, prim.prim_modulo, prim.prim_gcd,
+                       prim.prim_lcm, prim.prim_floor, prim.prim_ceiling,
+                       prim.prim_truncate, prim.prim_round, prim.prim_abs,
+                       prim.prim_exp, prim.prim_log, prim.prim_sin,
+                       prim.prim_cos, prim.prim_tan, prim.prim_asin,
+                       prim.prim_acos, prim.prim_atan, prim.prim_sqrt,
+                       prim.prim_expt, prim.prim_exact_p,
+                       prim.prim_inexact_p, prim.prim_not, prim.prim_null_p,
+                       prim.prim_eqv, prim.prim_equal]
+
+    # The maximum number of bits of the integers, or of characters of
+    # the strings, taken and given by the calls folded
+    fold_limit = 256
+
+    # The symbols whose presence in the body of a procedure prevents
+    # inlining it, see inlinable
+    inline_barriers = [sym_lambda, sym_define, sym_set_x, sym_define_syntax,
+                       sym_call_cc, sym_call_cc2, sym_call_1cc]
+
+    def __init__(self, optimize=2, inline_budget=30):
         self.label_seed = 0
+        # The optimization level:
+        #   0: no optimization
+        #   1: fold constants, prune constant conditionals and drop
+        #      unreachable instructions. The folded calls are guarded
+        #      by goto_if_rebound, see generate_folded.
+        #   2: also inline the calls of small global procedures and
+        #      of lambda expressions, see generate_inline_call.
+        self.optimize = optimize
+        # The maximum size of the body of an inlined procedure, in
+        # number of pairs and atoms. The bodies inlined into it are
+        # charged to the same budget.
+        self.inline_budget = inline_budget
+        # The Code of the procedures being inlined, they are not
+        # inlined again in their own bodies
+        self.inlining = []
+        # What is left of the budget of the outermost inlined call
+        # being compiled, or None
+        self.inline_left = None
+
+        # The positions of the lists compiled, and the file they are
+        # read from, see compile
+        self.positions = {}
+        self.filename = None
+        # The (line, column) of the innermost list being compiled
+        self.location = None
+        # The names of the variables defined or set! in the sexp being
+        # compiled, see compile
+        self.assigned = set()
+        # The binding forms analyzed, see in_frame
+        self.frames = {}
+
+    def compile(self, sexp, env, positions=None, filename=None):
+        """\
+        Compile sexp into a Form. positions are the (line, column) of
+        the lists in sexp, read from filename, by their ids (see
+        Parser.positions). The code gets the line numbers, and the
+        compile errors the location where they happen.
+        """
+        outer = (self.positions, self.filename, self.location,
+                 self.assigned, self.inline_left, self.frames)
+        self.positions = positions or {}
+        self.filename = filename
+        self.location = None
+        self.inline_left = None
+        self.frames = {}
+        # the calls of the variables changed by sexp itself are never
+        # folded, the guards would always fail
+        self.assigned = self.assigned_names(sexp)
+        try:
+            bdr = Builder(env, optimize=self.optimize, filename=filename)
 
-    def compile(self, sexp, env):
-        bdr = Builder(env)
-
-        self.generate_expr(bdr, sexp, keep=True, tail=False)
+            self.generate_expr(bdr, sexp, keep=True, tail=False)
 
-        form = bdr.generate()
+            form = bdr.generate()
+        except CompileError, e:
+            self.locate(e)
+            raise
+        finally:
+            (self.positions, self.filename, self.location,
+             self.assigned, self.inline_left, self.frames) = outer
         return form
 
+    def locate(self, error):
+        "Add the location where a compile error happens to its message."
+        if self.location is None or getattr(error, 'location', None):
+            return
+        line, column = self.location
+        error.location = (self.filename, line, column)
+        if error.args and isinstance(error.args[0], basestring):
+            error.args = ('%s:%d:%d %s' % (self.filename, line, column,
+                                           error.args[0]),) + error.args[1:]
+
+    def analyze(self, sexp, env):
+        """\
+        Analyze the bindings and lambdas of sexp, see Analyzer. This is
+        used in debugging, e.g. to find out why a let is compiled into
+        a procedure call:
+
+          print compiler.analyze(parse(code), vm.env).report()
+        """
+        return Analyzer(self, env).analyze(sexp)
+
     ########################################
     # Helper functions
     ########################################
-    def calc_env_distance(self, ancestor, descendant):
-        "Calculate the distance between ancestor and descendant."
-        dist = 0
-        while descendant != ancestor:
-            if descendant is None:
-                raise SyntaxError("Attempt calculate the distance between unrelated environments.")
-            dist += 1
-            descendant = descendant.parent
-        return dist
-        
+    def keyword(self, expr):
+        """\
+        Get the symbol of an alias inserted by a macro, so that the
+        keywords of special forms (if, else, => etc.) in macro templates
+        are recognized.
+        """
+        while isinstance(expr, SymbolClosure):
+            expr = expr.expression
+        return expr
+
+    def binding_key(self, expr):
+        """\
+        Get the key of a variable in the environment: the name of a
+        symbol, or the alias itself if the symbol is inserted by a macro.
+        """
+        if isinstance(expr, sym):
+            return expr.name
+        if isinstance(expr, SymbolClosure):
+            return expr
+        raise SyntaxError("Expecting symbol, but got %s" % expr)
+
+    def strip_syntax(self, expr):
+        """\
+        Replace the aliases in a quoted datum with the symbols. The
+        datum is only copied if it has aliases.
+        """
+        if isinstance(expr, SymbolClosure):
+            return self.keyword(expr)
+        if isinstance(expr, pair):
+            first = self.strip_syntax(expr.first)
+            rest = self.strip_syntax(expr.rest)
+            if first is expr.first and rest is expr.rest:
+                return expr
+            return pair(first, rest)
+        return expr
+
+    def in_frame(self, bdr, form):
+        """\
+        Whether the variables bound by the let, let*, letrec or do form
+        can be kept in the frame of the enclosing procedure, instead of
+        compiling the body into a procedure and calling it. A variable
+        kept in a frame is shared by all the closures and continuations
+        made while the frame is alive, so it must not escape. E.g. a
+        continuation captured in the body of a let in a loop would see
+        the values of the later iterations, so the variables escape
+        when a procedure which might capture one is called in their
+        scope (see Analyzer.calls_primitive).
+
+        The binding forms nested in form are analyzed along with it,
+        the results are kept in frames by the ids of the bodies of the
+        forms (the compiler makes the forms again from them) so that
+        each one is analyzed once.
+        """
+        if not bdr.can_push_scope():
+            return False
+        entry = self.frames.get(id(form.rest))
+        if entry is None or entry[0] is not form.rest:
+            analysis = Analyzer(self, bdr.env).analyze(form)
+            # the body is kept alive with its id
+            for x, res in analysis.in_frame():
+                self.frames[id(x.rest)] = (x.rest, res)
+            entry = self.frames.get(id(form.rest))
+            if entry is None or entry[0] is not form.rest:
+                return True
+        return entry[1]
+
     def get_macro(self, env, name):
-        if not isinstance(name, sym):
+        if not isinstance(name, (sym, SymbolClosure)):
             return None
-        loc = env.lookup_location(name.name)
+        loc = env.lookup_location(self.binding_key(name))
         if loc is None:
             return None
         val = loc.env.read_local(loc.idx)
@@ -68,8 +257,178 @@ class Compiler(object):
             return val
         return None
     
+    def assigned_names(self, sexp):
+        """\
+        Get the names of the variables defined or set! anywhere in sexp.
+        Scopes are not looked at, the names shadowed are included too.
+        """
+        names = set()
+        todo = [sexp]
+        while todo:
+            expr = todo.pop()
+            while isinstance(expr, pair):
+                head = self.keyword(expr.first)
+                if isinstance(head, sym) and \
+                       head in (Compiler.sym_define, Compiler.sym_set_x) and \
+                       isinstance(expr.rest, pair):
+                    target = expr.rest.first
+                    # (define (name arg ...) body ...)
+                    if isinstance(target, pair):
+                        target = target.first
+                    target = self.keyword(target)
+                    if isinstance(target, sym):
+                        names.add(target.name)
+                todo.append(expr.first)
+                expr = expr.rest
+        return names
+
+    def constant_value(self, bdr, expr, guards=None):
+        """\
+        Get the value of expr if it is known at compile time, as a
+        tuple (value,). Return None if it isn't or not optimizing.
+        Constants are self-evaluating values and quoted data.
+
+        If guards is a list, the calls of pure primitives on constants
+        are constants too. The global variables might be rebound when
+        the code is run, so (cell, primitive) of each one called is
+        appended to guards, see generate_folded.
+        """
+        if not self.optimize:
+            return None
+        if self.self_evaluating(expr):
+            return (expr,)
+        if not isinstance(expr, pair):
+            return None
+
+        head = expr.first
+        if not isinstance(head, (sym, SymbolClosure)):
+            return None
+        if self.keyword(head) == Compiler.sym_quote:
+            if not isinstance(expr.rest, pair):
+                return None
+            return (self.strip_syntax(expr.rest.first),)
+
+        if guards is None or self.keyword(head).name in self.assigned:
+            return None
+        cell = bdr.find_global(self.binding_key(head))
+        if cell is None or not isinstance(cell.value, prim.PyPrimitive) or \
+               cell.value.proc not in Compiler.pure_primitives:
+            return None
+        args = []
+        arg = expr.rest
+        while isinstance(arg, pair):
+            val = self.constant_value(bdr, arg.first, guards)
+            if val is None:
+                return None
+            args.append(val[0])
+            arg = arg.rest
+        if arg is not None:
+            return None
+        for x in args:
+            if not self.small_atom(x):
+                return None
+        if cell.value.proc is prim.prim_expt and len(args) == 2:
+            base, exponent = args
+            if isinstance(base, (int, long)) and \
+                   isinstance(exponent, (int, long)) and abs(base) > 1 and \
+                   exponent * abs(base).bit_length() > Compiler.fold_limit:
+                return None
+        try:
+            cell.value.check_arity(len(args))
+            val = cell.value.apply(bdr.env.vm, args)
+        except Exception:
+            # the error is raised when the call is run
+            return None
+        if self.small_atom(val):
+            if (cell, cell.value) not in guards:
+                guards.append((cell, cell.value))
+            return (val,)
+        return None
+
+    def small_atom(self, val):
+        """\
+        Whether val is an atom computed with or by a folded call, see
+        fold_limit.
+        """
+        if isinstance(val, (int, long)):
+            return abs(val).bit_length() <= Compiler.fold_limit
+        if isinstance(val, basestring):
+            return len(val) <= Compiler.fold_limit
+        return isinstance(val, (float, complex, NoneType, sym))
+
+    def inlinable(self, code, name):
+        """\
+        Whether the calls of a procedure of the code can be inlined. The
+        body must fit in inline_budget, and not refer to name (the global
+        variable holding the procedure) or the symbols in inline_barriers,
+        so that inlining it doesn't recurse, make closures or change
+        variables. Aliases inserted by macros are not renamed, the bodies
+        having them are not inlined either.
+        """
+        return self.inline_cost(code, name, self.inline_budget) is not None
+
+    def inline_cost(self, code, name, budget):
+        """\
+        Get the size of the body of an inlinable procedure, see
+        inlinable. Return None if it can't be inlined or the size
+        exceeds budget.
+        """
+        if code.source is None or code.fixed_argc != code.argc or \
+               code in self.inlining:
+            return None
+        left = [budget]
+        def small(expr):
+            if isinstance(expr, SymbolClosure):
+                return False
+            if isinstance(expr, sym) and \
+                   (expr.name == name or expr in Compiler.inline_barriers):
+                return False
+            if expr is not None:
+                left[0] -= 1
+                if left[0] < 0:
+                    return False
+            if isinstance(expr, pair):
+                return small(expr.first) and small(expr.rest)
+            return True
+        if not small(code.source.rest):
+            return None
+        return budget - left[0]
+
+    def rename(self, renamer, expr):
+        """\
+        Rename all the symbols in expr to aliases made by renamer. The
+        quoted data are left as they are, so that the same objects are
+        the values of the quote expressions.
+        """
+        if isinstance(expr, sym):
+            return renamer.alias(expr)
+        if isinstance(expr, pair):
+            if expr.first is Compiler.sym_quote:
+                return pair(renamer.alias(expr.first), expr.rest)
+            return pair(self.rename(renamer, expr.first),
+                        self.rename(renamer, expr.rest))
+        return expr
+
+    def list_of(self, expr):
+        "Get the elements of a proper list, or None if expr is not one."
+        res = []
+        while isinstance(expr, pair):
+            res.append(expr.first)
+            expr = expr.rest
+        if expr is not None:
+            return None
+        return res
+
+    def let_bindings(self, names, inits):
+        "Make the binding list of a let."
+        bindings = None
+        for name, init in reversed(zip(names, inits)):
+            bindings = pair(pair(name, pair(init, None)), bindings)
+        return bindings
+
     def self_evaluating(self, expr):
-        for t in [int, long, complex, float, str, unicode, bool, NoneType]:
+        for t in [int, long, complex, float, str, unicode, bool, NoneType,
+                  Vector]:
             if isinstance(expr, t):
                 return True
         return False
@@ -117,7 +476,8 @@ class Compiler(object):
             Compiler.sym_do: self.generate_do,
             Compiler.sym_cond: self.generate_cond,
             Compiler.sym_call_cc: self.generate_call_cc,
-            Compiler.sym_call_cc2: self.generate_call_cc
+            Compiler.sym_call_cc2: self.generate_call_cc,
+            Compiler.sym_call_1cc: self.generate_call_1cc
             }
         if self.self_evaluating(expr):
             if keep:
@@ -125,75 +485,220 @@ class Compiler(object):
                 if tail:
                     bdr.emit('ret')
         
-        elif isinstance(expr, sym):
+        elif isinstance(expr, (sym, SymbolClosure)):
             if keep:
-                bdr.emit_local("push", expr.name)
+                bdr.emit_local("push", self.binding_key(expr))
                 if tail:
                     bdr.emit('ret')
 
         elif isinstance(expr, pair):
-            routine = mapping.get(expr.first)
+            # The instructions are on the line of the innermost list
+            # read from the source
+            outer = self.location
+            location = self.positions.get(id(expr))
+            if location is not None:
+                self.location = location
+                bdr.set_line(location[0])
+
+            routine = mapping.get(self.keyword(expr.first))
             if routine is not None:
                 routine(bdr, expr.rest, keep=keep, tail=tail)
             else:
-                argc = 0
-                macro = self.get_macro(bdr.env, expr.first)
-                transform_env = bdr.env
-                if macro is not None:
-                    expr, dc_list = macro.transform(transform_env, expr)
-
-                    transform_env = macro.lexical_parent
-                    form_bdr = Builder(transform_env)
-                    self.generate_expr(form_bdr, expr, keep=True, tail=False)
-                    macro_closure = DynamicClosure(transform_env, expr)
-                    macro_closure.form = form_bdr.generate()
-                    bdr.emit('push_literal', macro_closure)
-
-                    dist = self.calc_env_distance(macro.lexical_parent, bdr.env)
-                    if dist == 0:
-                        bdr.emit('fix_lexical')
-                    else:
-                        bdr.emit('fix_lexical_depth', dist)
-
-                    # fix lexical parent of dynamic closures
-                    for dc in dc_list:
-                        bdr.emit('push_literal', dc)
-                        bdr.emit('fix_lexical_pop')
-                        form_bdr = Builder(bdr.env)
-                        self.generate_expr(form_bdr, dc.expression, keep=True, tail=False)
-                        dc.form = form_bdr.generate()
-
-                    bdr.emit('dynamic_eval')
-                    if not keep:
-                        bdr.emit('pop')
-                    elif tail:
-                        bdr.emit('ret')
-                        
+                guards = []
+                const = self.constant_value(bdr, expr, guards)
+                if const is not None:
+                    self.generate_folded(bdr, expr, const[0], guards,
+                                         keep=keep, tail=tail)
                 else:
-                    arg  = expr.rest
-                    while isinstance(arg, pair):
-                        self.generate_expr(bdr, arg.first, keep=True, tail=False)
-                        arg = arg.rest
-                        argc += 1
-                    self.generate_expr(bdr, expr.first, keep=True, tail=False)
-                    
-                    if tail:
-                        bdr.emit('tail_call', argc)
-                    else:
-                        bdr.emit('call', argc)
-                        if not keep:
-                            bdr.emit('pop')
+                    self.generate_application(bdr, expr, keep=keep, tail=tail)
 
-        elif isinstance(expr, DynamicClosure):
-            bdr.emit('push_literal', expr)
-            bdr.emit('dynamic_eval')
+            if location is not None:
+                self.location = outer
+                if outer is not None:
+                    bdr.set_line(outer[0])
+
+        else:
+            raise CompileError("Expecting atom or list, but got %s" % expr)
+
+    def generate_application(self, bdr, expr, keep=True, tail=False):
+        "Generate a list which isn't a special form, without folding it."
+        macro = self.get_macro(bdr.env, expr.first)
+        if macro is not None:
+            # The symbols inserted by the macro are renamed to
+            # aliases, so the expansion is compiled in place
+            # like the code written by hand
+            expr = macro.transform(bdr.env, expr)[0]
+            self.generate_expr(bdr, expr, keep=keep, tail=tail)
+        elif self.generate_inline_primitive(bdr, expr, keep=keep, tail=tail):
+            pass
+        elif self.generate_inline_call(bdr, expr, keep=keep, tail=tail):
+            pass
+        elif self.generate_applied_lambda(bdr, expr, keep=keep, tail=tail):
+            pass
+        else:
+            self.generate_call(bdr, expr, keep=keep, tail=tail)
+
+    def generate_folded(self, bdr, expr, value, guards, keep=True, tail=False):
+        """\
+        Generate a call folded by constant_value into value. The value
+        is pushed if the global variables still hold the primitives in
+        guards, or else the call is compiled as usual.
+        """
+        lbl_call = self.next_label()
+        lbl_end = self.next_label()
+        for cell, primitive in guards:
+            bdr.emit('goto_if_rebound', cell, primitive, lbl_call)
+        if keep:
+            bdr.emit('push_literal', value)
+            if tail:
+                bdr.emit('ret')
+        if not tail:
+            bdr.emit('goto', lbl_end)
+        bdr.def_label(lbl_call)
+        self.generate_application(bdr, expr, keep=keep, tail=tail)
+        if not tail:
+            bdr.def_label(lbl_end)
+
+    def generate_call(self, bdr, expr, keep=True, tail=False):
+        "Generate a procedure call."
+        argc = 0
+        arg  = expr.rest
+        while isinstance(arg, pair):
+            self.generate_expr(bdr, arg.first, keep=True, tail=False)
+            arg = arg.rest
+            argc += 1
+        self.generate_expr(bdr, expr.first, keep=True, tail=False)
+
+        if tail:
+            bdr.emit('tail_call', argc)
+        else:
+            bdr.emit('call', argc)
             if not keep:
                 bdr.emit('pop')
-            elif tail:
-                bdr.emit('ret')
-            
+
+    def generate_inline_call(self, bdr, expr, keep=True, tail=False):
+        """\
+        Inline the call of a small procedure held by a global variable,
+        see inlinable. The body is compiled as a let binding the
+        parameters to the arguments. The symbols of the procedure are
+        renamed to aliases resolved in the global environment, so they
+        aren't captured by the local variables at the call site.
+
+        The variable might be changed after the call is compiled, so
+        the inlined body is guarded by goto_if_rebound, falling back to
+        a normal call. Return False if expr is not such a call, or the
+        let can't be kept in the frame (see in_frame).
+
+        The calls in the inlined body and the arguments are inlined
+        within what is left of inline_budget, and not at all in the
+        fallback call, so that the code doesn't grow exponentially with
+        the nesting of the inlined calls.
+        """
+        if self.optimize < 2 or not bdr.can_push_scope():
+            return False
+        head = expr.first
+        if not isinstance(head, (sym, SymbolClosure)):
+            return False
+        cell = bdr.find_global(self.binding_key(head))
+        if cell is None or not isinstance(cell.value, Procedure):
+            return False
+        proc = cell.value
+        args = self.list_of(expr.rest)
+        if args is None or len(args) != proc.code.argc or \
+               not isinstance(proc.lexical_parent, GlobalEnvironment):
+            return False
+        outer = self.inline_left
+        if outer is None:
+            budget = self.inline_budget
         else:
-            raise CompileError("Expecting atom or list, but got %s" % expr)
+            budget = outer
+        cost = self.inline_cost(proc.code, self.keyword(head).name, budget)
+        if cost is None:
+            return False
+
+        source = self.rename(Renamer(proc.lexical_parent), proc.code.source)
+        let = pair(self.let_bindings(self.list_of(source.first), args),
+                   source.rest)
+        # a let made into a closure is slower than the call
+        if not self.in_frame(bdr, pair(Compiler.sym_let, let)):
+            return False
+
+        lbl_call = self.next_label()
+        lbl_end = self.next_label()
+        bdr.emit('goto_if_rebound', cell, proc, lbl_call)
+        self.inlining.append(proc.code)
+        self.inline_left = budget - cost
+        self.generate_let(bdr, let, keep=keep, tail=tail)
+        self.inlining.pop()
+        left = self.inline_left
+        if not tail:
+            bdr.emit('goto', lbl_end)
+        bdr.def_label(lbl_call)
+        self.inline_left = 0
+        self.generate_call(bdr, expr, keep=keep, tail=tail)
+        if outer is None:
+            self.inline_left = None
+        else:
+            self.inline_left = left
+        if not tail:
+            bdr.def_label(lbl_end)
+        return True
+
+    def generate_applied_lambda(self, bdr, expr, keep=True, tail=False):
+        """\
+        Compile ((lambda (var ...) body ...) arg ...) as the let binding
+        the variables to the arguments, so that no procedure is made and
+        called unless the variables escape. Return False if expr is not
+        such a call with the right number of arguments.
+        """
+        if self.optimize < 2:
+            return False
+        lam = expr.first
+        if not isinstance(lam, pair) or not isinstance(lam.rest, pair) or \
+               self.keyword(lam.first) != Compiler.sym_lambda:
+            return False
+        params = self.list_of(lam.rest.first)
+        args = self.list_of(expr.rest)
+        if params is None or args is None or len(params) != len(args):
+            return False
+        self.generate_let(bdr, pair(self.let_bindings(params, args),
+                                    lam.rest.rest),
+                          keep=keep, tail=tail)
+        return True
+
+    def generate_inline_primitive(self, bdr, expr, keep=True, tail=False):
+        """\
+        Generate the dedicated instruction for calling a primitive in
+        inline_primitives. Return False if expr is not such a call.
+        """
+        head = expr.first
+        if not isinstance(head, (sym, SymbolClosure)):
+            return False
+        spec = Compiler.inline_primitives.get(self.keyword(head).name)
+        if spec is None:
+            return False
+        argc, insn, func = spec
+
+        args = []
+        arg = expr.rest
+        while isinstance(arg, pair):
+            args.append(arg.first)
+            arg = arg.rest
+        if arg is not None or len(args) != argc:
+            return False
+
+        loc = bdr.find_primitive(self.binding_key(head), func)
+        if loc is None:
+            return False
+
+        for x in args:
+            self.generate_expr(bdr, x, keep=True, tail=False)
+        bdr.emit(insn, *loc)
+        if not keep:
+            bdr.emit('pop')
+        elif tail:
+            bdr.emit('ret')
+        return True
 
     def generate_if_expr(self, bdr, expr, keep=True, tail=False):
         if expr is None:
@@ -211,22 +716,40 @@ class Compiler(object):
                 raise SyntaxError("Extra expression in 'if'")
             expelse = expelse.first
 
+        test = self.constant_value(bdr, cond)
+        if test is not None:
+            # only the branch taken is compiled
+            if test[0] is False:
+                branch = expelse
+            else:
+                branch = expthen
+            if branch is None:
+                if keep:
+                    bdr.emit('push_nil')
+                    if tail:
+                        bdr.emit('ret')
+            else:
+                self.generate_expr(bdr, branch, keep=keep, tail=tail)
+            return
+
         self.generate_expr(bdr, cond, keep=True, tail=False)
 
+        # The test jumps to the else branch with goto_if_false, which is
+        # fused with the inlined tests (see iset.yml)
         if keep is True:
-            lbl_then = self.next_label()
+            lbl_else = self.next_label()
             lbl_end = self.next_label()
-            bdr.emit('goto_if_not_false', lbl_then)
+            bdr.emit('goto_if_false', lbl_else)
+            self.generate_expr(bdr, expthen, keep=True, tail=tail)
+            if not tail:
+                bdr.emit('goto', lbl_end)
+            bdr.def_label(lbl_else)
             if expelse is None:
                 bdr.emit('push_nil')
                 if tail:
                     bdr.emit('ret')
             else:
                 self.generate_expr(bdr, expelse, keep=True, tail=tail)
-            if not tail:
-                bdr.emit('goto', lbl_end)
-            bdr.def_label(lbl_then)
-            self.generate_expr(bdr, expthen, keep=True, tail=tail)
             bdr.def_label(lbl_end)
         else:
             if expelse is None:
@@ -235,22 +758,15 @@ class Compiler(object):
                 self.generate_expr(bdr, expthen, keep=False, tail=False)
                 bdr.def_label(lbl_end)
             else:
-                lbl_then = self.next_label()
+                lbl_else = self.next_label()
                 lbl_end = self.next_label()
-                bdr.emit('goto_if_not_false', lbl_then)
-                self.generate_expr(bdr, expelse, keep=False, tail=False)
-                bdr.emit('goto', lbl_end)
-                bdr.def_label(lbl_then)
+                bdr.emit('goto_if_false', lbl_else)
                 self.generate_expr(bdr, expthen, keep=False, tail=False)
+                bdr.emit('goto', lbl_end)
+                bdr.def_label(lbl_else)
+                self.generate_expr(bdr, expelse, keep=False, tail=False)
                 bdr.def_label(lbl_end)
 
-    def filter_sc(self, expr):
-        if isinstance(expr, SymbolClosure):
-            return expr.expression
-        elif isinstance(expr, sym):
-            return expr
-        raise SyntaxError("Expecting symbol, but got %s" % expr)
-    
     def generate_lambda(self, base_builder, expr, keep=True, tail=False):
         if keep is not True:
             return  # lambda expression has no side-effect
@@ -261,23 +777,23 @@ class Compiler(object):
             if isinstance(arglst, pair):
                 args = []
                 while isinstance(arglst, pair):
-                    args.append(self.filter_sc(arglst.first).name)
+                    args.append(self.binding_key(arglst.first))
                     arglst = arglst.rest
                 if arglst is None:
                     rest_arg = False
                 else:
-                    args.append(self.filter_sc(arglst).name)
+                    args.append(self.binding_key(arglst))
                     rest_arg = True
             elif arglst is None:
                 rest_arg = False
                 args = []
             else:
                 rest_arg = True
-                args = [self.filter_sc(arglst).name]
+                args = [self.binding_key(arglst)]
 
-            bdr = base_builder.push_proc(args=args, rest_arg=rest_arg)
+            bdr = base_builder.push_proc(args=args, rest_arg=rest_arg,
+                                         source=expr)
             self.generate_body(bdr, body, keep=True, tail=True)
-            base_builder.emit("fix_lexical")
             
             if tail:
                 base_builder.emit('ret')
@@ -292,6 +808,9 @@ class Compiler(object):
                          _||_
                           \/
         ((lambda (var1 var2) expr1 expr2) val1 val2)
+
+        Unless the variables escape (see in_frame),
+        they are kept in the frame of the enclosing procedure instead.
         """
         if not isinstance(expr, pair):
             raise SyntaxError("Invalid let expression")
@@ -305,7 +824,7 @@ class Compiler(object):
                 if not isinstance(binding, pair) or \
                    not isinstance(binding.rest, pair):
                     raise SyntaxError("Invalid binding for let expression: %s" % binding)
-                param.append(self.filter_sc(binding.first).name)
+                param.append(self.binding_key(binding.first))
                 args.append(binding.rest.first)
                 bindings = bindings.rest
         elif bindings is not None:
@@ -314,9 +833,18 @@ class Compiler(object):
         for x in args:
             self.generate_expr(bdr, x, keep=True, tail=False)
 
+        if self.in_frame(bdr, pair(Compiler.sym_let, expr)):
+            bdr.push_scope()
+            for name in param:
+                bdr.def_local(name)
+            for name in reversed(param):
+                bdr.emit_local('set', name)
+            self.generate_body(bdr, expr.rest, keep=keep, tail=tail)
+            bdr.pop_scope()
+            return
+
         lambda_bdr = bdr.push_proc(args=param, rest_arg=False)
         self.generate_body(lambda_bdr, expr.rest, keep=True, tail=True)
-        bdr.emit('fix_lexical')
 
         argc = len(args) 
         if tail:
@@ -333,7 +861,12 @@ class Compiler(object):
         bindings = expr.first
         body = expr.rest
 
-        lambda_bdr = bdr.push_proc()
+        in_frame = self.in_frame(bdr, pair(Compiler.sym_letrec, expr))
+        if in_frame:
+            lambda_bdr = bdr
+            bdr.push_scope()
+        else:
+            lambda_bdr = bdr.push_proc()
 
         # letrec will evaluate the init forms in the new env
         names = []
@@ -342,10 +875,10 @@ class Compiler(object):
         while isinstance(bindings, pair):
             binding = bindings.first
             if not isinstance(binding, pair) or \
-               not isinstance(binding.first, sym) or \
+               not isinstance(binding.first, (sym, SymbolClosure)) or \
                not isinstance(binding.rest, pair):
                 raise SyntaxError("Invalid binding for letrec expression: %s" % binding)
-            name = self.filter_sc(binding.first).name
+            name = self.binding_key(binding.first)
             val = binding.rest.first
             lambda_bdr.def_local(name)
 
@@ -361,8 +894,12 @@ class Compiler(object):
             self.generate_expr(lambda_bdr, vals[i], keep=True, tail=False)
             lambda_bdr.emit_local('set', names[i])
 
+        if in_frame:
+            self.generate_body(bdr, body, keep=keep, tail=tail)
+            bdr.pop_scope()
+            return
+
         self.generate_body(lambda_bdr, body, keep=True, tail=True)
-        bdr.emit('fix_lexical')
 
         if tail:
             bdr.emit('tail_call', 0)
@@ -378,7 +915,11 @@ class Compiler(object):
         bindings = expr.first
         body = expr.rest
 
-        lambda_bdr = bdr.push_proc()
+        in_frame = self.in_frame(bdr, pair(Compiler.sym_letstar, expr))
+        if in_frame:
+            lambda_bdr = bdr
+        else:
+            lambda_bdr = bdr.push_proc()
 
         # let* will evaluate the init forms in the new env sequencially
         names = []
@@ -387,10 +928,10 @@ class Compiler(object):
         while isinstance(bindings, pair):
             binding = bindings.first
             if not isinstance(binding, pair) or \
-               not isinstance(binding.first, sym) or \
+               not isinstance(binding.first, (sym, SymbolClosure)) or \
                not isinstance(binding.rest, pair):
                 raise SyntaxError("Invalid binding for let* expression: %s" % binding)
-            name = self.filter_sc(binding.first).name
+            name = self.binding_key(binding.first)
             val = binding.rest.first
 
             names.append(name)
@@ -401,13 +942,25 @@ class Compiler(object):
         if bindings is not None:
             raise SyntaxError("Invalid bindings for let* expression: %s" % bindings)
 
+        if in_frame:
+            # each variable is in a scope of its own, visible in the
+            # init forms after it
+            for i in range(len(names)):
+                self.generate_expr(bdr, vals[i], keep=True, tail=False)
+                bdr.push_scope()
+                bdr.def_local(names[i])
+                bdr.emit_local('set', names[i])
+            self.generate_body(bdr, body, keep=keep, tail=tail)
+            for i in range(len(names)):
+                bdr.pop_scope()
+            return
+
         for i in range(len(names)):
             lambda_bdr.def_local(names[i])
             self.generate_expr(lambda_bdr, vals[i], keep=True, tail=False)
             lambda_bdr.emit_local('set', names[i])
 
         self.generate_body(lambda_bdr, body, keep=True, tail=True)
-        bdr.emit('fix_lexical')
 
         if tail:
             bdr.emit('tail_call', 0)
@@ -422,15 +975,11 @@ class Compiler(object):
             raise SyntaxError("Empty define expression")
         var = expr.first
 
-        # SymbolClosure now has no effect, only as normal symbol
-        if isinstance(var, SymbolClosure):
-            var = var.expression
-        
         if isinstance(var, pair):
             gen = self.generate_lambda
             val = pair(var.rest, expr.rest)
             var = var.first
-        elif isinstance(var, sym):
+        elif isinstance(var, (sym, SymbolClosure)):
             gen = self.generate_expr
             val = expr.rest
             if val is None:
@@ -443,11 +992,16 @@ class Compiler(object):
 
         # first define local, then generate value. This allow
         # recursive function to be compiled properly.
-        bdr.def_local(var.name)
+        name = self.binding_key(var)
+        bdr.def_local(name)
+        size = len(bdr.stream)
         gen(bdr, val, keep=True, tail=False)
+        # Name the procedure made last, which is the value
+        if len(bdr.stream) > size and bdr.stream[-1][0] == 'generate_proc':
+            bdr.stream[-1][1].name = str(self.strip_syntax(var))
         if keep is True:
             bdr.emit('dup')
-        bdr.emit_local('set', var.name)
+        bdr.emit_local('set', name)
         if tail:
             bdr.emit('ret')
 
@@ -467,11 +1021,8 @@ class Compiler(object):
         if keep:
             bdr.emit('dup')
 
-        if isinstance(var, sym):
-            bdr.emit_local('set', var.name)
-        elif isinstance(var, SymbolClosure):
-            bdr.emit('push_literal', var)
-            bdr.emit_local('set', var.expression.name, var.lexical_parent)
+        if isinstance(var, (sym, SymbolClosure)):
+            bdr.emit_local('set', self.binding_key(var))
         else:
             raise SyntaxError("Invalid set! expression, expecting symbol")
 
@@ -479,85 +1030,98 @@ class Compiler(object):
             bdr.emit('ret')
 
     def generate_quote(self, bdr, expr, keep=True, tail=False):
-        expr = expr.first
-        if isinstance(expr, DynamicClosure):
-            expr = expr.expression
+        expr = self.strip_syntax(expr.first)
         if keep:
             bdr.emit('push_literal', expr)
             if tail:
                 bdr.emit('ret')
 
     def generate_or(self, bdr, expr, keep=True, tail=False):
-        lbl_end = self.next_label()
-        expr_generated = False
-        while isinstance(expr, pair):
-            el = expr.first
-            expr = expr.rest
-            # 'False' literal in 'or' expression can be silently
-            # ignored
-            if el is not False:
-                expr_generated = True
-                self.generate_expr(bdr, el, keep=True, tail=False)
-                if keep:
-                    bdr.emit('dup')
-                bdr.emit('goto_if_not_false', lbl_end)
-                if keep:
-                    if expr is not None:
-                        bdr.emit('pop')
-        if expr is not None:
-            raise SyntaxError("Invalid element in or expression: %s" % expr)
-        if keep:
-            if not expr_generated:
-                bdr.emit('push_false')
-            if tail:
-                bdr.emit('ret')
-                
-        bdr.def_label(lbl_end)
+        self.generate_test_chain(bdr, expr, 'or', keep, tail)
 
     def generate_and(self, bdr, expr, keep=True, tail=False):
-        lbl_end = self.next_label()
-        expr_generated = False
+        self.generate_test_chain(bdr, expr, 'and', keep, tail)
+
+    def generate_test_chain(self, bdr, expr, kind, keep, tail):
+        """\
+        Generate an 'or' or 'and' expression. The value of an element
+        ends it if true (for 'or') or false (for 'and'), the last
+        element is in tail position.
+        """
+        if kind == 'or':
+            stop = 'goto_if_not_false'
+            def ends(val):
+                return val is not False
+        else:
+            stop = 'goto_if_false'
+            def ends(val):
+                return val is False
+
+        # The elements evaluated, and the constant value of the last
+        # one or None
+        elems = []
+        last = None
         while isinstance(expr, pair):
             el = expr.first
             expr = expr.rest
-            # 'True' literal in 'and' expression can be silently
-            # ignored
-            if el is not True:
-                expr_generated = True
-                self.generate_expr(bdr, el, keep=True, tail=False)
-                if keep:
-                    bdr.emit('dup')
-                bdr.emit('goto_if_false', lbl_end)
-                if keep:
-                    if expr is not None:
-                        bdr.emit('pop')
+            const = self.constant_value(bdr, el)
+            if const is not None:
+                if not ends(const[0]) and expr is not None:
+                    # can be silently ignored
+                    continue
+                # the value, the rest is never evaluated
+                last = const
+                expr = None
+                break
+            elems.append(el)
         if expr is not None:
-            raise SyntaxError("Invalid element in or expression: %s" % expr)
-        if keep:
-            if not expr_generated:
-                bdr.emit('push_true')
+            raise SyntaxError("Invalid element in %s expression: %s" % (kind, expr))
+
+        if last is None:
+            if elems:
+                el = elems.pop()
+            else:
+                last = (kind == 'and',)
+
+        lbl_end = self.next_label()
+        for x in elems:
+            self.generate_expr(bdr, x, keep=True, tail=False)
+            if keep:
+                bdr.emit('dup')
+            bdr.emit(stop, lbl_end)
+            if keep:
+                bdr.emit('pop')
+
+        if last is not None:
+            if keep:
+                bdr.emit('push_literal', last[0])
+                if tail:
+                    bdr.emit('ret')
+        else:
+            self.generate_expr(bdr, el, keep=keep, tail=tail)
+        if elems:
+            # the value ending it is left on the stack
+            bdr.def_label(lbl_end)
             if tail:
                 bdr.emit('ret')
-                
-        bdr.def_label(lbl_end)
 
     def generate_define_syntax(self, bdr, expr, keep=True, tail=False):
         if not isinstance(expr, pair):
             raise SyntaxError("Invalid define-syntax expression, expecting macro keyword")
         name = expr.first
-        if not isinstance(name, sym):
+        if not isinstance(name, (sym, SymbolClosure)):
             raise SyntaxError("Expecting macro keyword as a symbol, but got %s" % name)
         expr = expr.rest
         if not isinstance(expr, pair) or \
                not isinstance(expr.first, pair) or \
-               Compiler.sym_syntax_rules != expr.first.first:
+               Compiler.sym_syntax_rules != self.keyword(expr.first.first):
             raise SyntaxError("Expecting syntax-rules, but got %s" % expr.first)
         if expr.rest is not None:
             raise SyntaxError("Extra expressions in define-syntax: %s" % expr.rest)
         
         # define local before constructing the macro, so that recursive macro
         # can be supported
-        idx = bdr.def_local(name.name)
+        idx = bdr.def_local(self.binding_key(name))
         macro = Macro(bdr.env, expr.first.rest)
         bdr.env.assign_local(idx, macro)
 
@@ -572,6 +1136,7 @@ class Compiler(object):
         if not isinstance(expr, pair):
             raise SyntaxError("Invalid do expression")
         init_spec = expr.first
+        in_frame = self.in_frame(bdr, pair(Compiler.sym_do, expr))
 
         expr = expr.rest
         if not isinstance(expr, pair) or \
@@ -590,10 +1155,10 @@ class Compiler(object):
             if not isinstance(spec, pair) or \
                not isinstance(spec.rest, pair):
                 raise SyntaxError("Invalid init spec for do expression: %s" % spec)
-            var = self.filter_sc(spec.first)
-            if not isinstance(var, sym):
+            var = spec.first
+            if not isinstance(var, (sym, SymbolClosure)):
                 raise SyntaxError("Invalid init spec for do expression: %s" % spec)
-            variables.append(var.name)
+            variables.append(self.binding_key(var))
             init_vals.append(spec.rest.first)
 
             if isinstance(spec.rest.rest, pair):
@@ -608,7 +1173,16 @@ class Compiler(object):
         for val in init_vals:
             self.generate_expr(bdr, val, keep=True, tail=False)
 
-        lam_bdr = bdr.push_proc(args=variables, rest_arg=False)
+        if in_frame:
+            # The loop is run in the current frame
+            lam_bdr = bdr
+            bdr.push_scope()
+            for name in variables:
+                bdr.def_local(name)
+            for name in reversed(variables):
+                bdr.emit_local('set', name)
+        else:
+            lam_bdr = bdr.push_proc(args=variables, rest_arg=False)
         lbl_test = self.next_label()
         lbl_end = self.next_label()
 
@@ -626,9 +1200,13 @@ class Compiler(object):
 
         lam_bdr.emit('goto', lbl_test)
         lam_bdr.def_label(lbl_end)
-        self.generate_body(lam_bdr, result_expr, keep=True, tail=True)
 
-        bdr.emit('fix_lexical')
+        if in_frame:
+            self.generate_body(bdr, result_expr, keep=keep, tail=tail)
+            bdr.pop_scope()
+            return
+
+        self.generate_body(lam_bdr, result_expr, keep=True, tail=True)
 
         if tail:
             bdr.emit('tail_call', len(variables))
@@ -643,15 +1221,18 @@ class Compiler(object):
 
         lbl_end = self.next_label()
         lbl_next = self.next_label()
-        first = True
+        # whether the test value is left on the stack when jumping
+        # to the next clause
+        leftover = False
+        has_else = False
 
         while isinstance(expr, pair):
             bdr.def_label(lbl_next)
             lbl_next = self.next_label()
 
-            if not first:
+            if leftover:
                 bdr.emit('pop')
-                first = False
+                leftover = False
             
             cond_expr = expr.first
             if not isinstance(cond_expr, pair):
@@ -661,20 +1242,47 @@ class Compiler(object):
 
             expr = expr.rest
 
-            if pred == sym('else'):
+            const = None
+            if self.keyword(pred) != sym('else'):
+                const = self.constant_value(bdr, pred)
+                if const is not None and const[0] is False:
+                    # the clause is never taken
+                    continue
+
+            if const is not None:
+                # the clause is always taken, the rest are never
+                # reached
+                if isinstance(body, pair) and self.keyword(body.first) == sym('=>'):
+                    if not isinstance(body.rest, pair):
+                        raise SyntaxError("Invalid cond clause, expecting expression after =>")
+                    bdr.emit('push_literal', const[0])
+                    self.generate_expr(bdr, body.rest.first, keep=True, tail=False)
+                    self.emit_call(bdr, 1, tail)
+                elif body is None:
+                    bdr.emit('push_literal', const[0])
+                elif isinstance(body, pair):
+                    self.generate_body(bdr, body, keep=True, tail=tail)
+                else:
+                    raise SyntaxError("Invalid cond clause: %s" % cond_expr)
+                has_else = True
+                expr = None
+                break
+
+            if self.keyword(pred) == sym('else'):
                 if body is None:
-                    bdr.emit('push_true')
+                    bdr.emit('push_nil')
                 else:
                     if not isinstance(body, pair):
                         raise SyntaxError("Invalid cond clause: %s" % cond_expr)
-                    if body.first == sym('=>'):
+                    if self.keyword(body.first) == sym('=>'):
                         if not isinstance(body.rest, pair):
                             raise SyntaxError("Invalid cond clause, expecting expression after =>")
                         bdr.emit('push_true')
                         self.generate_expr(bdr, body.rest.first, keep=True, tail=False)
-                        bdr.emit('call', 1)
+                        self.emit_call(bdr, 1, tail)
                     else:
-                        self.generate_body(bdr, body, keep=True, tail=False)
+                        self.generate_body(bdr, body, keep=True, tail=tail)
+                has_else = True
                 break
             
             else:
@@ -682,26 +1290,31 @@ class Compiler(object):
                 if body is None:
                     bdr.emit('dup')
                     bdr.emit('goto_if_false', lbl_next)
+                    leftover = True
                 else:
                     if not isinstance(body, pair):
                         raise SyntaxError("Invalid cond clause: %s" % cond_expr)
-                    if body.first == sym('=>'):
+                    if self.keyword(body.first) == sym('=>'):
                         if not isinstance(body.rest, pair):
                             raise SyntaxError("Invalid cond clause, expecting expression after =>")
                         bdr.emit('dup')
                         bdr.emit('goto_if_false', lbl_next)
+                        leftover = True
                         self.generate_expr(bdr, body.rest.first, keep=True, tail=False)
-                        bdr.emit('call', 1)
+                        self.emit_call(bdr, 1, tail)
                     else:
                         bdr.emit('goto_if_false', lbl_next)
-                        self.generate_body(bdr, body, keep=True, tail=False)
+                        self.generate_body(bdr, body, keep=True, tail=tail)
                 bdr.emit('goto', lbl_end)
                     
         if expr is not None:
             raise SyntaxError("Extra garbage expression in cond expression: %s" % expr)
         
-        bdr.def_label(lbl_next)
-        bdr.emit('push_nil')
+        if not has_else:
+            bdr.def_label(lbl_next)
+            if leftover:
+                bdr.emit('pop')
+            bdr.emit('push_nil')
         bdr.def_label(lbl_end)
 
         if not keep:
@@ -709,7 +1322,14 @@ class Compiler(object):
         if tail:
             bdr.emit('ret')
 
-    def generate_call_cc(self, bdr, expr, keep=True, tail=False):
+    def emit_call(self, bdr, argc, tail):
+        "Emit the call of a clause of cond, the value is kept."
+        if tail:
+            bdr.emit('tail_call', argc)
+        else:
+            bdr.emit('call', argc)
+
+    def generate_call_cc(self, bdr, expr, keep=True, tail=False, insn='call_cc'):
         if not isinstance(expr, pair):
             raise SyntaxError("Empty call/cc expression")
         if expr.rest is not None:
@@ -717,8 +1337,15 @@ class Compiler(object):
 
         lam = expr.first
         self.generate_expr(bdr, lam, keep=True, tail=False)
-        bdr.emit('call_cc')
         if tail:
+            # the continuation resumes the ret
+            bdr.emit('tail_' + insn)
             bdr.emit('ret')
-        if not keep:
-            bdr.emit('pop')
+        else:
+            bdr.emit(insn)
+            if not keep:
+                bdr.emit('pop')
+
+    def generate_call_1cc(self, bdr, expr, keep=True, tail=False):
+        "call/1cc is call/cc with a one-shot continuation."
+        self.generate_call_cc(bdr, expr, keep=keep, tail=tail, insn='call_1cc')
@@ -1,6 +1,16 @@
-from ..iset import INSTRUCTIONS
+from ..iset import INSTRUCTIONS, INSN_MAP
+from ..env  import Scope
 
 
+def find_line(lines, ip):
+    "Find the line number of ip in a line table, see Builder.lines."
+    line = None
+    for i in range(0, len(lines), 2):
+        if lines[i] > ip:
+            break
+        line = lines[i+1]
+    return line
+
 def disasm(io, form):
     bytecode = form.bytecode
     env = form.env
@@ -11,10 +21,14 @@ def disasm(io, form):
         io.write("%04X " % ip)
         instr = INSTRUCTIONS[bytecode[ip]]
         io.write("%20s " % instr.name)
+        # The other components of a superinstruction are kept in
+        # the bytecode, they are shown as normal instructions
+        if instr.components:
+            instr = INSN_MAP[instr.components[0]]
         if instr.name in ['push_local', 'set_local']:
             io.write('idx: %d' % bytecode[ip+1])
             io.write(', name: ')
-            io.write(env.get_name(bytecode[ip+1]))
+            io.write(str(env.get_name(bytecode[ip+1])))
         elif instr.name in ['push_local_depth', 'set_local_depth']:
             depth = bytecode[ip+1]
             idx = bytecode[ip+2]
@@ -22,19 +36,23 @@ def disasm(io, form):
             penv = env
             while depth > 0:
                 penv = penv.parent
+                if isinstance(penv, Scope):
+                    penv = penv.owner
                 depth -= 1
-            io.write(" (name: %s)" % penv.get_name(idx))
+            io.write(" (name: %s)" % str(penv.get_name(idx)))
         elif instr.name in ['goto', 'goto_if_not_false', 'goto_if_false']:
             io.write("ip=0x%04X" % bytecode[ip+1])
-        elif instr.name == 'dynamic_set_local':
-            lit = bytecode[ip-1]
-            io.write('idx: %d' % bytecode[ip+1])
-            io.write(', name: ')
-            io.write(literals[lit].expression.name)
         else:
-            io.write(', '.join(["%s=%s" % (name, val)
-                                for name, val in zip(instr.operands,
-                                                     bytecode[ip+1:
-                                                              ip+len(instr.operands)+1])]))
+            operands = []
+            for name, val in zip(instr.operands,
+                                 bytecode[ip+1:ip+len(instr.operands)+1]):
+                if name == 'cell':
+                    operands.append("%s=%s (name: %s)" % (name, val,
+                                                          literals[val].name))
+                elif name == 'ip':
+                    operands.append("ip=0x%04X" % val)
+                else:
+                    operands.append("%s=%s" % (name, val))
+            io.write(', '.join(operands))
         io.write('\n')
         ip += instr.length
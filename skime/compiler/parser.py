@@ -1,5 +1,8 @@
+import re
+
 from ..types.symbol import Symbol as sym
 from ..types.pair   import Pair as pair
+from ..types.vector import make_vector
 
 from ..errors import ParseError
 
@@ -7,18 +10,207 @@ def parse(text, name="__unknown__"):
     "Parse a piece of text."
     return Parser(text, name).parse()
 
+class Reader(object):
+    """\
+    Read the top level data of a file object one by one, without holding
+    all the text in memory:
+
+      for expr in Reader(open(path), path):
+          ...
+
+    Without a file object, the text is fed in chunks, e.g. the lines
+    typed in a REPL. Iterating gets the data completed so far:
+
+      reader = Reader()
+      reader.feed('(define x')
+      list(reader)    => []
+      reader.feed(' 1) x')
+      list(reader)    => [(define x 1)]
+      reader.close()  # no more text
+      list(reader)    => [x]
+
+    A datum is only complete when followed by more text, or at the end of
+    the text, as a symbol or number might go on in the next chunk.
+    """
+    def __init__(self, io=None, name="__unknown__", chunk_size=65536):
+        self.io = io
+        self.name = name
+        # The size of the chunks read from io
+        self.chunk_size = chunk_size
+
+        # The text read but not parsed yet starts at pos
+        self.text = ''
+        self.pos = 0
+        # The line number at pos
+        self.line = 1
+        # Whether all the text is read
+        self.eof = False
+        # The column of the start of text
+        self.column = 0
+        # The symbols read, see Parser
+        self.symbols = {}
+        # The positions of the lists of the last datum read, see Parser
+        self.positions = {}
+
+    def feed(self, text):
+        "Add text to read."
+        newline = self.text.rfind('\n', 0, self.pos)
+        if newline >= 0:
+            self.column = self.pos-newline-1
+        else:
+            self.column += self.pos
+        self.text = self.text[self.pos:] + text
+        self.pos = 0
+
+    def close(self):
+        "No more text will be fed."
+        self.eof = True
+
+    def pending(self):
+        "Whether part of a datum is read."
+        parser = self.parser()
+        parser.skip_all()
+        return parser.more()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        "Get the next datum, or raise StopIteration if not read yet."
+        size = self.chunk_size
+        while True:
+            parser = self.parser()
+            try:
+                parser.skip_all()
+                if not parser.more():
+                    self.skip(parser.pos)
+                    if self.eof:
+                        raise StopIteration
+                else:
+                    expr = parser.parse_expr()
+                    if parser.more() or self.eof:
+                        self.pos = parser.pos
+                        self.line = parser.line
+                        self.positions = parser.positions
+                        return expr
+            except ParseError:
+                # Only the errors at the end of the text might be
+                # fixed by more text
+                if parser.more() or self.eof:
+                    raise
+            if not self.fill(size):
+                raise StopIteration
+            # The datum is parsed from the start again, reading more
+            # each time keeps it linear
+            size *= 2
+
+    def parser(self):
+        return Parser(self.text, self.name, self.pos, self.line, self.symbols,
+                      self.column)
+
+    def skip(self, pos):
+        "Skip the whitespace and comments up to pos."
+        # A comment might go on in the next chunk
+        comment = self.text.rfind(';', self.pos, pos)
+        if comment > self.text.rfind('\n', self.pos, pos):
+            pos = comment
+        self.line += self.text.count('\n', self.pos, pos)
+        self.pos = pos
+
+    def fill(self, size):
+        "Read more text from io. Return False if there is no more."
+        if self.io is None or self.eof:
+            return False
+        chunk = self.io.read(size)
+        if chunk:
+            self.feed(chunk)
+        else:
+            self.eof = True
+        return True
+
+# Every token is matched with the whitespace and comments before it, the
+# group matched tells the kind of the token. A comment must go on to the
+# end of the line, or else backtracking would match the rest of it as a
+# token.
+SKIP = r'\s*(?:;[^\n]*(?![^\n])\s*)*'
+TOKEN = re.compile(SKIP + r"""
+    (?:
+        ([^\s'`(),";.\#][^\s'`(),@";]*  # 1 atom
+         | \.[.\d][^\s'`(),@";]*
+         | \#(?!\(|[fs]64\()[^\s'`(),@";]*)
+      | (\))                            # 2 close
+      | (\()                            # 3 open
+      | "((?:[^"\\]|\\.)*)"             # 4 string
+      | ('|`|,@?)                       # 5 quote
+      | (\.)                            # 6 dot
+      | \#((?:f64|s64)?)\(               # 7 vector
+      | (")                             # 8 string not terminated
+    )""", re.VERBOSE | re.DOTALL)
+SKIP = re.compile(SKIP)
+
+NUMBER = re.compile(r"""
+    ([+-]?)(\d+\.?\d*|\.\d+)            # sign and number
+    (?:/(\d+\.?\d*|\.\d+))?             # denominator
+    (?:([+-])(\d+\.?\d*|\.\d+)?i)?      # imaginary part
+    \Z""", re.VERBOSE)
+
+ESCAPE = re.compile(r'\\(.)', re.DOTALL)
+ESCAPES = {
+    '"':'"',
+    '\\':'\\',
+    'n':'\n',
+    't':'\t'
+    }
+
 class Parser(object):
-    "A simple recursive descent parser for Scheme."
+    """\
+    A parser for Scheme. The text is split into tokens by a single
+    regular expression, and the lists are built in a loop rather than by
+    recursion, so deeply nested data are fine.
+    """
     sym_quote = sym("quote")
     sym_quasiquote = sym("quasiquote")
     sym_unquote = sym("unquote")
     sym_unquote_slicing = sym("unquote-slicing")
+    quotes = {
+        "'" : sym_quote,
+        '`' : sym_quasiquote,
+        ',' : sym_unquote,
+        ',@' : sym_unquote_slicing
+        }
+
+    # Marks the dot of a dotted list among the elements read
+    dot = object()
     
-    def __init__(self, text, name="__unknown__"):
+    def __init__(self, text, name="__unknown__", pos=0, line=1,
+                 symbols=None, column=0):
         self.text = text
         self.name = name
-        self.pos = 0
-        self.line = 1
+        self.pos = pos
+        # The column of the start of text, when it is not the start of
+        # a line
+        self.column = column
+        # The (line, column) of the lists read, by their ids. Pairs
+        # can't hold more attributes, and the ids are only valid while
+        # the data read are alive, so the compiler gets the positions
+        # along with the data (see Compiler.compile).
+        self.positions = {}
+        # The symbols read, interning them through Symbol each time is
+        # much slower
+        if symbols is None:
+            symbols = {}
+        self.symbols = symbols
+        # The line number is only counted when asked for, from the
+        # position where it is known
+        self.mark = pos
+        self.mark_line = line
+
+    def get_line(self):
+        "Get the line number at pos."
+        self.mark_line += self.text.count('\n', self.mark, self.pos)
+        self.mark = self.pos
+        return self.mark_line
+    line = property(get_line)
 
     def parse(self):
         "Parse the text and return a sexp."
@@ -28,231 +220,173 @@ class Parser(object):
             self.report_error("Expecting end of code, but more code is got")
         return expr
 
-
     def parse_expr(self):
-        def parse_pound():
-            if self.peak(idx=1) == 't':
-                self.pop(n=2)
+        "Parse a datum from pos."
+        text = self.text
+        match = TOKEN.match
+        dot = Parser.dot
+        pos = self.pos
+        # The lists being read are lists of the elements read, the
+        # quotes waiting for a datum are their symbols
+        stack = []
+        # The positions of the lists being read, or the tags of the
+        # vectors. The line number is counted from the last list read,
+        # which starts at offset last, and the line starts at line_start.
+        starts = []
+        positions = self.positions
+        line = self.line
+        last = pos
+        line_start = text.rfind('\n', 0, pos) + 1
+        if line_start == 0:
+            line_start = -self.column
+        while True:
+            m = match(text, pos)
+            if m is None:
+                self.pos = len(text)
+                if not stack:
+                    raise ParseError("Nothing to be parsed.")
+                if stack[-1].__class__ is list:
+                    self.report_error("Expecting right paren ')'.")
+                self.report_error("Unexpected end of code.")
+            pos = m.end()
+            kind = m.lastindex
+
+            if kind == 1:
+                expr = self.parse_atom(m.group(1), pos)
+            elif kind == 2:
+                if not stack or stack[-1].__class__ is not list:
+                    self.error_at(pos, "Unexpected ')'.")
+                elems = stack.pop()
+                start = starts.pop()
+                if start.__class__ is str:
+                    expr = self.parse_vector(start, elems, pos)
+                else:
+                    expr = None
+                    if elems and elems[-1] is dot:
+                        self.error_at(pos, "Expecting a datum after '.'.")
+                    if len(elems) > 1 and elems[-2] is dot:
+                        expr = elems.pop()
+                        elems.pop()
+                    for x in reversed(elems):
+                        expr = pair(x, expr)
+                    if expr is not None:
+                        positions[id(expr)] = start
+            elif kind == 3:
+                start = m.start(3)
+                newlines = text.count('\n', last, start)
+                if newlines:
+                    line += newlines
+                    line_start = text.rfind('\n', last, start) + 1
+                last = start
+                starts.append((line, start-line_start+1))
+                stack.append([])
+                continue
+            elif kind == 4:
+                expr = m.group(4)
+                if '\\' in expr:
+                    expr = ESCAPE.sub(self.unescape, expr)
+            elif kind == 5:
+                stack.append(Parser.quotes[m.group(5)])
+                continue
+            elif kind == 6:
+                if not stack or stack[-1].__class__ is not list or \
+                       not stack[-1] or dot in stack[-1] or \
+                       starts[-1].__class__ is str:
+                    self.error_at(pos, "Unexpected '.'.")
+                stack[-1].append(dot)
+                continue
+            elif kind == 7:
+                # The elements of a vector are read like a list, its
+                # tag is kept instead of its position
+                stack.append([])
+                starts.append(m.group(7))
+                continue
+            else:
+                self.error_at(len(text), "Expecting '\"' to end a string.")
+
+            # A datum is read, quote it and add it to the list
+            while stack and stack[-1].__class__ is not list:
+                expr = pair(stack.pop(), pair(expr, None))
+            if not stack:
+                self.pos = pos
+                return expr
+            elems = stack[-1]
+            if len(elems) > 1 and elems[-2] is dot:
+                self.error_at(pos, "Expecting right paren ')'.")
+            elems.append(expr)
+
+    def parse_vector(self, tag, elems, pos):
+        "Make the vector of a tag and elements ending at pos."
+        try:
+            return make_vector(tag, elems)
+        except (TypeError, OverflowError):
+            self.error_at(pos, "Invalid element of a #%s vector" % tag)
+
+    def parse_atom(self, token, pos):
+        "Parse a number, a boolean or a symbol ending at pos."
+        ch = token[0]
+        if ch.isdigit() or \
+               (ch in '+-.' and len(token) > 1 and token[1].isdigit()) or \
+               (ch in '+-' and token[1:2] == '.' and token[2:3].isdigit()):
+            if token.isdigit():
+                return int(token)
+            return self.parse_number(token, pos)
+        if ch == '#':
+            if token == '#t':
                 return True
-            if self.peak(idx=1) == 'f':
-                self.pop(n=2)
+            if token == '#f':
                 return False
-            if self.peak(idx=1) == '(':
-                return self.parse_vector()
-        def parse_number_or_symbol():
-            if self.isdigit(self.peak(idx=1)):
-                return self.parse_number()
-            return self.parse_symbol()
-            
-        mapping = {
-            '#' : parse_pound,
-            '(' : self.parse_list,
-            "'" : self.parse_quote,
-            '`' : self.parse_quote,
-            ',' : self.parse_unquote,
-            '+' : parse_number_or_symbol,
-            '-' : parse_number_or_symbol,
-            '"' : self.parse_string
-            }
+            self.error_at(pos, "Unknown syntax %s" % token)
+        res = self.symbols.get(token)
+        if res is None:
+            res = self.symbols[token] = sym(token)
+        return res
 
-        self.skip_all()
+    def parse_number(self, token, pos):
+        m = NUMBER.match(token)
+        if m is None:
+            self.error_at(pos, "Invalid number format %s" % token)
+        sign, num, denom, imag_sign, imag = m.groups()
 
-        if not self.more():
-            raise ParseError("Nothing to be parsed.")
-        ch = self.peak()
-        routine = mapping.get(ch)
-        
-        if routine is not None:
-            return routine()
-        
-        if self.isdigit(ch):
-            return self.parse_number()
-        return self.parse_symbol()
-
-
-    def parse_number(self):
-        sign1 = 1
-        if self.eat('-'):
-            sign1 = -1
-        self.eat('+')
-
-        num1 = self.parse_unum()
-        if self.eat('/'):
-            num2 = self.parse_unum()
-            if num2 is None:
-                self.report_error("Invalid number format, expecting denominator")
-            num1 = float(num1)/num2
-        if self.peak() in ['+', '-']:
-            sign2 = 1
-            if self.eat('-'):
-                sign2 = -1
-            self.eat('+')
-            num2 = self.parse_unum()
-            if num2 is None:
-                num2 = 1
-            if not self.eat('i'):
-                self.report_error("Invalid number format, expecting 'i' for complex")
-            if num2 != 0:
-                num1 = num1 + sign2*num2*1j
-
-        return sign1*num1
-
-    def parse_unum(self):
-        "Parse an unsigned number."
-        isfloat = False
-        pos1 = self.pos
-        while self.isdigit(self.peak()):
-            self.pop()
-        if self.eat('.'):
-            isfloat = True
-        while self.isdigit(self.peak()):
-            self.pop()
-        pos2 = self.pos
-        if pos2 == pos1:
-            return None
-        if isfloat:
-            return float(self.text[pos1:pos2])
-        else:
-            return int(self.text[pos1:pos2])
-
-
-    def parse_list(self):
-        self.eat('(')
-        elems = []
-        while self.more():
-            self.skip_all()
-            if self.peak() == ')':
-                elems.append(None)
-                break
-            if self.peak() == '.' and self.peak(idx=1) != '.':
-                self.eat('.')
-                elems.append(self.parse_expr())
-                self.skip_all()
-                break
-            elems.append(self.parse_expr())
-        if not self.eat(')'):
-            self.report_error("Expecting right paren ')'.")
-        first = elems.pop()
-        for x in reversed(elems):
-            first = pair(x, first)
-        return first
-
-    def parse_quote(self):
-        if self.peak() == '\'':
-            s = Parser.sym_quote
-        else:
-            s = Parser.sym_quasiquote
-        self.pop()
-        return pair(s, pair(self.parse_expr(), None))
-
-    def parse_unquote(self):
-        self.eat(',')
-        if self.eat('@'):
-            return pair(Parser.sym_unquote_slicing,
-                        pair(self.parse_expr(), None))
-        return pair(Parser.sym_unquote,
-                    pair(self.parse_expr(), None))
-
-    def parse_symbol(self):
-        pos1 = self.pos
-        self.pop()
-        while self.more() and \
-              not self.isspace(self.peak()) and \
-              not self.peak() in ['\'', ')', '(', ',', '@']:
-            self.pop()
-        pos2 = self.pos
-        return sym(self.text[pos1:pos2])
-
-    def parse_string(self):
-        mappings = {
-            '"':'"',
-            '\\':'\\',
-            'n':'\n',
-            't':'\t'
-            }
-            
-        self.eat('"')
-        strings = []
-        pos1 = self.pos
-        while self.more():
-            if self.peak() == '"':
-                break
-            if self.peak() == '\\':
-                self.pop()
-                ch = self.peak()
-                if ch in mappings:
-                    strings.append(self.text[pos1:self.pos-1])
-                    strings.append(mappings[ch])
-                    self.pop()
-                    pos1 = self.pos
+        num = self.parse_unum(num)
+        if denom is not None:
+            num = float(num)/self.parse_unum(denom)
+        if imag_sign is not None:
+            if imag is None:
+                imag = 1
             else:
-                if self.peak() == '\n':
-                    self.line += 1
-                self.pop()
-        strings.append(self.text[pos1:self.pos])
-        if not self.eat('"'):
-            report_error("Expecting '\"' to end a string.")
-        return ''.join(strings)
-                
-
-    def parse_vector(self):
-        pass
+                imag = self.parse_unum(imag)
+            if imag != 0:
+                if imag_sign == '-':
+                    imag = -imag
+                num = num + imag*1j
+        if sign == '-':
+            return -num
+        return num
 
-    def skip_all(self):
-        "Skip all non-relevant characters."
-        while True:
-            self.skip_ws()
-            if self.peak() == ';':
-                self.skip_comment()
-            else:
-                break
-
-    def skip_ws(self):
-        "Skip whitespace."
-        while self.more():
-            if self.eat('\n'):
-                self.line += 1
-            elif self.isspace(self.peak()):
-                self.pop()
-            else:
-                break
+    def parse_unum(self, text):
+        "Parse an unsigned number."
+        if '.' in text:
+            return float(text)
+        return int(text)
 
-    def skip_comment(self):
-        "Skip comment."
-        while self.eat(';'):
-            while self.more() and not self.eat('\n'):
-                self.pop()
-            self.line += 1
+    def unescape(self, m):
+        "Get the character escaped in a string."
+        return ESCAPES.get(m.group(1), m.group(0))
 
-    def pop(self, n=1):
-        "Increase self.pos by n."
-        self.pos += n
+    def skip_all(self):
+        "Skip all non-relevant characters."
+        self.pos = SKIP.match(self.text, self.pos).end()
 
     def more(self):
         "Whether we have more content to parse."
         return self.pos < len(self.text)
-            
-    def eat(self, char):
-        "Try to eat a character."
-        if self.peak() != char:
-            return False
-        self.pos += 1
-        return True
-
-    def peak(self, idx=0):
-        "Get the character under self.pos + idx."
-        if self.pos + idx < len(self.text):
-            return self.text[self.pos + idx]
-        return None
-
-    def isdigit(self, ch):
-        "Test whether ch is a digit."
-        return ch is not None and ch.isdigit()
-
-    def isspace(self, ch):
-        "Test whether ch is whitespace."
-        return ch is not None and ch.isspace()
         
+    def error_at(self, pos, msg):
+        "Raise a ParserError with msg at pos."
+        self.pos = pos
+        self.report_error(msg)
+
     def report_error(self, msg):
         "Raise a ParserError with msg."
         raise ParseError("%s:%d %s" % (self.name, self.line, msg))
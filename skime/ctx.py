@@ -1,19 +1,84 @@
 from .prim import load_primitives
 
+# Returned by the halt handler to stop the threaded engine. A halt
+# handler is put after the last instruction of all threaded code.
+HALT = object()
+
+def th_halt(ctx):
+    return HALT
+
+def add_traceback(error, ctx):
+    """\
+    Record the contexts being run when error is raised from ctx, in
+    error.skime_traceback: a list of (form, ip), the innermost first. The
+    engines call it when an error goes through them, the runs nested in
+    a primitive (e.g. by apply) add their contexts first.
+    """
+    traceback = getattr(error, 'skime_traceback', None)
+    if traceback is None:
+        traceback = error.skime_traceback = []
+    ip = ctx.ip
+    while ctx is not None and ctx.form is not None:
+        traceback.append((ctx.form, ip))
+        ctx = ctx.parent
+        if ctx is not None:
+            # The ip of a caller is past the call
+            ip = ctx.ip-1
+
+def format_traceback(error):
+    "Format the skime_traceback of an error like a Python traceback."
+    lines = ['Traceback (most recent call last):']
+    for form, ip in reversed(getattr(error, 'skime_traceback', [])):
+        # Only a Code has a name
+        name = getattr(form, 'name', '<toplevel>') or '<lambda>'
+        line = form.line_of(ip)
+        if line is None:
+            line = '?'
+        lines.append('  File "%s", line %s, in %s' % (form.filename, line, name))
+    lines.append('%s: %s' % (error.__class__.__name__, error))
+    return '\n'.join(lines)
+
+def is_threaded(code):
+    "Whether code is threaded code, which always ends with th_halt."
+    return type(code) is list and len(code) > 0 and code[-1] is th_halt
+
 class Context(object):
     def __init__(self, form, env, parent=None):
         self.form = form
         self.env = env
-        self.vm = env.vm
+        # Frames of procedure calls don't know the VM, only the
+        # Environment of the VM does
+        if parent is not None:
+            self.vm = parent.vm
+        else:
+            self.vm = env.vm
         self.parent = parent
 
         self.ip = 0
         if self.form is not None:
             self.bytecode = form.bytecode
+            self.threaded = form.threaded
         else:
             self.bytecode = []
+            self.threaded = [th_halt]
         self.stack = []
 
+        # A shared context is referred to by continuations, and
+        # must not be changed. See unshare.
+        self.shared = False
+        # The one-shot continuations to expire when the context is
+        # returned to, see returned_to.
+        self.one_shot = None
+
+    def __setstate__(self, state):
+        "The threaded code is not pickled in files, see Image."
+        self.__dict__.update(state)
+        if self.threaded is None:
+            if self.form is not None:
+                self.threaded = self.form.threaded
+            else:
+                self.threaded = [th_halt]
+
     def clone(self):
         "Make a clone of the context object."
         ctx = Context(self.form, self.env, self.parent)
@@ -21,6 +86,55 @@ class Context(object):
         ctx.stack = list(self.stack)
         return ctx
 
+    def capture(self, one_shot=False):
+        """\
+        Make a clone of the context for a continuation. The parent is
+        marked shared, unless the continuation is one-shot: the parent
+        contexts are then continued without copying.
+        """
+        ctx = self.clone()
+        if not one_shot and self.parent is not None:
+            self.parent.shared = True
+        return ctx
+
+    def unshare(self):
+        """\
+        Get a copy of a shared context to continue running it, when
+        returning to it. The shared context is left unchanged for the
+        continuations referring to it. Its parent is now referred to by
+        the copy too, so it becomes shared. This way a continuation is
+        captured by only marking the parent of the current context
+        shared, and the contexts are copied later when returned to.
+        """
+        ctx = self.clone()
+        if self.parent is not None:
+            self.parent.shared = True
+        return ctx
+
+    def returned_to(self):
+        """\
+        Get the context to continue running when a call returns to a
+        context which is shared, or resumed by one-shot continuations.
+        These can't be invoked any more once the call/1cc has returned.
+        """
+        if self.one_shot is not None:
+            self.one_shot.expired = True
+            self.one_shot = None
+        if self.shared:
+            return self.unshare()
+        return self
+
+    def resume(self, ctx, copy=True):
+        """\
+        Get a context to continue running a context captured by a
+        continuation, invoked from ctx. Without copy, the captured
+        context itself is used, this is only allowed for one-shot
+        continuations.
+        """
+        if copy:
+            return self.unshare()
+        return self
+
     def push(self, val):
         "Push a value onto the stack."
         self.stack.append(val)
@@ -29,7 +143,16 @@ class Context(object):
         return self.stack.pop()
     def pop_n(self, n):
         "Remove n values from the top of the stack."
+        # stack[-0:] is the whole stack
+        if n > 0:
+            del self.stack[-n:]
+    def pop_list(self, n):
+        "Pop n values off the stack as a list, the bottom one first."
+        if n == 0:
+            return []
+        vals = self.stack[-n:]
         del self.stack[-n:]
+        return vals
     def top(self, idx=1):
         "Get a value from the stack."
         return self.stack[-idx]
@@ -48,3 +171,132 @@ class Context(object):
 
     def __str__(self):
         return '<Context stack_size=%d, ip=%d>' % (len(self.stack), self.ip)
+
+class StackContext(Context):
+    """\
+    A context using the value stack shared by all the contexts of a VM,
+    instead of a list of its own. The values of the context are those from
+    self.base to the top of the stack. Only the running context pushes and
+    pops, and its values are always on the top. When a context returns or
+    makes a tail call, all of its values are already popped, so the values
+    of the context it returns to are on the top again.
+    """
+    def __init__(self, form, env, parent=None):
+        self.form = form
+        self.env = env
+        if parent is not None:
+            self.vm = parent.vm
+        else:
+            self.vm = env.vm
+        self.parent = parent
+
+        self.ip = 0
+        if self.form is not None:
+            self.bytecode = form.bytecode
+            self.threaded = form.threaded
+        else:
+            self.bytecode = []
+            self.threaded = [th_halt]
+        self.stack = self.vm.stack
+        self.base = len(self.stack)
+        self.shared = False
+        self.one_shot = None
+        # The values of a shared context, saved by capture
+        self.saved = None
+
+    def bottom(self):
+        """\
+        The index of the first value saved with the context. The values
+        below the contexts run under the VM, e.g. those of the contexts
+        waiting for a nested run, are saved with the outermost one.
+        """
+        if self.parent.parent is None:
+            return 0
+        return self.base
+
+    def capture(self, one_shot=False):
+        """\
+        Make a clone of the context for a continuation, with a copy of
+        the values of the context. The values of the parent contexts can
+        be popped before the continuation is invoked, they are saved too
+        and the parents marked shared, even for a one-shot continuation.
+        This stops at the nearest parent already shared: a shared context
+        is never changed, and its parents are shared too, so the values
+        of each context are only copied once.
+        """
+        stack = self.stack
+        ctx = StackContext.__new__(StackContext)
+        ctx.__dict__.update(self.__dict__)
+        ctx.one_shot = None
+        ctx.stack = stack[self.bottom():]
+
+        top = self.base
+        pctx = self.parent
+        while pctx.parent is not None and not pctx.shared:
+            pctx.saved = stack[pctx.bottom():top]
+            pctx.shared = True
+            top = pctx.base
+            pctx = pctx.parent
+        return ctx
+
+    def unshare(self):
+        """\
+        The values of a context are on the shared stack and not copied.
+        The parents of a shared context are already shared.
+        """
+        ctx = StackContext.__new__(StackContext)
+        ctx.__dict__.update(self.__dict__)
+        ctx.shared = False
+        ctx.one_shot = None
+        ctx.saved = None
+        return ctx
+
+    def resume(self, ctx, copy=True):
+        """\
+        Get a context to continue running a clone, invoked from ctx. The
+        values of the parent contexts still waiting under ctx are on the
+        shared stack already, only those above them are restored.
+        """
+        # The nearest such parent, the bases of the contexts don't
+        # increase from a context to its parent
+        pctx = self.parent
+        while pctx is not ctx and pctx.parent is not None:
+            if ctx.parent is not None and ctx.base >= pctx.base:
+                ctx = ctx.parent
+            else:
+                pctx = pctx.parent
+
+        segments = [self.stack]
+        bottom = self
+        while bottom.parent is not pctx:
+            bottom = bottom.parent
+            segments.append(bottom.saved)
+        stack = self.vm.stack
+        del stack[bottom.bottom():]
+        for values in reversed(segments):
+            stack.extend(values)
+
+        if copy:
+            ctx = self.unshare()
+        else:
+            ctx = self
+        ctx.stack = stack
+        return ctx
+
+    def __getstate__(self):
+        # The contexts running or waiting for their callees use the
+        # stack of the VM, a VM made from an image gives them its own
+        # (see Image). The clones have copies of their values.
+        state = self.__dict__.copy()
+        if self.stack is getattr(self.vm, 'stack', None):
+            del state['stack']
+        return state
+
+    def __setstate__(self, state):
+        Context.__setstate__(self, state)
+        if 'stack' not in state:
+            self.stack = getattr(self.vm, 'stack', None)
+
+    def __str__(self):
+        return '<StackContext stack_size=%d, ip=%d>' % (len(self.stack)-self.base,
+                                                        self.ip)
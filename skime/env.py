@@ -1,3 +1,5 @@
+from .macro import SymbolClosure
+
 class Location(object):
     """\
     A location of a variable, including the Environment object and
@@ -59,16 +61,6 @@ class Environment(object):
         # The mapping from name to index
         self.locals_map = {}
 
-    def dup(self):
-        """\
-        Create a copy of self.
-        """
-        env = Environment(self.parent)
-        env.locals = list(self.locals)
-        env.locals_name = list(self.locals_name)
-        env.locals_map = dict(self.locals_map)
-        return env
-
     def assign_local(self, idx, value):
         """\
         Assign value to the local variable stored at idx.
@@ -101,6 +93,17 @@ class Environment(object):
         self.locals_map[name] = idx
         return idx
 
+    def alloc_slot(self, name, value=Undef()):
+        """\
+        Allocate space for a local variable of an inner Scope. The
+        slot can't be found by name in this environment, only the
+        Scope maps the name to it.
+        """
+        idx = len(self.locals)
+        self.locals_name.append(name)
+        self.locals.append(value)
+        return idx
+
     def find_local(self, name):
         """\
         Find the location(index) where the local variable is
@@ -120,6 +123,11 @@ class Environment(object):
         """\
         Find the location of variable with given name. Recursively
         find in parent when necessary.
+
+        The name can also be a SymbolClosure (a symbol inserted by a
+        macro). If it is not bound by the expansion, it is looked up
+        where the macro is defined, or else in the global environment,
+        never where the macro is used.
         """
         env = self
         while env is not None:
@@ -127,7 +135,143 @@ class Environment(object):
             if idx is not None:
                 return Location(env, idx)
             env = env.parent
+        if isinstance(name, SymbolClosure):
+            # an alias made by expanding a template with aliases in it
+            # is an alias of an alias
+            orig = name.expression
+            if not isinstance(orig, SymbolClosure):
+                orig = orig.name
+            env = name.lexical_parent
+            if env is None:
+                env = self
+                while env.parent is not None:
+                    env = env.parent
+            return env.lookup_location(orig)
         return None
 
     def __repr__(self):
         return "<Environment @%X>" % id(self)
+
+class Cell(object):
+    """\
+    The location of a global variable. Code compiled to access a global
+    variable refers to its cell directly.
+    """
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return "<Cell %s>" % self.name
+
+class GlobalEnvironment(Environment):
+    """\
+    The top-level environment of a VM. Each variable is held in a Cell,
+    which push_global and set_global access from the literals of the
+    compiled code, so the cost doesn't depend on how deeply the code is
+    nested. Defining a variable again keeps its cell, so the code
+    already compiled sees the new value.
+    """
+    def __init__(self):
+        self.parent = None
+        self.vm = None
+
+        # The cells of the variables
+        self.cells = []
+        # The names of the variables
+        self.locals_name = []
+        # The mapping from name to index
+        self.locals_map = {}
+
+    def assign_local(self, idx, value):
+        self.cells[idx].value = value
+
+    def read_local(self, idx):
+        return self.cells[idx].value
+
+    def alloc_local(self, name, value=Undef()):
+        idx = self.locals_map.get(name)
+        if idx is not None:
+            if value is not Undef():
+                self.cells[idx].value = value
+            return idx
+        idx = len(self.cells)
+        self.cells.append(Cell(str(name), value))
+        self.locals_name.append(name)
+        self.locals_map[name] = idx
+        return idx
+
+    def get_cell(self, idx):
+        "Get the Cell of the variable stored at idx."
+        return self.cells[idx]
+
+    def __repr__(self):
+        return "<GlobalEnvironment @%X>" % id(self)
+
+class Scope(Environment):
+    """\
+    The scope of the variables bound by let, let*, letrec or do in the
+    body of a procedure. It only exists at compile time: the variables
+    are kept in the slots of the Environment of the procedure (the
+    owner), so no environment is created when the scope is entered at
+    run time.
+    """
+    def __init__(self, parent):
+        self.parent = parent
+        self.vm = parent.vm
+        if isinstance(parent, Scope):
+            self.owner = parent.owner
+        else:
+            self.owner = parent
+        # The mapping from name to the index of the slot in owner
+        self.locals_map = {}
+
+    def assign_local(self, idx, value):
+        self.owner.assign_local(idx, value)
+
+    def read_local(self, idx):
+        return self.owner.read_local(idx)
+
+    def alloc_local(self, name, value=Undef()):
+        """\
+        Allocate a slot in the owner for the variable, unless the name
+        is already defined in this scope.
+        """
+        idx = self.locals_map.get(name)
+        if idx is not None:
+            if value is not Undef():
+                self.owner.assign_local(idx, value)
+            return idx
+        idx = self.owner.alloc_slot(name, value)
+        self.locals_map[name] = idx
+        return idx
+
+    def get_name(self, idx):
+        return self.owner.get_name(idx)
+
+    def __repr__(self):
+        return "<Scope @%X of %r>" % (id(self), self.owner)
+
+class Frame(object):
+    """\
+    The local variables of a procedure call at run time. Only the
+    values are kept here, the names of the variables are held by
+    the Environment the procedure is compiled under.
+    """
+    __slots__ = ('parent', 'locals')
+
+    def __init__(self, parent, locals):
+        # The lexical parent, a Frame or the Environment of the VM
+        self.parent = parent
+        self.locals = locals
+
+    def assign_local(self, idx, value):
+        self.locals[idx] = value
+
+    def read_local(self, idx):
+        return self.locals[idx]
+
+    def __repr__(self):
+        return "<Frame @%X>" % id(self)
@@ -1,10 +1,9 @@
 from cStringIO        import StringIO
+from array            import array
 
 from .errors          import MiscError
 from .env             import Environment
-from .compiler.disasm import disasm
-from .insns           import run
-from .ctx             import Context
+from .compiler.disasm import disasm, find_line
 
 class Form(object):
     """\
@@ -24,10 +23,34 @@ class Form(object):
         # The literals used in bytecode
         self.literals = builder.literals
 
+        # The file the form is read from, and the line numbers of
+        # the instructions, see line_of
+        self.filename = builder.filename
+        self.lines = array('i', builder.lines)
+
+        # The bytecode pre-decoded into handlers for the
+        # threaded engine, filled by Builder.generate
+        self.threaded = None
+
+    def __setstate__(self, state):
+        """\
+        The threaded code is not pickled in files (see BytecodeCache),
+        it is made again when unpickled.
+        """
+        self.__dict__.update(state)
+        if self.threaded is None:
+            # insns can't be imported before this module
+            from .insns import thread_bytecode
+            self.threaded = thread_bytecode(self.bytecode)
+
+    def line_of(self, ip):
+        "Get the line number of the instruction at ip, or None."
+        return find_line(self.lines, ip)
+
     def eval(self, env, vm):
         "Eval the form under env and vm."
-        ctx = Context(self, env, vm.ctx)
-        return run(ctx)
+        ctx = vm.context_t(self, env, vm.ctx)
+        return vm.engine(ctx)
 
     def disasm(self):
         "Show the disassemble of the instructions of the form. Useful for debug."
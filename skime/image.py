@@ -0,0 +1,130 @@
+# An Image is a snapshot of a VM: its global environment, with all the
+# procedures and macros defined, and its compiler. New VMs are made from
+# the image without loading the primitives and the Scheme libraries again:
+#
+#   vm = VM()
+#   vm.load('app.scm')
+#   image = vm.snapshot()
+#   ...
+#   request_vm = VM(image=image)
+#
+# The snapshot is a pickle. The objects that are never changed are not
+# copied into it: the VMs made from the image share the primitives, and
+# the bytecode, the threaded code, the source and the compile time
+# Environment of the Code of the procedures. An image can also be saved
+# to a file and loaded by another process, the primitives are then
+# referred to by name and the threaded code is made again.
+
+import cPickle as pickle
+from cStringIO          import StringIO
+from array              import array
+
+from .iset              import ISET_VERSION
+from .ctx               import is_threaded
+from .prim              import Primitive, PRIMITIVES
+from .proc              import Code
+from .env               import GlobalEnvironment
+from .types.vector      import Vector
+
+from .errors            import MiscError
+
+class Image(object):
+    "A snapshot of a VM, see VM.snapshot."
+    def __init__(self, vm, compiler, env):
+        # The objects shared by the image and the VMs made from it
+        self.shared = []
+        ids = {}
+        # The ids of the sources and Environments of the Code pickled
+        code_parts = set()
+        # The ids of the arrays of the numeric vectors, which are copied
+        # unlike the arrays of the code
+        vector_parts = set()
+        def persistent_id(obj):
+            if obj is vm:
+                return 'vm'
+            if isinstance(obj, Code):
+                # seen before the attributes of the code
+                if not isinstance(obj.env, GlobalEnvironment):
+                    code_parts.add(id(obj.env))
+                code_parts.add(id(obj.source))
+                return None
+            if isinstance(obj, Vector):
+                # seen before its items too
+                vector_parts.add(id(obj.items))
+                return None
+            if isinstance(obj, Primitive) or is_threaded(obj) or \
+                   (isinstance(obj, array) and id(obj) not in vector_parts) or \
+                   (id(obj) in code_parts and obj is not None):
+                idx = ids.get(id(obj))
+                if idx is None:
+                    idx = ids[id(obj)] = len(self.shared)
+                    self.shared.append(obj)
+                return idx
+            return None
+        self.data = dump(compiler, env, persistent_id)
+
+    def restore(self, vm):
+        "Get a copy of the compiler and the global environment for vm."
+        def persistent_load(pid):
+            if pid == 'vm':
+                return vm
+            return self.shared[pid]
+        return load(self.data, persistent_load)
+
+    def save(self, path):
+        "Save the image to a file, see load_image."
+        vm = object()
+        compiler, env = self.restore(vm)
+        names = {}
+        for idx in range(len(PRIMITIVES.cells)):
+            names[id(PRIMITIVES.cells[idx].value)] = PRIMITIVES.locals_name[idx]
+        def persistent_id(obj):
+            if obj is vm:
+                return 'vm'
+            if is_threaded(obj):
+                return 'threaded'
+            if isinstance(obj, Primitive) and id(obj) in names:
+                return 'primitive %s' % names[id(obj)]
+            return None
+
+        io = open(path, 'wb')
+        try:
+            io.write(ISET_VERSION)
+            io.write(dump(compiler, env, persistent_id))
+        finally:
+            io.close()
+
+def load_image(path):
+    "Load an image saved by Image.save."
+    io = open(path, 'rb')
+    try:
+        version = io.read(len(ISET_VERSION))
+        data = io.read()
+    finally:
+        io.close()
+    if version != ISET_VERSION:
+        raise MiscError("The image %s is made with another instruction set" % path)
+
+    vm = object()
+    def persistent_load(pid):
+        if pid == 'vm':
+            return vm
+        if pid == 'threaded':
+            # made again by the forms and code unpickled
+            return None
+        name = pid.split(' ', 1)[1]
+        return PRIMITIVES.read_local(PRIMITIVES.find_local(name))
+    compiler, env = load(data, persistent_load)
+    return Image(vm, compiler, env)
+
+def dump(compiler, env, persistent_id):
+    io = StringIO()
+    pickler = pickle.Pickler(io, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump((compiler, env))
+    return io.getvalue()
+
+def load(data, persistent_load):
+    unpickler = pickle.Unpickler(StringIO(data))
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
@@ -0,0 +1,2385 @@
+# Don't edit this file. This is generated by iset_gen.py
+
+from .ctx        import Context, HALT, th_halt, add_traceback
+from .call_cc    import Continuation
+from .proc       import Procedure
+from .iset       import INSN_MAP
+from .prim       import Primitive, PyPrimitive, EnginePrimitive, next_args
+from .prim       import prim_apply, prim_map, prim_for_each
+from .prim       import plus, minus, mul, less, more, less_equal, more_equal, equal
+from .prim       import prim_first, prim_rest, prim_pair, prim_null_p, prim_not, prim_eqv
+from .prim       import prim_vector_ref, prim_vector_set_x
+from .types.pair import Pair
+from .types.vector import Vector
+from .errors     import WrongArgType, WrongArgNumber
+
+TAG_CTRL_FLOW    = 1
+TAG_CTX_SWITCH   = 2
+
+def op_ret(ctx):
+    pctx = ctx.parent
+    if pctx.shared or pctx.one_shot is not None:
+        pctx = pctx.returned_to()
+    retval = ctx.pop()
+    pctx.push(retval)
+    return pctx
+
+def op_call(ctx):
+    argc = get_param(ctx, 1)
+    nctx = make_call(ctx, argc)
+
+    ctx.ip += 2
+    return nctx
+
+def op_tail_call(ctx):
+    argc = get_param(ctx, 1)
+    nctx = make_call(ctx, argc, tail=True)
+
+    ctx.ip += 2
+    return nctx
+
+def op_call_cc(ctx):
+    cc = Continuation(ctx, 1, 1)
+    ctx.insert(-1, cc)
+
+    nctx = make_call(ctx, 1)
+    ctx.ip += 1
+    return nctx
+
+def op_call_1cc(ctx):
+    cc = Continuation(ctx, 1, 1, one_shot=True)
+    ctx.insert(-1, cc)
+
+    nctx = make_call(ctx, 1)
+    ctx.ip += 1
+    return nctx
+
+def op_tail_call_cc(ctx):
+    cc = Continuation(ctx, 1, 1)
+    ctx.insert(-1, cc)
+
+    nctx = make_call(ctx, 1, tail=True)
+    ctx.ip += 1
+    return nctx
+
+def op_tail_call_1cc(ctx):
+    cc = Continuation(ctx, 1, 1, one_shot=True, tail=True)
+    ctx.insert(-1, cc)
+
+    nctx = make_call(ctx, 1, tail=True)
+    ctx.ip += 1
+    return nctx
+
+def op_native_step(ctx):
+    return ctx.form.step(ctx)
+
+def op_pop(ctx):
+    ctx.pop()
+    ctx.ip += 1
+
+def op_push_local(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    ctx.ip += 2
+
+def op_set_local(ctx):
+    idx = get_param(ctx, 1)
+    val = ctx.pop()
+    ctx.env.assign_local(idx, val)
+    ctx.ip += 2
+
+def op_push_local_depth(ctx):
+    depth = get_param(ctx, 1)
+    idx = get_param(ctx, 2)
+
+    penv = ctx.env
+    while depth > 0:
+        penv = penv.parent
+        depth -= 1
+    loc = penv.read_local(idx)
+    ctx.push(loc)
+    ctx.ip += 3
+
+def op_set_local_depth(ctx):
+    depth = get_param(ctx, 1)
+    idx = get_param(ctx, 2)
+    value = ctx.pop()
+
+    penv = ctx.env
+    while depth > 0:
+        penv = penv.parent
+        depth -= 1
+    penv.assign_local(idx, value)
+    ctx.ip += 3
+
+def op_push_global(ctx):
+    idx = get_param(ctx, 1)
+    ctx.push(ctx.form.literals[idx].value)
+    ctx.ip += 2
+
+def op_set_global(ctx):
+    idx = get_param(ctx, 1)
+    ctx.form.literals[idx].value = ctx.pop()
+    ctx.ip += 2
+
+def op_push_literal(ctx):
+    idx = get_param(ctx, 1)
+    lit = ctx.form.literals[idx]
+    ctx.push(lit)
+    ctx.ip += 2
+
+def op_push_0(ctx):
+    ctx.push(0)
+    ctx.ip += 1
+
+def op_push_1(ctx):
+    ctx.push(1)
+    ctx.ip += 1
+
+def op_push_nil(ctx):
+    ctx.push(None)
+    ctx.ip += 1
+
+def op_push_true(ctx):
+    ctx.push(True)
+    ctx.ip += 1
+
+def op_push_false(ctx):
+    ctx.push(False)
+    ctx.ip += 1
+
+def op_dup(ctx):
+    ctx.push(ctx.top())
+    ctx.ip += 1
+
+def op_goto(ctx):
+    ip = get_param(ctx, 1)
+    ctx.ip = ip
+
+def op_goto_if_not_false(ctx):
+    ip = get_param(ctx, 1)
+    cond = ctx.pop()
+    if cond is not False:
+        ctx.ip = ip
+    else:
+        ctx.ip += 2
+
+def op_goto_if_false(ctx):
+    ip = get_param(ctx, 1)
+    cond = ctx.pop()
+    if cond is False:
+        ctx.ip = ip
+    else:
+        ctx.ip += 2
+
+def op_goto_if_rebound(ctx):
+    cell = ctx.form.literals[get_param(ctx, 1)]
+    if cell.value is ctx.form.literals[get_param(ctx, 2)]:
+        ctx.ip += 4
+    else:
+        ctx.ip = get_param(ctx, 3)
+
+def op_make_closure(ctx):
+    idx = get_param(ctx, 1)
+    ctx.push(Procedure(ctx.form.literals[idx], ctx.env))
+    ctx.ip += 2
+
+def op_add2(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, plus)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a + b)
+    else:
+        ctx.push(plus(ctx.vm, a, b))
+    ctx.ip += 2
+    return ctx
+
+def op_sub2(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, minus)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a - b)
+    else:
+        ctx.push(minus(ctx.vm, a, b))
+    ctx.ip += 2
+    return ctx
+
+def op_mul2(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, mul)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a * b)
+    else:
+        ctx.push(mul(ctx.vm, a, b))
+    ctx.ip += 2
+    return ctx
+
+def op_lt2(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, less)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a < b)
+    else:
+        ctx.push(less(ctx.vm, a, b))
+    ctx.ip += 2
+    return ctx
+
+def op_gt2(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, more)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a > b)
+    else:
+        ctx.push(more(ctx.vm, a, b))
+    ctx.ip += 2
+    return ctx
+
+def op_le2(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, less_equal)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a <= b)
+    else:
+        ctx.push(less_equal(ctx.vm, a, b))
+    ctx.ip += 2
+    return ctx
+
+def op_ge2(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, more_equal)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a >= b)
+    else:
+        ctx.push(more_equal(ctx.vm, a, b))
+    ctx.ip += 2
+    return ctx
+
+def op_num_eq2(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, equal)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a == b)
+    else:
+        ctx.push(equal(ctx.vm, a, b))
+    ctx.ip += 2
+    return ctx
+
+def op_car(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, prim_first)
+    if proc is not None:
+        return call_rebound(ctx, proc, 1, 2)
+    a = ctx.pop()
+    if type(a) is Pair:
+        ctx.push(a.first)
+    else:
+        ctx.push(prim_first(ctx.vm, a))
+    ctx.ip += 2
+    return ctx
+
+def op_cdr(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, prim_rest)
+    if proc is not None:
+        return call_rebound(ctx, proc, 1, 2)
+    a = ctx.pop()
+    if type(a) is Pair:
+        ctx.push(a.rest)
+    else:
+        ctx.push(prim_rest(ctx.vm, a))
+    ctx.ip += 2
+    return ctx
+
+def op_cons(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, prim_pair)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    ctx.push(Pair(a, b))
+    ctx.ip += 2
+    return ctx
+
+def op_null_p(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, prim_null_p)
+    if proc is not None:
+        return call_rebound(ctx, proc, 1, 2)
+    a = ctx.pop()
+    ctx.push(a is None)
+    ctx.ip += 2
+    return ctx
+
+def op_not(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, prim_not)
+    if proc is not None:
+        return call_rebound(ctx, proc, 1, 2)
+    a = ctx.pop()
+    ctx.push(a is False)
+    ctx.ip += 2
+    return ctx
+
+def op_eq_p(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, prim_eqv)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    ctx.push(a is b)
+    ctx.ip += 2
+    return ctx
+
+def op_vector_ref(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, prim_vector_ref)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    k = ctx.pop()
+    a = ctx.pop()
+    if type(a) is Vector and type(k) is int and 0 <= k < len(a.items):
+        ctx.push(a.items[k])
+    else:
+        ctx.push(prim_vector_ref(ctx.vm, a, k))
+    ctx.ip += 2
+    return ctx
+
+def op_vector_set(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, prim_vector_set_x)
+    if proc is not None:
+        return call_rebound(ctx, proc, 3, 2)
+    b = ctx.pop()
+    k = ctx.pop()
+    a = ctx.pop()
+    if type(a) is Vector and type(k) is int and 0 <= k < len(a.items) and \
+           (type(b) is not bool or type(a.items) is list):
+        try:
+            a.items[k] = b
+        except (TypeError, OverflowError):
+            # refused by the array of a numeric vector
+            prim_vector_set_x(ctx.vm, a, k, b)
+    else:
+        prim_vector_set_x(ctx.vm, a, k, b)
+    ctx.push(None)
+    ctx.ip += 2
+    return ctx
+
+def op_lt2_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, less)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        test = a < b
+    else:
+        test = less(ctx.vm, a, b)
+    if test is False:
+        ctx.ip = get_param(ctx, 3)
+    else:
+        ctx.ip += 4
+    return ctx
+
+def op_gt2_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, more)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        test = a > b
+    else:
+        test = more(ctx.vm, a, b)
+    if test is False:
+        ctx.ip = get_param(ctx, 3)
+    else:
+        ctx.ip += 4
+    return ctx
+
+def op_le2_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, less_equal)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        test = a <= b
+    else:
+        test = less_equal(ctx.vm, a, b)
+    if test is False:
+        ctx.ip = get_param(ctx, 3)
+    else:
+        ctx.ip += 4
+    return ctx
+
+def op_ge2_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, more_equal)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        test = a >= b
+    else:
+        test = more_equal(ctx.vm, a, b)
+    if test is False:
+        ctx.ip = get_param(ctx, 3)
+    else:
+        ctx.ip += 4
+    return ctx
+
+def op_num_eq2_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, equal)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        test = a == b
+    else:
+        test = equal(ctx.vm, a, b)
+    if test is False:
+        ctx.ip = get_param(ctx, 3)
+    else:
+        ctx.ip += 4
+    return ctx
+
+def op_eq_p_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, prim_eqv)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 2)
+    b = ctx.pop()
+    a = ctx.pop()
+    test = a is b
+    if test:
+        ctx.ip += 4
+    else:
+        ctx.ip = get_param(ctx, 3)
+    return ctx
+
+def op_null_p_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, prim_null_p)
+    if proc is not None:
+        return call_rebound(ctx, proc, 1, 2)
+    test = ctx.pop() is None
+    if test:
+        ctx.ip += 4
+    else:
+        ctx.ip = get_param(ctx, 3)
+    return ctx
+
+def op_not_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    proc = rebound_primitive(ctx, idx, prim_not)
+    if proc is not None:
+        return call_rebound(ctx, proc, 1, 2)
+    test = ctx.pop() is False
+    if test:
+        ctx.ip += 4
+    else:
+        ctx.ip = get_param(ctx, 3)
+    return ctx
+
+def op_push_local_push_0_num_eq2_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    ctx.push(0)
+    idx = get_param(ctx, 4)
+    proc = rebound_primitive(ctx, idx, equal)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 5)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        test = a == b
+    else:
+        test = equal(ctx.vm, a, b)
+    if test is False:
+        ctx.ip = get_param(ctx, 6)
+    else:
+        ctx.ip += 7
+    return ctx
+
+def op_push_local_push_local_lt2_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 5)
+    proc = rebound_primitive(ctx, idx, less)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 6)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        test = a < b
+    else:
+        test = less(ctx.vm, a, b)
+    if test is False:
+        ctx.ip = get_param(ctx, 7)
+    else:
+        ctx.ip += 8
+    return ctx
+
+def op_push_local_push_literal_lt2_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    lit = ctx.form.literals[idx]
+    ctx.push(lit)
+    idx = get_param(ctx, 5)
+    proc = rebound_primitive(ctx, idx, less)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 6)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        test = a < b
+    else:
+        test = less(ctx.vm, a, b)
+    if test is False:
+        ctx.ip = get_param(ctx, 7)
+    else:
+        ctx.ip += 8
+    return ctx
+
+def op_push_local_null_p_goto_if_false(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    proc = rebound_primitive(ctx, idx, prim_null_p)
+    if proc is not None:
+        return call_rebound(ctx, proc, 1, 4)
+    test = ctx.pop() is None
+    if test:
+        ctx.ip += 6
+    else:
+        ctx.ip = get_param(ctx, 5)
+    return ctx
+
+def op_push_local_push_global_call(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    ctx.push(ctx.form.literals[idx].value)
+    argc = get_param(ctx, 5)
+    nctx = make_call(ctx, argc)
+
+    ctx.ip += 6
+    return nctx
+
+def op_push_global_call(ctx):
+    idx = get_param(ctx, 1)
+    ctx.push(ctx.form.literals[idx].value)
+    argc = get_param(ctx, 3)
+    nctx = make_call(ctx, argc)
+
+    ctx.ip += 4
+    return nctx
+
+def op_push_global_tail_call(ctx):
+    idx = get_param(ctx, 1)
+    ctx.push(ctx.form.literals[idx].value)
+    argc = get_param(ctx, 3)
+    nctx = make_call(ctx, argc, tail=True)
+
+    ctx.ip += 4
+    return nctx
+
+def op_push_local_push_1_sub2(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    ctx.push(1)
+    idx = get_param(ctx, 4)
+    proc = rebound_primitive(ctx, idx, minus)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 5)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a - b)
+    else:
+        ctx.push(minus(ctx.vm, a, b))
+    ctx.ip += 5
+    return ctx
+
+def op_push_local_push_literal_sub2(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    lit = ctx.form.literals[idx]
+    ctx.push(lit)
+    idx = get_param(ctx, 5)
+    proc = rebound_primitive(ctx, idx, minus)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 6)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a - b)
+    else:
+        ctx.push(minus(ctx.vm, a, b))
+    ctx.ip += 6
+    return ctx
+
+def op_push_local_push_local_lt2(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 5)
+    proc = rebound_primitive(ctx, idx, less)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 6)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a < b)
+    else:
+        ctx.push(less(ctx.vm, a, b))
+    ctx.ip += 6
+    return ctx
+
+def op_push_local_push_literal_lt2(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    lit = ctx.form.literals[idx]
+    ctx.push(lit)
+    idx = get_param(ctx, 5)
+    proc = rebound_primitive(ctx, idx, less)
+    if proc is not None:
+        return call_rebound(ctx, proc, 2, 6)
+    b = ctx.pop()
+    a = ctx.pop()
+    if type(a) is int and type(b) is int:
+        ctx.push(a < b)
+    else:
+        ctx.push(less(ctx.vm, a, b))
+    ctx.ip += 6
+    return ctx
+
+def op_push_local_push_local(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    ctx.ip += 4
+
+def op_push_local_push_1(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    ctx.push(1)
+    ctx.ip += 3
+
+def op_push_local_push_literal(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    lit = ctx.form.literals[idx]
+    ctx.push(lit)
+    ctx.ip += 4
+
+def op_push_local_ret(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    pctx = ctx.parent
+    if pctx.shared or pctx.one_shot is not None:
+        pctx = pctx.returned_to()
+    retval = ctx.pop()
+    pctx.push(retval)
+    return pctx
+
+def op_push_local_null_p(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    proc = rebound_primitive(ctx, idx, prim_null_p)
+    if proc is not None:
+        return call_rebound(ctx, proc, 1, 4)
+    a = ctx.pop()
+    ctx.push(a is None)
+    ctx.ip += 4
+    return ctx
+
+def op_push_local_car(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    proc = rebound_primitive(ctx, idx, prim_first)
+    if proc is not None:
+        return call_rebound(ctx, proc, 1, 4)
+    a = ctx.pop()
+    if type(a) is Pair:
+        ctx.push(a.first)
+    else:
+        ctx.push(prim_first(ctx.vm, a))
+    ctx.ip += 4
+    return ctx
+
+def op_push_local_cdr(ctx):
+    idx = get_param(ctx, 1)
+    loc = ctx.env.read_local(idx)
+    ctx.push(loc)
+    idx = get_param(ctx, 3)
+    proc = rebound_primitive(ctx, idx, prim_rest)
+    if proc is not None:
+        return call_rebound(ctx, proc, 1, 4)
+    a = ctx.pop()
+    if type(a) is Pair:
+        ctx.push(a.rest)
+    else:
+        ctx.push(prim_rest(ctx.vm, a))
+    ctx.ip += 4
+    return ctx
+
+def op_set_local_set_local_goto(ctx):
+    idx = get_param(ctx, 1)
+    val = ctx.pop()
+    ctx.env.assign_local(idx, val)
+    idx = get_param(ctx, 3)
+    val = ctx.pop()
+    ctx.env.assign_local(idx, val)
+    ip = get_param(ctx, 5)
+    ctx.ip = ip
+
+def op_set_local_goto(ctx):
+    idx = get_param(ctx, 1)
+    val = ctx.pop()
+    ctx.env.assign_local(idx, val)
+    ip = get_param(ctx, 3)
+    ctx.ip = ip
+
+
+INSN_ACTION = [
+    op_ret,
+    op_call,
+    op_tail_call,
+    op_call_cc,
+    op_call_1cc,
+    op_tail_call_cc,
+    op_tail_call_1cc,
+    op_native_step,
+    op_pop,
+    op_push_local,
+    op_set_local,
+    op_push_local_depth,
+    op_set_local_depth,
+    op_push_global,
+    op_set_global,
+    op_push_literal,
+    op_push_0,
+    op_push_1,
+    op_push_nil,
+    op_push_true,
+    op_push_false,
+    op_dup,
+    op_goto,
+    op_goto_if_not_false,
+    op_goto_if_false,
+    op_goto_if_rebound,
+    op_make_closure,
+    op_add2,
+    op_sub2,
+    op_mul2,
+    op_lt2,
+    op_gt2,
+    op_le2,
+    op_ge2,
+    op_num_eq2,
+    op_car,
+    op_cdr,
+    op_cons,
+    op_null_p,
+    op_not,
+    op_eq_p,
+    op_vector_ref,
+    op_vector_set,
+    op_lt2_goto_if_false,
+    op_gt2_goto_if_false,
+    op_le2_goto_if_false,
+    op_ge2_goto_if_false,
+    op_num_eq2_goto_if_false,
+    op_eq_p_goto_if_false,
+    op_null_p_goto_if_false,
+    op_not_goto_if_false,
+    op_push_local_push_0_num_eq2_goto_if_false,
+    op_push_local_push_local_lt2_goto_if_false,
+    op_push_local_push_literal_lt2_goto_if_false,
+    op_push_local_null_p_goto_if_false,
+    op_push_local_push_global_call,
+    op_push_global_call,
+    op_push_global_tail_call,
+    op_push_local_push_1_sub2,
+    op_push_local_push_literal_sub2,
+    op_push_local_push_local_lt2,
+    op_push_local_push_literal_lt2,
+    op_push_local_push_local,
+    op_push_local_push_1,
+    op_push_local_push_literal,
+    op_push_local_ret,
+    op_push_local_null_p,
+    op_push_local_car,
+    op_push_local_cdr,
+    op_set_local_set_local_goto,
+    op_set_local_goto
+]
+
+
+def thread_ret():
+    def th_ret(ctx):
+        pctx = ctx.parent
+        if pctx.shared or pctx.one_shot is not None:
+            pctx = pctx.returned_to()
+        retval = ctx.pop()
+        pctx.push(retval)
+        return pctx
+    return th_ret
+
+def thread_call(_op1):
+    def th_call(ctx):
+        argc = _op1
+        nctx = make_call(ctx, argc)
+
+        ctx.ip += 2
+        return nctx
+    return th_call
+
+def thread_tail_call(_op1):
+    def th_tail_call(ctx):
+        argc = _op1
+        nctx = make_call(ctx, argc, tail=True)
+
+        ctx.ip += 2
+        return nctx
+    return th_tail_call
+
+def thread_call_cc():
+    def th_call_cc(ctx):
+        cc = Continuation(ctx, 1, 1)
+        ctx.insert(-1, cc)
+
+        nctx = make_call(ctx, 1)
+        ctx.ip += 1
+        return nctx
+    return th_call_cc
+
+def thread_call_1cc():
+    def th_call_1cc(ctx):
+        cc = Continuation(ctx, 1, 1, one_shot=True)
+        ctx.insert(-1, cc)
+
+        nctx = make_call(ctx, 1)
+        ctx.ip += 1
+        return nctx
+    return th_call_1cc
+
+def thread_tail_call_cc():
+    def th_tail_call_cc(ctx):
+        cc = Continuation(ctx, 1, 1)
+        ctx.insert(-1, cc)
+
+        nctx = make_call(ctx, 1, tail=True)
+        ctx.ip += 1
+        return nctx
+    return th_tail_call_cc
+
+def thread_tail_call_1cc():
+    def th_tail_call_1cc(ctx):
+        cc = Continuation(ctx, 1, 1, one_shot=True, tail=True)
+        ctx.insert(-1, cc)
+
+        nctx = make_call(ctx, 1, tail=True)
+        ctx.ip += 1
+        return nctx
+    return th_tail_call_1cc
+
+def thread_native_step():
+    def th_native_step(ctx):
+        return ctx.form.step(ctx)
+    return th_native_step
+
+def thread_pop():
+    def th_pop(ctx):
+        ctx.pop()
+        ctx.ip += 1
+    return th_pop
+
+def thread_push_local(_op1):
+    def th_push_local(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        ctx.ip += 2
+    return th_push_local
+
+def thread_set_local(_op1):
+    def th_set_local(ctx):
+        idx = _op1
+        val = ctx.pop()
+        ctx.env.assign_local(idx, val)
+        ctx.ip += 2
+    return th_set_local
+
+def thread_push_local_depth(_op1, _op2):
+    def th_push_local_depth(ctx):
+        depth = _op1
+        idx = _op2
+
+        penv = ctx.env
+        while depth > 0:
+            penv = penv.parent
+            depth -= 1
+        loc = penv.read_local(idx)
+        ctx.push(loc)
+        ctx.ip += 3
+    return th_push_local_depth
+
+def thread_set_local_depth(_op1, _op2):
+    def th_set_local_depth(ctx):
+        depth = _op1
+        idx = _op2
+        value = ctx.pop()
+
+        penv = ctx.env
+        while depth > 0:
+            penv = penv.parent
+            depth -= 1
+        penv.assign_local(idx, value)
+        ctx.ip += 3
+    return th_set_local_depth
+
+def thread_push_global(_op1):
+    def th_push_global(ctx):
+        idx = _op1
+        ctx.push(ctx.form.literals[idx].value)
+        ctx.ip += 2
+    return th_push_global
+
+def thread_set_global(_op1):
+    def th_set_global(ctx):
+        idx = _op1
+        ctx.form.literals[idx].value = ctx.pop()
+        ctx.ip += 2
+    return th_set_global
+
+def thread_push_literal(_op1):
+    def th_push_literal(ctx):
+        idx = _op1
+        lit = ctx.form.literals[idx]
+        ctx.push(lit)
+        ctx.ip += 2
+    return th_push_literal
+
+def thread_push_0():
+    def th_push_0(ctx):
+        ctx.push(0)
+        ctx.ip += 1
+    return th_push_0
+
+def thread_push_1():
+    def th_push_1(ctx):
+        ctx.push(1)
+        ctx.ip += 1
+    return th_push_1
+
+def thread_push_nil():
+    def th_push_nil(ctx):
+        ctx.push(None)
+        ctx.ip += 1
+    return th_push_nil
+
+def thread_push_true():
+    def th_push_true(ctx):
+        ctx.push(True)
+        ctx.ip += 1
+    return th_push_true
+
+def thread_push_false():
+    def th_push_false(ctx):
+        ctx.push(False)
+        ctx.ip += 1
+    return th_push_false
+
+def thread_dup():
+    def th_dup(ctx):
+        ctx.push(ctx.top())
+        ctx.ip += 1
+    return th_dup
+
+def thread_goto(_op1):
+    def th_goto(ctx):
+        ip = _op1
+        ctx.ip = ip
+    return th_goto
+
+def thread_goto_if_not_false(_op1):
+    def th_goto_if_not_false(ctx):
+        ip = _op1
+        cond = ctx.pop()
+        if cond is not False:
+            ctx.ip = ip
+        else:
+            ctx.ip += 2
+    return th_goto_if_not_false
+
+def thread_goto_if_false(_op1):
+    def th_goto_if_false(ctx):
+        ip = _op1
+        cond = ctx.pop()
+        if cond is False:
+            ctx.ip = ip
+        else:
+            ctx.ip += 2
+    return th_goto_if_false
+
+def thread_goto_if_rebound(_op1, _op2, _op3):
+    def th_goto_if_rebound(ctx):
+        cell = ctx.form.literals[_op1]
+        if cell.value is ctx.form.literals[_op2]:
+            ctx.ip += 4
+        else:
+            ctx.ip = _op3
+    return th_goto_if_rebound
+
+def thread_make_closure(_op1):
+    def th_make_closure(ctx):
+        idx = _op1
+        ctx.push(Procedure(ctx.form.literals[idx], ctx.env))
+        ctx.ip += 2
+    return th_make_closure
+
+def thread_add2(_op1):
+    def th_add2(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, plus)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a + b)
+        else:
+            ctx.push(plus(ctx.vm, a, b))
+        ctx.ip += 2
+        return ctx
+    return th_add2
+
+def thread_sub2(_op1):
+    def th_sub2(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, minus)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a - b)
+        else:
+            ctx.push(minus(ctx.vm, a, b))
+        ctx.ip += 2
+        return ctx
+    return th_sub2
+
+def thread_mul2(_op1):
+    def th_mul2(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, mul)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a * b)
+        else:
+            ctx.push(mul(ctx.vm, a, b))
+        ctx.ip += 2
+        return ctx
+    return th_mul2
+
+def thread_lt2(_op1):
+    def th_lt2(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, less)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a < b)
+        else:
+            ctx.push(less(ctx.vm, a, b))
+        ctx.ip += 2
+        return ctx
+    return th_lt2
+
+def thread_gt2(_op1):
+    def th_gt2(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, more)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a > b)
+        else:
+            ctx.push(more(ctx.vm, a, b))
+        ctx.ip += 2
+        return ctx
+    return th_gt2
+
+def thread_le2(_op1):
+    def th_le2(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, less_equal)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a <= b)
+        else:
+            ctx.push(less_equal(ctx.vm, a, b))
+        ctx.ip += 2
+        return ctx
+    return th_le2
+
+def thread_ge2(_op1):
+    def th_ge2(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, more_equal)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a >= b)
+        else:
+            ctx.push(more_equal(ctx.vm, a, b))
+        ctx.ip += 2
+        return ctx
+    return th_ge2
+
+def thread_num_eq2(_op1):
+    def th_num_eq2(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, equal)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a == b)
+        else:
+            ctx.push(equal(ctx.vm, a, b))
+        ctx.ip += 2
+        return ctx
+    return th_num_eq2
+
+def thread_car(_op1):
+    def th_car(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, prim_first)
+        if proc is not None:
+            return call_rebound(ctx, proc, 1, 2)
+        a = ctx.pop()
+        if type(a) is Pair:
+            ctx.push(a.first)
+        else:
+            ctx.push(prim_first(ctx.vm, a))
+        ctx.ip += 2
+        return ctx
+    return th_car
+
+def thread_cdr(_op1):
+    def th_cdr(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, prim_rest)
+        if proc is not None:
+            return call_rebound(ctx, proc, 1, 2)
+        a = ctx.pop()
+        if type(a) is Pair:
+            ctx.push(a.rest)
+        else:
+            ctx.push(prim_rest(ctx.vm, a))
+        ctx.ip += 2
+        return ctx
+    return th_cdr
+
+def thread_cons(_op1):
+    def th_cons(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, prim_pair)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        ctx.push(Pair(a, b))
+        ctx.ip += 2
+        return ctx
+    return th_cons
+
+def thread_null_p(_op1):
+    def th_null_p(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, prim_null_p)
+        if proc is not None:
+            return call_rebound(ctx, proc, 1, 2)
+        a = ctx.pop()
+        ctx.push(a is None)
+        ctx.ip += 2
+        return ctx
+    return th_null_p
+
+def thread_not(_op1):
+    def th_not(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, prim_not)
+        if proc is not None:
+            return call_rebound(ctx, proc, 1, 2)
+        a = ctx.pop()
+        ctx.push(a is False)
+        ctx.ip += 2
+        return ctx
+    return th_not
+
+def thread_eq_p(_op1):
+    def th_eq_p(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, prim_eqv)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        ctx.push(a is b)
+        ctx.ip += 2
+        return ctx
+    return th_eq_p
+
+def thread_vector_ref(_op1):
+    def th_vector_ref(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, prim_vector_ref)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        k = ctx.pop()
+        a = ctx.pop()
+        if type(a) is Vector and type(k) is int and 0 <= k < len(a.items):
+            ctx.push(a.items[k])
+        else:
+            ctx.push(prim_vector_ref(ctx.vm, a, k))
+        ctx.ip += 2
+        return ctx
+    return th_vector_ref
+
+def thread_vector_set(_op1):
+    def th_vector_set(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, prim_vector_set_x)
+        if proc is not None:
+            return call_rebound(ctx, proc, 3, 2)
+        b = ctx.pop()
+        k = ctx.pop()
+        a = ctx.pop()
+        if type(a) is Vector and type(k) is int and 0 <= k < len(a.items) and \
+               (type(b) is not bool or type(a.items) is list):
+            try:
+                a.items[k] = b
+            except (TypeError, OverflowError):
+                # refused by the array of a numeric vector
+                prim_vector_set_x(ctx.vm, a, k, b)
+        else:
+            prim_vector_set_x(ctx.vm, a, k, b)
+        ctx.push(None)
+        ctx.ip += 2
+        return ctx
+    return th_vector_set
+
+def thread_lt2_goto_if_false(_op1, _op2, _op3):
+    def th_lt2_goto_if_false(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, less)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            test = a < b
+        else:
+            test = less(ctx.vm, a, b)
+        if test is False:
+            ctx.ip = _op3
+        else:
+            ctx.ip += 4
+        return ctx
+    return th_lt2_goto_if_false
+
+def thread_gt2_goto_if_false(_op1, _op2, _op3):
+    def th_gt2_goto_if_false(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, more)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            test = a > b
+        else:
+            test = more(ctx.vm, a, b)
+        if test is False:
+            ctx.ip = _op3
+        else:
+            ctx.ip += 4
+        return ctx
+    return th_gt2_goto_if_false
+
+def thread_le2_goto_if_false(_op1, _op2, _op3):
+    def th_le2_goto_if_false(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, less_equal)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            test = a <= b
+        else:
+            test = less_equal(ctx.vm, a, b)
+        if test is False:
+            ctx.ip = _op3
+        else:
+            ctx.ip += 4
+        return ctx
+    return th_le2_goto_if_false
+
+def thread_ge2_goto_if_false(_op1, _op2, _op3):
+    def th_ge2_goto_if_false(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, more_equal)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            test = a >= b
+        else:
+            test = more_equal(ctx.vm, a, b)
+        if test is False:
+            ctx.ip = _op3
+        else:
+            ctx.ip += 4
+        return ctx
+    return th_ge2_goto_if_false
+
+def thread_num_eq2_goto_if_false(_op1, _op2, _op3):
+    def th_num_eq2_goto_if_false(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, equal)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            test = a == b
+        else:
+            test = equal(ctx.vm, a, b)
+        if test is False:
+            ctx.ip = _op3
+        else:
+            ctx.ip += 4
+        return ctx
+    return th_num_eq2_goto_if_false
+
+def thread_eq_p_goto_if_false(_op1, _op2, _op3):
+    def th_eq_p_goto_if_false(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, prim_eqv)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 2)
+        b = ctx.pop()
+        a = ctx.pop()
+        test = a is b
+        if test:
+            ctx.ip += 4
+        else:
+            ctx.ip = _op3
+        return ctx
+    return th_eq_p_goto_if_false
+
+def thread_null_p_goto_if_false(_op1, _op2, _op3):
+    def th_null_p_goto_if_false(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, prim_null_p)
+        if proc is not None:
+            return call_rebound(ctx, proc, 1, 2)
+        test = ctx.pop() is None
+        if test:
+            ctx.ip += 4
+        else:
+            ctx.ip = _op3
+        return ctx
+    return th_null_p_goto_if_false
+
+def thread_not_goto_if_false(_op1, _op2, _op3):
+    def th_not_goto_if_false(ctx):
+        idx = _op1
+        proc = rebound_primitive(ctx, idx, prim_not)
+        if proc is not None:
+            return call_rebound(ctx, proc, 1, 2)
+        test = ctx.pop() is False
+        if test:
+            ctx.ip += 4
+        else:
+            ctx.ip = _op3
+        return ctx
+    return th_not_goto_if_false
+
+def thread_push_local_push_0_num_eq2_goto_if_false(_op1, _op2, _op3, _op4, _op5, _op6):
+    def th_push_local_push_0_num_eq2_goto_if_false(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        ctx.push(0)
+        idx = _op4
+        proc = rebound_primitive(ctx, idx, equal)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 5)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            test = a == b
+        else:
+            test = equal(ctx.vm, a, b)
+        if test is False:
+            ctx.ip = _op6
+        else:
+            ctx.ip += 7
+        return ctx
+    return th_push_local_push_0_num_eq2_goto_if_false
+
+def thread_push_local_push_local_lt2_goto_if_false(_op1, _op2, _op3, _op4, _op5, _op6, _op7):
+    def th_push_local_push_local_lt2_goto_if_false(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op5
+        proc = rebound_primitive(ctx, idx, less)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 6)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            test = a < b
+        else:
+            test = less(ctx.vm, a, b)
+        if test is False:
+            ctx.ip = _op7
+        else:
+            ctx.ip += 8
+        return ctx
+    return th_push_local_push_local_lt2_goto_if_false
+
+def thread_push_local_push_literal_lt2_goto_if_false(_op1, _op2, _op3, _op4, _op5, _op6, _op7):
+    def th_push_local_push_literal_lt2_goto_if_false(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        lit = ctx.form.literals[idx]
+        ctx.push(lit)
+        idx = _op5
+        proc = rebound_primitive(ctx, idx, less)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 6)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            test = a < b
+        else:
+            test = less(ctx.vm, a, b)
+        if test is False:
+            ctx.ip = _op7
+        else:
+            ctx.ip += 8
+        return ctx
+    return th_push_local_push_literal_lt2_goto_if_false
+
+def thread_push_local_null_p_goto_if_false(_op1, _op2, _op3, _op4, _op5):
+    def th_push_local_null_p_goto_if_false(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        proc = rebound_primitive(ctx, idx, prim_null_p)
+        if proc is not None:
+            return call_rebound(ctx, proc, 1, 4)
+        test = ctx.pop() is None
+        if test:
+            ctx.ip += 6
+        else:
+            ctx.ip = _op5
+        return ctx
+    return th_push_local_null_p_goto_if_false
+
+def thread_push_local_push_global_call(_op1, _op2, _op3, _op4, _op5):
+    def th_push_local_push_global_call(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        ctx.push(ctx.form.literals[idx].value)
+        argc = _op5
+        nctx = make_call(ctx, argc)
+
+        ctx.ip += 6
+        return nctx
+    return th_push_local_push_global_call
+
+def thread_push_global_call(_op1, _op2, _op3):
+    def th_push_global_call(ctx):
+        idx = _op1
+        ctx.push(ctx.form.literals[idx].value)
+        argc = _op3
+        nctx = make_call(ctx, argc)
+
+        ctx.ip += 4
+        return nctx
+    return th_push_global_call
+
+def thread_push_global_tail_call(_op1, _op2, _op3):
+    def th_push_global_tail_call(ctx):
+        idx = _op1
+        ctx.push(ctx.form.literals[idx].value)
+        argc = _op3
+        nctx = make_call(ctx, argc, tail=True)
+
+        ctx.ip += 4
+        return nctx
+    return th_push_global_tail_call
+
+def thread_push_local_push_1_sub2(_op1, _op2, _op3, _op4):
+    def th_push_local_push_1_sub2(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        ctx.push(1)
+        idx = _op4
+        proc = rebound_primitive(ctx, idx, minus)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 5)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a - b)
+        else:
+            ctx.push(minus(ctx.vm, a, b))
+        ctx.ip += 5
+        return ctx
+    return th_push_local_push_1_sub2
+
+def thread_push_local_push_literal_sub2(_op1, _op2, _op3, _op4, _op5):
+    def th_push_local_push_literal_sub2(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        lit = ctx.form.literals[idx]
+        ctx.push(lit)
+        idx = _op5
+        proc = rebound_primitive(ctx, idx, minus)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 6)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a - b)
+        else:
+            ctx.push(minus(ctx.vm, a, b))
+        ctx.ip += 6
+        return ctx
+    return th_push_local_push_literal_sub2
+
+def thread_push_local_push_local_lt2(_op1, _op2, _op3, _op4, _op5):
+    def th_push_local_push_local_lt2(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op5
+        proc = rebound_primitive(ctx, idx, less)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 6)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a < b)
+        else:
+            ctx.push(less(ctx.vm, a, b))
+        ctx.ip += 6
+        return ctx
+    return th_push_local_push_local_lt2
+
+def thread_push_local_push_literal_lt2(_op1, _op2, _op3, _op4, _op5):
+    def th_push_local_push_literal_lt2(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        lit = ctx.form.literals[idx]
+        ctx.push(lit)
+        idx = _op5
+        proc = rebound_primitive(ctx, idx, less)
+        if proc is not None:
+            return call_rebound(ctx, proc, 2, 6)
+        b = ctx.pop()
+        a = ctx.pop()
+        if type(a) is int and type(b) is int:
+            ctx.push(a < b)
+        else:
+            ctx.push(less(ctx.vm, a, b))
+        ctx.ip += 6
+        return ctx
+    return th_push_local_push_literal_lt2
+
+def thread_push_local_push_local(_op1, _op2, _op3):
+    def th_push_local_push_local(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        ctx.ip += 4
+    return th_push_local_push_local
+
+def thread_push_local_push_1(_op1, _op2):
+    def th_push_local_push_1(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        ctx.push(1)
+        ctx.ip += 3
+    return th_push_local_push_1
+
+def thread_push_local_push_literal(_op1, _op2, _op3):
+    def th_push_local_push_literal(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        lit = ctx.form.literals[idx]
+        ctx.push(lit)
+        ctx.ip += 4
+    return th_push_local_push_literal
+
+def thread_push_local_ret(_op1, _op2):
+    def th_push_local_ret(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        pctx = ctx.parent
+        if pctx.shared or pctx.one_shot is not None:
+            pctx = pctx.returned_to()
+        retval = ctx.pop()
+        pctx.push(retval)
+        return pctx
+    return th_push_local_ret
+
+def thread_push_local_null_p(_op1, _op2, _op3):
+    def th_push_local_null_p(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        proc = rebound_primitive(ctx, idx, prim_null_p)
+        if proc is not None:
+            return call_rebound(ctx, proc, 1, 4)
+        a = ctx.pop()
+        ctx.push(a is None)
+        ctx.ip += 4
+        return ctx
+    return th_push_local_null_p
+
+def thread_push_local_car(_op1, _op2, _op3):
+    def th_push_local_car(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        proc = rebound_primitive(ctx, idx, prim_first)
+        if proc is not None:
+            return call_rebound(ctx, proc, 1, 4)
+        a = ctx.pop()
+        if type(a) is Pair:
+            ctx.push(a.first)
+        else:
+            ctx.push(prim_first(ctx.vm, a))
+        ctx.ip += 4
+        return ctx
+    return th_push_local_car
+
+def thread_push_local_cdr(_op1, _op2, _op3):
+    def th_push_local_cdr(ctx):
+        idx = _op1
+        loc = ctx.env.read_local(idx)
+        ctx.push(loc)
+        idx = _op3
+        proc = rebound_primitive(ctx, idx, prim_rest)
+        if proc is not None:
+            return call_rebound(ctx, proc, 1, 4)
+        a = ctx.pop()
+        if type(a) is Pair:
+            ctx.push(a.rest)
+        else:
+            ctx.push(prim_rest(ctx.vm, a))
+        ctx.ip += 4
+        return ctx
+    return th_push_local_cdr
+
+def thread_set_local_set_local_goto(_op1, _op2, _op3, _op4, _op5):
+    def th_set_local_set_local_goto(ctx):
+        idx = _op1
+        val = ctx.pop()
+        ctx.env.assign_local(idx, val)
+        idx = _op3
+        val = ctx.pop()
+        ctx.env.assign_local(idx, val)
+        ip = _op5
+        ctx.ip = ip
+    return th_set_local_set_local_goto
+
+def thread_set_local_goto(_op1, _op2, _op3):
+    def th_set_local_goto(ctx):
+        idx = _op1
+        val = ctx.pop()
+        ctx.env.assign_local(idx, val)
+        ip = _op3
+        ctx.ip = ip
+    return th_set_local_goto
+
+
+INSN_THREADER = [
+    thread_ret,
+    thread_call,
+    thread_tail_call,
+    thread_call_cc,
+    thread_call_1cc,
+    thread_tail_call_cc,
+    thread_tail_call_1cc,
+    thread_native_step,
+    thread_pop,
+    thread_push_local,
+    thread_set_local,
+    thread_push_local_depth,
+    thread_set_local_depth,
+    thread_push_global,
+    thread_set_global,
+    thread_push_literal,
+    thread_push_0,
+    thread_push_1,
+    thread_push_nil,
+    thread_push_true,
+    thread_push_false,
+    thread_dup,
+    thread_goto,
+    thread_goto_if_not_false,
+    thread_goto_if_false,
+    thread_goto_if_rebound,
+    thread_make_closure,
+    thread_add2,
+    thread_sub2,
+    thread_mul2,
+    thread_lt2,
+    thread_gt2,
+    thread_le2,
+    thread_ge2,
+    thread_num_eq2,
+    thread_car,
+    thread_cdr,
+    thread_cons,
+    thread_null_p,
+    thread_not,
+    thread_eq_p,
+    thread_vector_ref,
+    thread_vector_set,
+    thread_lt2_goto_if_false,
+    thread_gt2_goto_if_false,
+    thread_le2_goto_if_false,
+    thread_ge2_goto_if_false,
+    thread_num_eq2_goto_if_false,
+    thread_eq_p_goto_if_false,
+    thread_null_p_goto_if_false,
+    thread_not_goto_if_false,
+    thread_push_local_push_0_num_eq2_goto_if_false,
+    thread_push_local_push_local_lt2_goto_if_false,
+    thread_push_local_push_literal_lt2_goto_if_false,
+    thread_push_local_null_p_goto_if_false,
+    thread_push_local_push_global_call,
+    thread_push_global_call,
+    thread_push_global_tail_call,
+    thread_push_local_push_1_sub2,
+    thread_push_local_push_literal_sub2,
+    thread_push_local_push_local_lt2,
+    thread_push_local_push_literal_lt2,
+    thread_push_local_push_local,
+    thread_push_local_push_1,
+    thread_push_local_push_literal,
+    thread_push_local_ret,
+    thread_push_local_null_p,
+    thread_push_local_car,
+    thread_push_local_cdr,
+    thread_set_local_set_local_goto,
+    thread_set_local_goto
+]
+
+INSN_LENGTH = [
+    1,
+    2,
+    2,
+    1,
+    1,
+    1,
+    1,
+    1,
+    1,
+    2,
+    2,
+    3,
+    3,
+    2,
+    2,
+    2,
+    1,
+    1,
+    1,
+    1,
+    1,
+    1,
+    2,
+    2,
+    2,
+    4,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    4,
+    4,
+    4,
+    4,
+    4,
+    4,
+    4,
+    4,
+    7,
+    8,
+    8,
+    6,
+    6,
+    4,
+    4,
+    5,
+    6,
+    6,
+    6,
+    4,
+    3,
+    4,
+    3,
+    4,
+    4,
+    4,
+    6,
+    4
+]
+
+INSN_STEP = [
+    1,
+    2,
+    2,
+    1,
+    1,
+    1,
+    1,
+    1,
+    1,
+    2,
+    2,
+    3,
+    3,
+    2,
+    2,
+    2,
+    1,
+    1,
+    1,
+    1,
+    1,
+    1,
+    2,
+    2,
+    2,
+    4,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2,
+    2
+]
+
+
+INSN_TAGS = [
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    TAG_CTRL_FLOW,
+    TAG_CTRL_FLOW,
+    TAG_CTRL_FLOW,
+    TAG_CTRL_FLOW,
+    0,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    0,
+    0,
+    0,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTX_SWITCH | TAG_CTRL_FLOW,
+    TAG_CTRL_FLOW,
+    TAG_CTRL_FLOW
+]
+
+
+
+def has_tag(opcode, tag):
+    return INSN_TAGS[opcode] & tag == tag
+
+def get_param(ctx, n):
+    return ctx.bytecode[ctx.ip+n]
+
+def run(ctx):
+    try:
+        while ctx.ip < len(ctx.bytecode):
+            opcode = ctx.bytecode[ctx.ip]
+            nctx = INSN_ACTION[opcode](ctx)
+            if has_tag(opcode, TAG_CTX_SWITCH):
+                ctx = nctx
+        return ctx.pop()
+    except Exception, e:
+        add_traceback(e, ctx)
+        raise
+
+# Pre-decode bytecode into threaded code: a list parallel to the
+# bytecode where the slot at the ip of each instruction holds the
+# handler for it. An extra halt handler is put at the end. The
+# components of a superinstruction get their own handlers too, so
+# that they can be jumped to.
+def thread_bytecode(bytecode):
+    code = [None] * (len(bytecode)+1)
+    ip = 0
+    while ip < len(bytecode):
+        opcode = bytecode[ip]
+        length = INSN_LENGTH[opcode]
+        code[ip] = INSN_THREADER[opcode](*bytecode[ip+1:ip+length])
+        ip += INSN_STEP[opcode]
+    code[-1] = th_halt
+    return code
+
+def run_threaded(ctx):
+    code = ctx.threaded
+    try:
+        while True:
+            nctx = code[ctx.ip](ctx)
+            if nctx is not None:
+                if nctx is HALT:
+                    return ctx.pop()
+                ctx = nctx
+                code = ctx.threaded
+    except Exception, e:
+        add_traceback(e, ctx)
+        raise
+
+# Get the value of the global variable holding an inlined primitive if
+# it doesn't hold the primitive implemented by func any more. Return
+# None if it still does.
+def rebound_primitive(ctx, idx, func):
+    proc = ctx.form.literals[idx].value
+    if type(proc) is PyPrimitive and proc.proc is func:
+        return None
+    return proc
+
+# Make a real call instead of running an inlined primitive. The
+# arguments are already on the stack.
+def call_rebound(ctx, proc, argc, insn_len):
+    ctx.push(proc)
+    nctx = make_call(ctx, argc)
+    ctx.ip += insn_len
+    return nctx
+
+# The code of the contexts running an EnginePrimitive in the dispatch
+# loop. The native_step instruction runs step(ctx), which either makes
+# the next call of a procedure, whose value is pushed onto ctx when it
+# returns, or pushes the value of the primitive and moves to the ret
+# following it. The state of the primitive is kept on the stack of ctx,
+# so that the continuations captured in the calls have their own copy
+# of it.
+class NativeCode(object):
+    def __init__(self, name, step):
+        self.name = name
+        self.step = step
+        self.filename = '<primitive>'
+        self.bytecode = [INSN_MAP['native_step'].opcode, INSN_MAP['ret'].opcode]
+        self.threaded = thread_bytecode(self.bytecode)
+
+    def line_of(self, ip):
+        return None
+
+    def __reduce__(self):
+        # pickled by reference, see NATIVE_CODE
+        return (native_code, (self.name,))
+
+def native_code(name):
+    return NATIVE_CODE[name]
+
+# Pushed instead of the value of a call when a native context starts
+START = object()
+
+# Make a context running code with state, see NativeCode
+def enter_native(ctx, code, state, tail):
+    if tail:
+        parent = ctx.parent
+    else:
+        parent = ctx
+    nctx = ctx.vm.context_t(code, ctx.env, parent)
+    nctx.push(state)
+    nctx.push(START)
+    return nctx
+
+# Make the next call of a native context
+def native_call(ctx, proc, args):
+    if type(proc) is Procedure:
+        code = proc.code
+        code.check_arity(len(args))
+        return ctx.vm.context_t(code, code.make_frame(proc.lexical_parent, args), ctx)
+    for x in args:
+        ctx.push(x)
+    ctx.push(proc)
+    return make_call(ctx, len(args))
+
+# End a native context with value
+def native_return(ctx, value):
+    ctx.push(value)
+    ctx.ip = 1
+    return ctx
+
+# Get the arguments of the next call of map or for-each from a tuple of
+# lists, and the rests of the lists. The arguments are None at the end.
+def native_args(lists, name):
+    if len(lists) == 1:
+        lst = lists[0]
+        if type(lst) is Pair:
+            return [lst.first], (lst.rest,)
+        if lst is None:
+            return None, lists
+        raise WrongArgType("Arguments of %s should be valid lists." % name)
+    lists = list(lists)
+    args = next_args(lists, name)
+    return args, tuple(lists)
+
+# The state of map is the procedure, the rest of the lists and the
+# number of values under it. The values of the contexts are on the top
+# of ctx.stack, with or without a shared stack. The plain primitives are
+# called right away instead of going through the engine.
+def map_step(ctx):
+    stack = ctx.stack
+    value = stack.pop()
+    proc, lists, count = stack.pop()
+    if value is not START:
+        stack.append(value)
+        count += 1
+    while True:
+        args, lists = native_args(lists, 'map')
+        if args is None:
+            res = None
+            for x in reversed(ctx.pop_list(count)):
+                res = Pair(x, res)
+            return native_return(ctx, res)
+        if type(proc) is not PyPrimitive:
+            break
+        proc.check_arity(len(args))
+        stack.append(proc.apply(ctx.vm, args))
+        count += 1
+    stack.append((proc, lists, count))
+    return native_call(ctx, proc, args)
+
+# The state of for-each is the procedure and the rest of the lists
+def for_each_step(ctx):
+    stack = ctx.stack
+    stack.pop()
+    proc, lists = stack.pop()
+    while True:
+        args, lists = native_args(lists, 'for-each')
+        if args is None:
+            return native_return(ctx, None)
+        if type(proc) is not PyPrimitive:
+            break
+        proc.check_arity(len(args))
+        proc.apply(ctx.vm, args)
+    stack.append((proc, lists))
+    return native_call(ctx, proc, args)
+
+NATIVE_CODE = {
+    'map' : NativeCode('map', map_step),
+    'for-each' : NativeCode('for-each', for_each_step),
+}
+
+def enter_map(ctx, proc, argc, tail):
+    args = ctx.pop_list(argc)
+    return enter_native(ctx, NATIVE_CODE['map'], (args[0], tuple(args[1:]), 0), tail)
+
+def enter_for_each(ctx, proc, argc, tail):
+    args = ctx.pop_list(argc)
+    return enter_native(ctx, NATIVE_CODE['for-each'], (args[0], tuple(args[1:])), tail)
+
+# Replace the arguments of apply on the stack with the arguments it
+# applies the procedure to, and call it
+def enter_apply(ctx, proc, argc, tail):
+    args = ctx.pop_list(argc)
+    for x in args[1:-1]:
+        ctx.push(x)
+    argc -= 2
+    if len(args) > 1:
+        lst = args[-1]
+        while isinstance(lst, Pair):
+            ctx.push(lst.first)
+            lst = lst.rest
+            argc += 1
+        if lst is not None:
+            raise WrongArgType("The last argument of apply should be a valid list, but got %s" % args[-1])
+    else:
+        argc = 0
+    ctx.push(args[0])
+    return make_call(ctx, argc, tail)
+
+# How the engines call the EnginePrimitives, by their procs: with the
+# arguments on the stack, return the next context
+ENGINE_PRIMITIVES = {
+    prim_apply : enter_apply,
+    prim_map : enter_map,
+    prim_for_each : enter_for_each,
+}
+
+def make_call(ctx, argc, tail=False):
+    proc = ctx.pop()
+    if tail:
+        parent = ctx.parent
+    else:
+        parent = ctx
+
+    if isinstance(proc, Procedure):
+        code = proc.code
+        code.check_arity(argc)
+        nctx = ctx.vm.context_t(code,
+                                code.make_frame(proc.lexical_parent, ctx.pop_list(argc)),
+                                parent)
+
+    elif isinstance(proc, Primitive):
+        proc.check_arity(argc)
+        if type(proc) is EnginePrimitive:
+            # e.g. apply calls the procedure like a call instruction, so
+            # it can be a tail-call too
+            return ENGINE_PRIMITIVES[proc.proc](ctx, proc, argc, tail)
+        args = ctx.pop_list(argc)
+
+        nctx = parent
+        if nctx.shared or nctx.one_shot is not None:
+            nctx = nctx.returned_to()
+        nctx.push(proc.apply(ctx.vm, args))
+
+    elif isinstance(proc, Continuation):
+        if argc > 1:
+            raise WrongArgNumber("Continuation only accept 1 argument")
+        if argc == 1:
+            value = ctx.pop()
+        else:
+            value = None
+        nctx = proc.resume(ctx)
+        nctx.push(value)
+
+    else:
+        raise WrongArgType("Not a skime callable: %s" % proc)
+
+    return nctx
@@ -0,0 +1,780 @@
+# Don't edit this file. This is generated by iset_gen.py
+
+class Instruction(object):
+    __slots__ = ('opcode',
+                 'name',
+                 'tags',
+                 'desc',
+                 'operands',
+                 'stack_before',
+                 'stack_after',
+                 'code',
+                 'components')
+    def __init__(self, opcode, name, tags, desc, operands,
+                 stack_before, stack_after, code, components):
+        self.opcode = opcode
+        self.name = name
+        self.tags = tags
+        self.desc = desc
+        self.operands = operands
+        self.stack_before = stack_before
+        self.stack_after = stack_after
+        self.code = code
+        # Names of the fused instructions of a superinstruction
+        self.components = components
+
+    def length_get(self):
+        return len(self.operands)+1
+    def length_set(self):
+        raise AttributeError, 'length attribute is read only'
+    length = property(length_get, length_set, 'length of the instruction')
+
+INSTRUCTIONS = [
+Instruction(0,
+            'ret',
+            ['ctx_switch', 'ctrl_flow'],
+            'Return from a procedure.',
+            [],
+            [],
+            [],
+            'pctx = ctx.parent\nif pctx.shared or pctx.one_shot is not None:\n    pctx = pctx.returned_to()\nretval = ctx.pop()\npctx.push(retval)\nreturn pctx\n',
+            []),
+Instruction(1,
+            'call',
+            ['ctx_switch', 'ctrl_flow'],
+            'Call a procedure.',
+            ['argc'],
+            ['...', 'proc'],
+            ['retval'],
+            'argc = get_param(ctx, 1)\nnctx = make_call(ctx, argc)\n\nctx.ip += $(insn_len)\nreturn nctx\n',
+            []),
+Instruction(2,
+            'tail_call',
+            ['ctx_switch', 'ctrl_flow'],
+            'Call a procedure with tail-call.',
+            ['argc'],
+            ['...', 'proc'],
+            ['retval'],
+            'argc = get_param(ctx, 1)\nnctx = make_call(ctx, argc, tail=True)\n\nctx.ip += $(insn_len)\nreturn nctx\n',
+            []),
+Instruction(3,
+            'call_cc',
+            ['ctx_switch', 'ctrl_flow'],
+            'Call with current continuation.',
+            [],
+            ['lambda'],
+            ['return_value'],
+            'cc = Continuation(ctx, $(insn_len), 1)\nctx.insert(-1, cc)\n\nnctx = make_call(ctx, 1)\nctx.ip += $(insn_len)\nreturn nctx\n',
+            []),
+Instruction(4,
+            'call_1cc',
+            ['ctx_switch', 'ctrl_flow'],
+            'Call with current continuation, which can only be invoked once.',
+            [],
+            ['lambda'],
+            ['return_value'],
+            'cc = Continuation(ctx, $(insn_len), 1, one_shot=True)\nctx.insert(-1, cc)\n\nnctx = make_call(ctx, 1)\nctx.ip += $(insn_len)\nreturn nctx\n',
+            []),
+Instruction(5,
+            'tail_call_cc',
+            ['ctx_switch', 'ctrl_flow'],
+            'Call with current continuation with tail-call.',
+            [],
+            ['lambda'],
+            ['return_value'],
+            'cc = Continuation(ctx, $(insn_len), 1)\nctx.insert(-1, cc)\n\nnctx = make_call(ctx, 1, tail=True)\nctx.ip += $(insn_len)\nreturn nctx\n',
+            []),
+Instruction(6,
+            'tail_call_1cc',
+            ['ctx_switch', 'ctrl_flow'],
+            'Call with one-shot current continuation with tail-call.',
+            [],
+            ['lambda'],
+            ['return_value'],
+            'cc = Continuation(ctx, $(insn_len), 1, one_shot=True, tail=True)\nctx.insert(-1, cc)\n\nnctx = make_call(ctx, 1, tail=True)\nctx.ip += $(insn_len)\nreturn nctx\n',
+            []),
+Instruction(7,
+            'native_step',
+            ['ctx_switch', 'ctrl_flow'],
+            'Run a step of a primitive calling procedures.',
+            [],
+            ['...'],
+            ['...'],
+            'return ctx.form.step(ctx)\n',
+            []),
+Instruction(8,
+            'pop',
+            [],
+            'Pop the value off from the operand stack.',
+            [],
+            ['value'],
+            [],
+            'ctx.pop()\n',
+            []),
+Instruction(9,
+            'push_local',
+            [],
+            'Push value of a local variable to operand stack.',
+            ['local'],
+            [],
+            ['value'],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\n',
+            []),
+Instruction(10,
+            'set_local',
+            [],
+            'Pop the stack top and assign it to a local variable.',
+            ['local'],
+            ['value'],
+            [],
+            'idx = get_param(ctx, 1)\nval = ctx.pop()\nctx.env.assign_local(idx, val)\n',
+            []),
+Instruction(11,
+            'push_local_depth',
+            [],
+            'Push value of a local in lexical parent to operand stack.',
+            ['depth', 'local'],
+            [],
+            ['value'],
+            'depth = get_param(ctx, 1)\nidx = get_param(ctx, 2)\n\npenv = ctx.env\nwhile depth > 0:\n    penv = penv.parent\n    depth -= 1\nloc = penv.read_local(idx)\nctx.push(loc)\n',
+            []),
+Instruction(12,
+            'set_local_depth',
+            [],
+            'Pop a value and assign to a local variable of lexical parent.',
+            ['depth', 'local'],
+            ['value'],
+            [],
+            'depth = get_param(ctx, 1)\nidx = get_param(ctx, 2)\nvalue = ctx.pop()\n\npenv = ctx.env\nwhile depth > 0:\n    penv = penv.parent\n    depth -= 1\npenv.assign_local(idx, value)\n',
+            []),
+Instruction(13,
+            'push_global',
+            [],
+            'Push value of a global variable, held in a Cell in literals.',
+            ['cell'],
+            [],
+            ['value'],
+            'idx = get_param(ctx, 1)\nctx.push(ctx.form.literals[idx].value)\n',
+            []),
+Instruction(14,
+            'set_global',
+            [],
+            'Pop the stack top and assign it to a global variable, held in a Cell in literals.',
+            ['cell'],
+            ['value'],
+            [],
+            'idx = get_param(ctx, 1)\nctx.form.literals[idx].value = ctx.pop()\n',
+            []),
+Instruction(15,
+            'push_literal',
+            [],
+            'Push a literal to operand stack.',
+            ['literal'],
+            [],
+            ['value'],
+            'idx = get_param(ctx, 1)\nlit = ctx.form.literals[idx]\nctx.push(lit)\n',
+            []),
+Instruction(16,
+            'push_0',
+            [],
+            'Push 0 to operand stack.',
+            [],
+            [],
+            [0],
+            'ctx.push(0)\n',
+            []),
+Instruction(17,
+            'push_1',
+            [],
+            'Push 1 to operand stack.',
+            [],
+            [],
+            [0],
+            'ctx.push(1)\n',
+            []),
+Instruction(18,
+            'push_nil',
+            [],
+            'Push None to oeprand stack.',
+            [],
+            [],
+            ['None'],
+            'ctx.push(None)\n',
+            []),
+Instruction(19,
+            'push_true',
+            [],
+            'Push True to oeprand stack.',
+            [],
+            [],
+            [True],
+            'ctx.push(True)\n',
+            []),
+Instruction(20,
+            'push_false',
+            [],
+            'Push False to oeprand stack.',
+            [],
+            [],
+            [False],
+            'ctx.push(False)\n',
+            []),
+Instruction(21,
+            'dup',
+            [],
+            'Duplicate the stack top object.',
+            [],
+            [],
+            ['value'],
+            'ctx.push(ctx.top())\n',
+            []),
+Instruction(22,
+            'goto',
+            ['ctrl_flow'],
+            'Unconditional jump.',
+            ['ip'],
+            [],
+            [],
+            'ip = get_param(ctx, 1)\nctx.ip = ip\n',
+            []),
+Instruction(23,
+            'goto_if_not_false',
+            ['ctrl_flow'],
+            'Jump if the stack top is not False.',
+            ['ip'],
+            ['condition'],
+            [],
+            'ip = get_param(ctx, 1)\ncond = ctx.pop()\nif cond is not False:\n    ctx.ip = ip\nelse:\n    ctx.ip += $(insn_len)\n',
+            []),
+Instruction(24,
+            'goto_if_false',
+            ['ctrl_flow'],
+            'Jump if the stack top is False.',
+            ['ip'],
+            ['condition'],
+            [],
+            'ip = get_param(ctx, 1)\ncond = ctx.pop()\nif cond is False:\n    ctx.ip = ip\nelse:\n    ctx.ip += $(insn_len)\n',
+            []),
+Instruction(25,
+            'goto_if_rebound',
+            ['ctrl_flow'],
+            'Jump if the global variable no longer holds the inlined procedure.',
+            ['cell', 'proc', 'ip'],
+            [],
+            [],
+            'cell = ctx.form.literals[get_param(ctx, 1)]\nif cell.value is ctx.form.literals[get_param(ctx, 2)]:\n    ctx.ip += $(insn_len)\nelse:\n    ctx.ip = get_param(ctx, 3)\n',
+            []),
+Instruction(26,
+            'make_closure',
+            [],
+            'Make a procedure from the code in literals, closing over the current environment.',
+            ['idx'],
+            [],
+            ['procedure'],
+            'idx = get_param(ctx, 1)\nctx.push(Procedure(ctx.form.literals[idx], ctx.env))\n',
+            []),
+Instruction(27,
+            'add2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of + with two arguments.',
+            ['cell'],
+            ['a', 'b'],
+            ['a+b'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, plus)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a + b)\nelse:\n    ctx.push(plus(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(28,
+            'sub2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of - with two arguments.',
+            ['cell'],
+            ['a', 'b'],
+            ['a-b'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, minus)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a - b)\nelse:\n    ctx.push(minus(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(29,
+            'mul2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of * with two arguments.',
+            ['cell'],
+            ['a', 'b'],
+            ['a*b'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, mul)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a * b)\nelse:\n    ctx.push(mul(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(30,
+            'lt2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of < with two arguments.',
+            ['cell'],
+            ['a', 'b'],
+            ['a<b'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, less)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a < b)\nelse:\n    ctx.push(less(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(31,
+            'gt2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of > with two arguments.',
+            ['cell'],
+            ['a', 'b'],
+            ['a>b'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, more)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a > b)\nelse:\n    ctx.push(more(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(32,
+            'le2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of <= with two arguments.',
+            ['cell'],
+            ['a', 'b'],
+            ['a<=b'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, less_equal)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a <= b)\nelse:\n    ctx.push(less_equal(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(33,
+            'ge2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of >= with two arguments.',
+            ['cell'],
+            ['a', 'b'],
+            ['a>=b'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, more_equal)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a >= b)\nelse:\n    ctx.push(more_equal(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(34,
+            'num_eq2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of = with two arguments.',
+            ['cell'],
+            ['a', 'b'],
+            ['a=b'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, equal)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a == b)\nelse:\n    ctx.push(equal(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(35,
+            'car',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of car (or first).',
+            ['cell'],
+            ['a'],
+            ['car'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, prim_first)\nif proc is not None:\n    return call_rebound(ctx, proc, 1, $(insn_len))\na = ctx.pop()\nif type(a) is Pair:\n    ctx.push(a.first)\nelse:\n    ctx.push(prim_first(ctx.vm, a))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(36,
+            'cdr',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of cdr (or rest).',
+            ['cell'],
+            ['a'],
+            ['cdr'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, prim_rest)\nif proc is not None:\n    return call_rebound(ctx, proc, 1, $(insn_len))\na = ctx.pop()\nif type(a) is Pair:\n    ctx.push(a.rest)\nelse:\n    ctx.push(prim_rest(ctx.vm, a))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(37,
+            'cons',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of cons (or pair).',
+            ['cell'],
+            ['a', 'b'],
+            ['pair'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, prim_pair)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nctx.push(Pair(a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(38,
+            'null_p',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of null?.',
+            ['cell'],
+            ['a'],
+            ['boolean'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, prim_null_p)\nif proc is not None:\n    return call_rebound(ctx, proc, 1, $(insn_len))\na = ctx.pop()\nctx.push(a is None)\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(39,
+            'not',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of not.',
+            ['cell'],
+            ['a'],
+            ['boolean'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, prim_not)\nif proc is not None:\n    return call_rebound(ctx, proc, 1, $(insn_len))\na = ctx.pop()\nctx.push(a is False)\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(40,
+            'eq_p',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of eq? (or eqv?).',
+            ['cell'],
+            ['a', 'b'],
+            ['boolean'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, prim_eqv)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nctx.push(a is b)\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(41,
+            'vector_ref',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of vector-ref.',
+            ['cell'],
+            ['vector', 'k'],
+            ['element'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, prim_vector_ref)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nk = ctx.pop()\na = ctx.pop()\nif type(a) is Vector and type(k) is int and 0 <= k < len(a.items):\n    ctx.push(a.items[k])\nelse:\n    ctx.push(prim_vector_ref(ctx.vm, a, k))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(42,
+            'vector_set',
+            ['ctx_switch', 'ctrl_flow'],
+            'Inlined call of vector-set!.',
+            ['cell'],
+            ['vector', 'k', 'obj'],
+            ['unspecified'],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, prim_vector_set_x)\nif proc is not None:\n    return call_rebound(ctx, proc, 3, $(insn_len))\nb = ctx.pop()\nk = ctx.pop()\na = ctx.pop()\nif type(a) is Vector and type(k) is int and 0 <= k < len(a.items) and \\\n       (type(b) is not bool or type(a.items) is list):\n    try:\n        a.items[k] = b\n    except (TypeError, OverflowError):\n        # refused by the array of a numeric vector\n        prim_vector_set_x(ctx.vm, a, k, b)\nelse:\n    prim_vector_set_x(ctx.vm, a, k, b)\nctx.push(None)\nctx.ip += $(insn_len)\nreturn ctx\n',
+            []),
+Instruction(43,
+            'lt2_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of lt2, goto_if_false.',
+            ['cell', '<goto_if_false>', 'ip'],
+            ['a', 'b'],
+            [],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, less)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, 2)\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    test = a < b\nelse:\n    test = less(ctx.vm, a, b)\nif test is False:\n    ctx.ip = get_param(ctx, 3)\nelse:\n    ctx.ip += $(insn_len)\nreturn ctx\n',
+            ['lt2', 'goto_if_false']),
+Instruction(44,
+            'gt2_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of gt2, goto_if_false.',
+            ['cell', '<goto_if_false>', 'ip'],
+            ['a', 'b'],
+            [],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, more)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, 2)\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    test = a > b\nelse:\n    test = more(ctx.vm, a, b)\nif test is False:\n    ctx.ip = get_param(ctx, 3)\nelse:\n    ctx.ip += $(insn_len)\nreturn ctx\n',
+            ['gt2', 'goto_if_false']),
+Instruction(45,
+            'le2_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of le2, goto_if_false.',
+            ['cell', '<goto_if_false>', 'ip'],
+            ['a', 'b'],
+            [],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, less_equal)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, 2)\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    test = a <= b\nelse:\n    test = less_equal(ctx.vm, a, b)\nif test is False:\n    ctx.ip = get_param(ctx, 3)\nelse:\n    ctx.ip += $(insn_len)\nreturn ctx\n',
+            ['le2', 'goto_if_false']),
+Instruction(46,
+            'ge2_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of ge2, goto_if_false.',
+            ['cell', '<goto_if_false>', 'ip'],
+            ['a', 'b'],
+            [],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, more_equal)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, 2)\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    test = a >= b\nelse:\n    test = more_equal(ctx.vm, a, b)\nif test is False:\n    ctx.ip = get_param(ctx, 3)\nelse:\n    ctx.ip += $(insn_len)\nreturn ctx\n',
+            ['ge2', 'goto_if_false']),
+Instruction(47,
+            'num_eq2_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of num_eq2, goto_if_false.',
+            ['cell', '<goto_if_false>', 'ip'],
+            ['a', 'b'],
+            [],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, equal)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, 2)\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    test = a == b\nelse:\n    test = equal(ctx.vm, a, b)\nif test is False:\n    ctx.ip = get_param(ctx, 3)\nelse:\n    ctx.ip += $(insn_len)\nreturn ctx\n',
+            ['num_eq2', 'goto_if_false']),
+Instruction(48,
+            'eq_p_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of eq_p, goto_if_false.',
+            ['cell', '<goto_if_false>', 'ip'],
+            ['a', 'b'],
+            [],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, prim_eqv)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, 2)\nb = ctx.pop()\na = ctx.pop()\ntest = a is b\nif test:\n    ctx.ip += $(insn_len)\nelse:\n    ctx.ip = get_param(ctx, 3)\nreturn ctx\n',
+            ['eq_p', 'goto_if_false']),
+Instruction(49,
+            'null_p_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of null_p, goto_if_false.',
+            ['cell', '<goto_if_false>', 'ip'],
+            ['a'],
+            [],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, prim_null_p)\nif proc is not None:\n    return call_rebound(ctx, proc, 1, 2)\ntest = ctx.pop() is None\nif test:\n    ctx.ip += $(insn_len)\nelse:\n    ctx.ip = get_param(ctx, 3)\nreturn ctx\n',
+            ['null_p', 'goto_if_false']),
+Instruction(50,
+            'not_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of not, goto_if_false.',
+            ['cell', '<goto_if_false>', 'ip'],
+            ['a'],
+            [],
+            'idx = get_param(ctx, 1)\nproc = rebound_primitive(ctx, idx, prim_not)\nif proc is not None:\n    return call_rebound(ctx, proc, 1, 2)\ntest = ctx.pop() is False\nif test:\n    ctx.ip += $(insn_len)\nelse:\n    ctx.ip = get_param(ctx, 3)\nreturn ctx\n',
+            ['not', 'goto_if_false']),
+Instruction(51,
+            'push_local_push_0_num_eq2_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, push_0, num_eq2, goto_if_false.',
+            ['local', '<push_0>', '<num_eq2>', 'cell', '<goto_if_false>', 'ip'],
+            [],
+            [],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nctx.push(0)\nidx = get_param(ctx, 4)\nproc = rebound_primitive(ctx, idx, equal)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, 5)\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    test = a == b\nelse:\n    test = equal(ctx.vm, a, b)\nif test is False:\n    ctx.ip = get_param(ctx, 6)\nelse:\n    ctx.ip += $(insn_len)\nreturn ctx\n',
+            ['push_local', 'push_0', 'num_eq2', 'goto_if_false']),
+Instruction(52,
+            'push_local_push_local_lt2_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, push_local, lt2, goto_if_false.',
+            ['local', '<push_local>', 'local', '<lt2>', 'cell', '<goto_if_false>', 'ip'],
+            [],
+            [],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 5)\nproc = rebound_primitive(ctx, idx, less)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, 6)\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    test = a < b\nelse:\n    test = less(ctx.vm, a, b)\nif test is False:\n    ctx.ip = get_param(ctx, 7)\nelse:\n    ctx.ip += $(insn_len)\nreturn ctx\n',
+            ['push_local', 'push_local', 'lt2', 'goto_if_false']),
+Instruction(53,
+            'push_local_push_literal_lt2_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, push_literal, lt2, goto_if_false.',
+            ['local', '<push_literal>', 'literal', '<lt2>', 'cell', '<goto_if_false>', 'ip'],
+            [],
+            [],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nlit = ctx.form.literals[idx]\nctx.push(lit)\nidx = get_param(ctx, 5)\nproc = rebound_primitive(ctx, idx, less)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, 6)\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    test = a < b\nelse:\n    test = less(ctx.vm, a, b)\nif test is False:\n    ctx.ip = get_param(ctx, 7)\nelse:\n    ctx.ip += $(insn_len)\nreturn ctx\n',
+            ['push_local', 'push_literal', 'lt2', 'goto_if_false']),
+Instruction(54,
+            'push_local_null_p_goto_if_false',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, null_p, goto_if_false.',
+            ['local', '<null_p>', 'cell', '<goto_if_false>', 'ip'],
+            [],
+            [],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nproc = rebound_primitive(ctx, idx, prim_null_p)\nif proc is not None:\n    return call_rebound(ctx, proc, 1, 4)\ntest = ctx.pop() is None\nif test:\n    ctx.ip += $(insn_len)\nelse:\n    ctx.ip = get_param(ctx, 5)\nreturn ctx\n',
+            ['push_local', 'null_p', 'goto_if_false']),
+Instruction(55,
+            'push_local_push_global_call',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, push_global, call.',
+            ['local', '<push_global>', 'cell', '<call>', 'argc'],
+            [],
+            ['retval'],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nctx.push(ctx.form.literals[idx].value)\nargc = get_param(ctx, 5)\nnctx = make_call(ctx, argc)\n\nctx.ip += $(insn_len)\nreturn nctx\n',
+            ['push_local', 'push_global', 'call']),
+Instruction(56,
+            'push_global_call',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_global, call.',
+            ['cell', '<call>', 'argc'],
+            [],
+            ['retval'],
+            'idx = get_param(ctx, 1)\nctx.push(ctx.form.literals[idx].value)\nargc = get_param(ctx, 3)\nnctx = make_call(ctx, argc)\n\nctx.ip += $(insn_len)\nreturn nctx\n',
+            ['push_global', 'call']),
+Instruction(57,
+            'push_global_tail_call',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_global, tail_call.',
+            ['cell', '<tail_call>', 'argc'],
+            [],
+            ['retval'],
+            'idx = get_param(ctx, 1)\nctx.push(ctx.form.literals[idx].value)\nargc = get_param(ctx, 3)\nnctx = make_call(ctx, argc, tail=True)\n\nctx.ip += $(insn_len)\nreturn nctx\n',
+            ['push_global', 'tail_call']),
+Instruction(58,
+            'push_local_push_1_sub2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, push_1, sub2.',
+            ['local', '<push_1>', '<sub2>', 'cell'],
+            [],
+            ['a-b'],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nctx.push(1)\nidx = get_param(ctx, 4)\nproc = rebound_primitive(ctx, idx, minus)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a - b)\nelse:\n    ctx.push(minus(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            ['push_local', 'push_1', 'sub2']),
+Instruction(59,
+            'push_local_push_literal_sub2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, push_literal, sub2.',
+            ['local', '<push_literal>', 'literal', '<sub2>', 'cell'],
+            [],
+            ['a-b'],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nlit = ctx.form.literals[idx]\nctx.push(lit)\nidx = get_param(ctx, 5)\nproc = rebound_primitive(ctx, idx, minus)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a - b)\nelse:\n    ctx.push(minus(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            ['push_local', 'push_literal', 'sub2']),
+Instruction(60,
+            'push_local_push_local_lt2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, push_local, lt2.',
+            ['local', '<push_local>', 'local', '<lt2>', 'cell'],
+            [],
+            ['a<b'],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 5)\nproc = rebound_primitive(ctx, idx, less)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a < b)\nelse:\n    ctx.push(less(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            ['push_local', 'push_local', 'lt2']),
+Instruction(61,
+            'push_local_push_literal_lt2',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, push_literal, lt2.',
+            ['local', '<push_literal>', 'literal', '<lt2>', 'cell'],
+            [],
+            ['a<b'],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nlit = ctx.form.literals[idx]\nctx.push(lit)\nidx = get_param(ctx, 5)\nproc = rebound_primitive(ctx, idx, less)\nif proc is not None:\n    return call_rebound(ctx, proc, 2, $(insn_len))\nb = ctx.pop()\na = ctx.pop()\nif type(a) is int and type(b) is int:\n    ctx.push(a < b)\nelse:\n    ctx.push(less(ctx.vm, a, b))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            ['push_local', 'push_literal', 'lt2']),
+Instruction(62,
+            'push_local_push_local',
+            [],
+            'Superinstruction of push_local, push_local.',
+            ['local', '<push_local>', 'local'],
+            [],
+            ['value'],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\n',
+            ['push_local', 'push_local']),
+Instruction(63,
+            'push_local_push_1',
+            [],
+            'Superinstruction of push_local, push_1.',
+            ['local', '<push_1>'],
+            [],
+            [0],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nctx.push(1)\n',
+            ['push_local', 'push_1']),
+Instruction(64,
+            'push_local_push_literal',
+            [],
+            'Superinstruction of push_local, push_literal.',
+            ['local', '<push_literal>', 'literal'],
+            [],
+            ['value'],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nlit = ctx.form.literals[idx]\nctx.push(lit)\n',
+            ['push_local', 'push_literal']),
+Instruction(65,
+            'push_local_ret',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, ret.',
+            ['local', '<ret>'],
+            [],
+            [],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\npctx = ctx.parent\nif pctx.shared or pctx.one_shot is not None:\n    pctx = pctx.returned_to()\nretval = ctx.pop()\npctx.push(retval)\nreturn pctx\n',
+            ['push_local', 'ret']),
+Instruction(66,
+            'push_local_null_p',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, null_p.',
+            ['local', '<null_p>', 'cell'],
+            [],
+            ['boolean'],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nproc = rebound_primitive(ctx, idx, prim_null_p)\nif proc is not None:\n    return call_rebound(ctx, proc, 1, $(insn_len))\na = ctx.pop()\nctx.push(a is None)\nctx.ip += $(insn_len)\nreturn ctx\n',
+            ['push_local', 'null_p']),
+Instruction(67,
+            'push_local_car',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, car.',
+            ['local', '<car>', 'cell'],
+            [],
+            ['car'],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nproc = rebound_primitive(ctx, idx, prim_first)\nif proc is not None:\n    return call_rebound(ctx, proc, 1, $(insn_len))\na = ctx.pop()\nif type(a) is Pair:\n    ctx.push(a.first)\nelse:\n    ctx.push(prim_first(ctx.vm, a))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            ['push_local', 'car']),
+Instruction(68,
+            'push_local_cdr',
+            ['ctx_switch', 'ctrl_flow'],
+            'Superinstruction of push_local, cdr.',
+            ['local', '<cdr>', 'cell'],
+            [],
+            ['cdr'],
+            'idx = get_param(ctx, 1)\nloc = ctx.env.read_local(idx)\nctx.push(loc)\nidx = get_param(ctx, 3)\nproc = rebound_primitive(ctx, idx, prim_rest)\nif proc is not None:\n    return call_rebound(ctx, proc, 1, $(insn_len))\na = ctx.pop()\nif type(a) is Pair:\n    ctx.push(a.rest)\nelse:\n    ctx.push(prim_rest(ctx.vm, a))\nctx.ip += $(insn_len)\nreturn ctx\n',
+            ['push_local', 'cdr']),
+Instruction(69,
+            'set_local_set_local_goto',
+            ['ctrl_flow'],
+            'Superinstruction of set_local, set_local, goto.',
+            ['local', '<set_local>', 'local', '<goto>', 'ip'],
+            ['value'],
+            [],
+            'idx = get_param(ctx, 1)\nval = ctx.pop()\nctx.env.assign_local(idx, val)\nidx = get_param(ctx, 3)\nval = ctx.pop()\nctx.env.assign_local(idx, val)\nip = get_param(ctx, 5)\nctx.ip = ip\n',
+            ['set_local', 'set_local', 'goto']),
+Instruction(70,
+            'set_local_goto',
+            ['ctrl_flow'],
+            'Superinstruction of set_local, goto.',
+            ['local', '<goto>', 'ip'],
+            ['value'],
+            [],
+            'idx = get_param(ctx, 1)\nval = ctx.pop()\nctx.env.assign_local(idx, val)\nip = get_param(ctx, 3)\nctx.ip = ip\n',
+            ['set_local', 'goto'])]
+
+INSN_MAP = {
+    'ret' : INSTRUCTIONS[0],
+    'call' : INSTRUCTIONS[1],
+    'tail_call' : INSTRUCTIONS[2],
+    'call_cc' : INSTRUCTIONS[3],
+    'call_1cc' : INSTRUCTIONS[4],
+    'tail_call_cc' : INSTRUCTIONS[5],
+    'tail_call_1cc' : INSTRUCTIONS[6],
+    'native_step' : INSTRUCTIONS[7],
+    'pop' : INSTRUCTIONS[8],
+    'push_local' : INSTRUCTIONS[9],
+    'set_local' : INSTRUCTIONS[10],
+    'push_local_depth' : INSTRUCTIONS[11],
+    'set_local_depth' : INSTRUCTIONS[12],
+    'push_global' : INSTRUCTIONS[13],
+    'set_global' : INSTRUCTIONS[14],
+    'push_literal' : INSTRUCTIONS[15],
+    'push_0' : INSTRUCTIONS[16],
+    'push_1' : INSTRUCTIONS[17],
+    'push_nil' : INSTRUCTIONS[18],
+    'push_true' : INSTRUCTIONS[19],
+    'push_false' : INSTRUCTIONS[20],
+    'dup' : INSTRUCTIONS[21],
+    'goto' : INSTRUCTIONS[22],
+    'goto_if_not_false' : INSTRUCTIONS[23],
+    'goto_if_false' : INSTRUCTIONS[24],
+    'goto_if_rebound' : INSTRUCTIONS[25],
+    'make_closure' : INSTRUCTIONS[26],
+    'add2' : INSTRUCTIONS[27],
+    'sub2' : INSTRUCTIONS[28],
+    'mul2' : INSTRUCTIONS[29],
+    'lt2' : INSTRUCTIONS[30],
+    'gt2' : INSTRUCTIONS[31],
+    'le2' : INSTRUCTIONS[32],
+    'ge2' : INSTRUCTIONS[33],
+    'num_eq2' : INSTRUCTIONS[34],
+    'car' : INSTRUCTIONS[35],
+    'cdr' : INSTRUCTIONS[36],
+    'cons' : INSTRUCTIONS[37],
+    'null_p' : INSTRUCTIONS[38],
+    'not' : INSTRUCTIONS[39],
+    'eq_p' : INSTRUCTIONS[40],
+    'vector_ref' : INSTRUCTIONS[41],
+    'vector_set' : INSTRUCTIONS[42],
+    'lt2_goto_if_false' : INSTRUCTIONS[43],
+    'gt2_goto_if_false' : INSTRUCTIONS[44],
+    'le2_goto_if_false' : INSTRUCTIONS[45],
+    'ge2_goto_if_false' : INSTRUCTIONS[46],
+    'num_eq2_goto_if_false' : INSTRUCTIONS[47],
+    'eq_p_goto_if_false' : INSTRUCTIONS[48],
+    'null_p_goto_if_false' : INSTRUCTIONS[49],
+    'not_goto_if_false' : INSTRUCTIONS[50],
+    'push_local_push_0_num_eq2_goto_if_false' : INSTRUCTIONS[51],
+    'push_local_push_local_lt2_goto_if_false' : INSTRUCTIONS[52],
+    'push_local_push_literal_lt2_goto_if_false' : INSTRUCTIONS[53],
+    'push_local_null_p_goto_if_false' : INSTRUCTIONS[54],
+    'push_local_push_global_call' : INSTRUCTIONS[55],
+    'push_global_call' : INSTRUCTIONS[56],
+    'push_global_tail_call' : INSTRUCTIONS[57],
+    'push_local_push_1_sub2' : INSTRUCTIONS[58],
+    'push_local_push_literal_sub2' : INSTRUCTIONS[59],
+    'push_local_push_local_lt2' : INSTRUCTIONS[60],
+    'push_local_push_literal_lt2' : INSTRUCTIONS[61],
+    'push_local_push_local' : INSTRUCTIONS[62],
+    'push_local_push_1' : INSTRUCTIONS[63],
+    'push_local_push_literal' : INSTRUCTIONS[64],
+    'push_local_ret' : INSTRUCTIONS[65],
+    'push_local_null_p' : INSTRUCTIONS[66],
+    'push_local_car' : INSTRUCTIONS[67],
+    'push_local_cdr' : INSTRUCTIONS[68],
+    'set_local_set_local_goto' : INSTRUCTIONS[69],
+    'set_local_goto' : INSTRUCTIONS[70]
+}
+
+SUPERINSTRUCTIONS = {
+    (INSN_MAP['lt2'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 43,
+    (INSN_MAP['gt2'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 44,
+    (INSN_MAP['le2'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 45,
+    (INSN_MAP['ge2'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 46,
+    (INSN_MAP['num_eq2'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 47,
+    (INSN_MAP['eq_p'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 48,
+    (INSN_MAP['null_p'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 49,
+    (INSN_MAP['not'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 50,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['push_0'].opcode, INSN_MAP['num_eq2'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 51,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['push_local'].opcode, INSN_MAP['lt2'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 52,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['push_literal'].opcode, INSN_MAP['lt2'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 53,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['null_p'].opcode, INSN_MAP['goto_if_false'].opcode, ) : 54,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['push_global'].opcode, INSN_MAP['call'].opcode, ) : 55,
+    (INSN_MAP['push_global'].opcode, INSN_MAP['call'].opcode, ) : 56,
+    (INSN_MAP['push_global'].opcode, INSN_MAP['tail_call'].opcode, ) : 57,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['push_1'].opcode, INSN_MAP['sub2'].opcode, ) : 58,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['push_literal'].opcode, INSN_MAP['sub2'].opcode, ) : 59,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['push_local'].opcode, INSN_MAP['lt2'].opcode, ) : 60,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['push_literal'].opcode, INSN_MAP['lt2'].opcode, ) : 61,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['push_local'].opcode, ) : 62,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['push_1'].opcode, ) : 63,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['push_literal'].opcode, ) : 64,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['ret'].opcode, ) : 65,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['null_p'].opcode, ) : 66,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['car'].opcode, ) : 67,
+    (INSN_MAP['push_local'].opcode, INSN_MAP['cdr'].opcode, ) : 68,
+    (INSN_MAP['set_local'].opcode, INSN_MAP['set_local'].opcode, INSN_MAP['goto'].opcode, ) : 69,
+    (INSN_MAP['set_local'].opcode, INSN_MAP['goto'].opcode, ) : 70
+}
+
+# Changes whenever the instruction set is changed, compiled code is only
+# valid with the same version
+ISET_VERSION = '100a7ffc11a2b2086c9560a2fdd908b0'
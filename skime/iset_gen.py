@@ -1,5 +1,6 @@
 import re
 import yaml
+import hashlib
 
 def gen_tags(tags):
     stmts =  []
@@ -7,23 +8,47 @@ def gen_tags(tags):
         stmts.append('TAG_%-12s = %d' % (tag.upper(), 2**i))
     return '\n'.join(stmts)
 
+def gen_code(insn):
+    "Get the code of an instruction with the ip advancing appended."
+    env = {
+        'insn_len' : 1 + len(insn['operands'])
+        }
+    code = insn['code']
+    if not 'ctrl_flow' in insn['tags']:
+        code += 'ctx.ip += $(insn_len)\n'
+    return process_tmpl(code, env)
+
+def indent(code):
+    return re.sub(re.compile('^(?!$)', re.MULTILINE), '    ', code)
+
 def gen_actions(instructions):
     def gen_action(insn):
         func = "def op_%s(ctx):\n" % insn['name']
+        return func + indent(gen_code(insn))
 
-        env = {
-            'insn_len' : 1 + len(insn['operands'])
-            }
-        code = insn['code']
-        if not 'ctrl_flow' in insn['tags']:
-            code += 'ctx.ip += $(insn_len)\n'
-            
-        code = process_tmpl(code, env)
-        code = re.sub(re.compile('^', re.MULTILINE), '    ', code)
+    return '\n'.join([gen_action(insn)
+                      for insn in instructions])
+
+def gen_threaders(instructions):
+    """\
+    Generate the handler factories for the threaded code engine. A
+    factory takes the operands of an instruction and returns a handler
+    closure with those operands baked in, so that the handler never
+    needs to read the bytecode at run time.
+    """
+    PARAM = re.compile(r"get_param\(ctx, (\d+)\)")
+    
+    def gen_threader(insn):
+        params = ['_op%d' % (i+1) for i in range(len(insn['operands']))]
+        func = "def thread_%s(%s):\n" % (insn['name'], ', '.join(params))
+
+        code = re.sub(PARAM, r"_op\1", gen_code(insn))
+        handler = "def th_%s(ctx):\n" % insn['name'] + indent(code)
+        handler += "return th_%s\n" % insn['name']
         
-        return func + code
+        return func + indent(handler)
 
-    return '\n'.join([gen_action(insn)
+    return '\n'.join([gen_threader(insn)
                       for insn in instructions])
 
 def gen_action_table(instructions):
@@ -33,6 +58,102 @@ def gen_action_table(instructions):
            '\n]\n'
 
 
+def gen_superinstructions(instructions, sequences):
+    """\
+    Generate fused superinstructions from sequences of instruction
+    names. The bytecode of a superinstruction is the same as that of
+    its components, only the first opcode is replaced by the opcode of
+    the superinstruction. So the opcodes of the other components are
+    kept as pseudo operands, and jumping into the middle of a fused
+    sequence still works.
+
+    The code is that of the components run one after the other, so
+    only the last one can be a control flow instruction. A sequence can
+    be given its own code instead, e.g. an inlined test fused with the
+    jump after it, where $(last) is the offset of the last component.
+    It can then end other sequences by its name.
+    """
+    PARAM = re.compile(r"get_param\(ctx, (\d+)\)")
+    insn_map = dict([(insn['name'], insn) for insn in instructions])
+    # The components and the code of the sequences with their own
+    # code, by name
+    fused = {}
+    
+    def gen_super(entry):
+        if isinstance(entry, dict):
+            parts = [(entry['components'], entry['code'])]
+        else:
+            parts = [fused.get(name) or ([name], insn_map[name]['code'])
+                     for name in entry]
+        for names, code in parts[:-1]:
+            for name in names:
+                if 'ctrl_flow' in insn_map[name]['tags']:
+                    raise TypeError, "%s can only be the last instruction of a superinstruction" % \
+                          name
+        names = sum([part[0] for part in parts], [])
+        components = [insn_map[name] for name in names]
+
+        # The operands, and the offset of each component
+        operands = []
+        starts = []
+        tags = []
+        for i, insn in enumerate(components):
+            if i > 0:
+                operands.append('<%s>' % insn['name'])
+            starts.append(len(operands))
+            operands.extend(insn['operands'])
+            tags.extend([tag for tag in insn['tags'] if tag not in tags])
+
+        code = []
+        i = 0
+        for part_names, part_code in parts:
+            offset = starts[i]
+            code.append(re.sub(PARAM,
+                               lambda m: 'get_param(ctx, %d)' % (int(m.group(1))+offset),
+                               part_code))
+            i += len(part_names)
+        code = ''.join(code).replace('$(last)', str(starts[-1]))
+
+        name = '_'.join(names)
+        if isinstance(entry, dict):
+            fused[name] = (names, entry['code'])
+        return {
+            'name' : name,
+            'tags' : tags,
+            'desc' : 'Superinstruction of %s.' % ', '.join(names),
+            'operands' : operands,
+            'stack_before' : components[0]['stack_before'],
+            'stack_after' : components[-1]['stack_after'],
+            'code' : code,
+            'components' : names
+            }
+
+    return [gen_super(entry) for entry in sequences]
+
+def gen_threader_table(instructions):
+    return 'INSN_THREADER = [\n' + \
+           ',\n'.join(['    thread_' + insn['name']
+                       for insn in instructions]) + \
+           '\n]\n\nINSN_LENGTH = [\n' + \
+           ',\n'.join(['    %d' % (1+len(insn['operands']))
+                       for insn in instructions]) + \
+           '\n]\n\nINSN_STEP = [\n' + \
+           ',\n'.join(['    %d' % insn_step(instructions, insn)
+                       for insn in instructions]) + \
+           '\n]\n'
+
+def insn_step(instructions, insn):
+    """\
+    The distance to the next instruction in the bytecode. This is the
+    length of the instruction, except for superinstructions, where it
+    is the length of the first component.
+    """
+    if insn['components']:
+        for x in instructions:
+            if x['name'] == insn['components'][0]:
+                return 1+len(x['operands'])
+    return 1+len(insn['operands'])
+
 def gen_tags_table(instructions):
     def gen_tag(insn):
         if len(insn['tags']) == 0:
@@ -51,7 +172,8 @@ def gen_insn_table(instructions):
         return "Instruction(" + str(i) + ",\n" + \
                ",\n".join(["            " + insn[key].__repr__()
                            for key in ['name', 'tags', 'desc', 'operands',
-                                       'stack_before', 'stack_after', 'code']]) + \
+                                       'stack_before', 'stack_after', 'code',
+                                       'components']]) + \
                ")"
 
     insns = zip(range(len(instructions)), instructions)
@@ -62,6 +184,11 @@ def gen_insn_table(instructions):
            "]\n\nINSN_MAP = {\n" + \
            ",\n".join(['    ' + insn['name'].__repr__() + ' : INSTRUCTIONS[%d]' % i
                        for i, insn in insns]) + \
+           "\n}\n\nSUPERINSTRUCTIONS = {\n" + \
+           ",\n".join(['    (%s) : %d' % (''.join(["INSN_MAP[%r].opcode, " % name
+                                                  for name in insn['components']]), i)
+                       for i, insn in insns
+                       if insn['components']]) + \
            "\n}\n"
     
 
@@ -77,12 +204,18 @@ def process_tmpl(tmpl, env):
 TMPL_INSNS = """\
 # Don't edit this file. This is generated by iset_gen.py
 
-from .ctx        import Context
+from .ctx        import Context, HALT, th_halt, add_traceback
 from .call_cc    import Continuation
 from .proc       import Procedure
-from .prim       import Primitive
+from .iset       import INSN_MAP
+from .prim       import Primitive, PyPrimitive, EnginePrimitive, next_args
+from .prim       import prim_apply, prim_map, prim_for_each
+from .prim       import plus, minus, mul, less, more, less_equal, more_equal, equal
+from .prim       import prim_first, prim_rest, prim_pair, prim_null_p, prim_not, prim_eqv
+from .prim       import prim_vector_ref, prim_vector_set_x
 from .types.pair import Pair
-from .errors     import WrongArgType
+from .types.vector import Vector
+from .errors     import WrongArgType, WrongArgNumber
 
 $(tags)
 
@@ -90,6 +223,10 @@ $(actions)
 
 $(action_table)
 
+$(threaders)
+
+$(threader_table)
+
 $(tags_table)
 
 
@@ -100,12 +237,216 @@ def get_param(ctx, n):
     return ctx.bytecode[ctx.ip+n]
 
 def run(ctx):
-    while ctx.ip < len(ctx.bytecode):
-        opcode = ctx.bytecode[ctx.ip]
-        nctx = INSN_ACTION[opcode](ctx)
-        if has_tag(opcode, TAG_CTX_SWITCH):
-            ctx = nctx
-    return ctx.pop()
+    try:
+        while ctx.ip < len(ctx.bytecode):
+            opcode = ctx.bytecode[ctx.ip]
+            nctx = INSN_ACTION[opcode](ctx)
+            if has_tag(opcode, TAG_CTX_SWITCH):
+                ctx = nctx
+        return ctx.pop()
+    except Exception, e:
+        add_traceback(e, ctx)
+        raise
+
+# Pre-decode bytecode into threaded code: a list parallel to the
+# bytecode where the slot at the ip of each instruction holds the
+# handler for it. An extra halt handler is put at the end. The
+# components of a superinstruction get their own handlers too, so
+# that they can be jumped to.
+def thread_bytecode(bytecode):
+    code = [None] * (len(bytecode)+1)
+    ip = 0
+    while ip < len(bytecode):
+        opcode = bytecode[ip]
+        length = INSN_LENGTH[opcode]
+        code[ip] = INSN_THREADER[opcode](*bytecode[ip+1:ip+length])
+        ip += INSN_STEP[opcode]
+    code[-1] = th_halt
+    return code
+
+def run_threaded(ctx):
+    code = ctx.threaded
+    try:
+        while True:
+            nctx = code[ctx.ip](ctx)
+            if nctx is not None:
+                if nctx is HALT:
+                    return ctx.pop()
+                ctx = nctx
+                code = ctx.threaded
+    except Exception, e:
+        add_traceback(e, ctx)
+        raise
+
+# Get the value of the global variable holding an inlined primitive if
+# it doesn't hold the primitive implemented by func any more. Return
+# None if it still does.
+def rebound_primitive(ctx, idx, func):
+    proc = ctx.form.literals[idx].value
+    if type(proc) is PyPrimitive and proc.proc is func:
+        return None
+    return proc
+
+# Make a real call instead of running an inlined primitive. The
+# arguments are already on the stack.
+def call_rebound(ctx, proc, argc, insn_len):
+    ctx.push(proc)
+    nctx = make_call(ctx, argc)
+    ctx.ip += insn_len
+    return nctx
+
+# The code of the contexts running an EnginePrimitive in the dispatch
+# loop. The native_step instruction runs step(ctx), which either makes
+# the next call of a procedure, whose value is pushed onto ctx when it
+# returns, or pushes the value of the primitive and moves to the ret
+# following it. The state of the primitive is kept on the stack of ctx,
+# so that the continuations captured in the calls have their own copy
+# of it.
+class NativeCode(object):
+    def __init__(self, name, step):
+        self.name = name
+        self.step = step
+        self.filename = '<primitive>'
+        self.bytecode = [INSN_MAP['native_step'].opcode, INSN_MAP['ret'].opcode]
+        self.threaded = thread_bytecode(self.bytecode)
+
+    def line_of(self, ip):
+        return None
+
+    def __reduce__(self):
+        # pickled by reference, see NATIVE_CODE
+        return (native_code, (self.name,))
+
+def native_code(name):
+    return NATIVE_CODE[name]
+
+# Pushed instead of the value of a call when a native context starts
+START = object()
+
+# Make a context running code with state, see NativeCode
+def enter_native(ctx, code, state, tail):
+    if tail:
+        parent = ctx.parent
+    else:
+        parent = ctx
+    nctx = ctx.vm.context_t(code, ctx.env, parent)
+    nctx.push(state)
+    nctx.push(START)
+    return nctx
+
+# Make the next call of a native context
+def native_call(ctx, proc, args):
+    if type(proc) is Procedure:
+        code = proc.code
+        code.check_arity(len(args))
+        return ctx.vm.context_t(code, code.make_frame(proc.lexical_parent, args), ctx)
+    for x in args:
+        ctx.push(x)
+    ctx.push(proc)
+    return make_call(ctx, len(args))
+
+# End a native context with value
+def native_return(ctx, value):
+    ctx.push(value)
+    ctx.ip = 1
+    return ctx
+
+# Get the arguments of the next call of map or for-each from a tuple of
+# lists, and the rests of the lists. The arguments are None at the end.
+def native_args(lists, name):
+    if len(lists) == 1:
+        lst = lists[0]
+        if type(lst) is Pair:
+            return [lst.first], (lst.rest,)
+        if lst is None:
+            return None, lists
+        raise WrongArgType("Arguments of %s should be valid lists." % name)
+    lists = list(lists)
+    args = next_args(lists, name)
+    return args, tuple(lists)
+
+# The state of map is the procedure, the rest of the lists and the
+# number of values under it. The values of the contexts are on the top
+# of ctx.stack, with or without a shared stack. The plain primitives are
+# called right away instead of going through the engine.
+def map_step(ctx):
+    stack = ctx.stack
+    value = stack.pop()
+    proc, lists, count = stack.pop()
+    if value is not START:
+        stack.append(value)
+        count += 1
+    while True:
+        args, lists = native_args(lists, 'map')
+        if args is None:
+            res = None
+            for x in reversed(ctx.pop_list(count)):
+                res = Pair(x, res)
+            return native_return(ctx, res)
+        if type(proc) is not PyPrimitive:
+            break
+        proc.check_arity(len(args))
+        stack.append(proc.apply(ctx.vm, args))
+        count += 1
+    stack.append((proc, lists, count))
+    return native_call(ctx, proc, args)
+
+# The state of for-each is the procedure and the rest of the lists
+def for_each_step(ctx):
+    stack = ctx.stack
+    stack.pop()
+    proc, lists = stack.pop()
+    while True:
+        args, lists = native_args(lists, 'for-each')
+        if args is None:
+            return native_return(ctx, None)
+        if type(proc) is not PyPrimitive:
+            break
+        proc.check_arity(len(args))
+        proc.apply(ctx.vm, args)
+    stack.append((proc, lists))
+    return native_call(ctx, proc, args)
+
+NATIVE_CODE = {
+    'map' : NativeCode('map', map_step),
+    'for-each' : NativeCode('for-each', for_each_step),
+}
+
+def enter_map(ctx, proc, argc, tail):
+    args = ctx.pop_list(argc)
+    return enter_native(ctx, NATIVE_CODE['map'], (args[0], tuple(args[1:]), 0), tail)
+
+def enter_for_each(ctx, proc, argc, tail):
+    args = ctx.pop_list(argc)
+    return enter_native(ctx, NATIVE_CODE['for-each'], (args[0], tuple(args[1:])), tail)
+
+# Replace the arguments of apply on the stack with the arguments it
+# applies the procedure to, and call it
+def enter_apply(ctx, proc, argc, tail):
+    args = ctx.pop_list(argc)
+    for x in args[1:-1]:
+        ctx.push(x)
+    argc -= 2
+    if len(args) > 1:
+        lst = args[-1]
+        while isinstance(lst, Pair):
+            ctx.push(lst.first)
+            lst = lst.rest
+            argc += 1
+        if lst is not None:
+            raise WrongArgType("The last argument of apply should be a valid list, but got %s" % args[-1])
+    else:
+        argc = 0
+    ctx.push(args[0])
+    return make_call(ctx, argc, tail)
+
+# How the engines call the EnginePrimitives, by their procs: with the
+# arguments on the stack, return the next context
+ENGINE_PRIMITIVES = {
+    prim_apply : enter_apply,
+    prim_map : enter_map,
+    prim_for_each : enter_for_each,
+}
 
 def make_call(ctx, argc, tail=False):
     proc = ctx.pop()
@@ -115,37 +456,34 @@ def make_call(ctx, argc, tail=False):
         parent = ctx
 
     if isinstance(proc, Procedure):
-        proc.check_arity(argc)
-        nctx = Context(proc, proc.env.dup(), parent)
-
-        for i in range(proc.fixed_argc):
-            nctx.env.assign_local(i, ctx.top(idx=argc-i))
-        if proc.fixed_argc != proc.argc:
-            rest = None
-            for i in range(argc-proc.fixed_argc):
-                rest = Pair(ctx.top(idx=i+1), rest)
-            nctx.env.assign_local(proc.fixed_argc, rest)
-        ctx.pop_n(argc)
+        code = proc.code
+        code.check_arity(argc)
+        nctx = ctx.vm.context_t(code,
+                                code.make_frame(proc.lexical_parent, ctx.pop_list(argc)),
+                                parent)
 
     elif isinstance(proc, Primitive):
         proc.check_arity(argc)
-        args = range(argc)
-        for i in range(argc):
-            args[i] = ctx.top(idx=argc-i)
-        ctx.pop_n(argc)
+        if type(proc) is EnginePrimitive:
+            # e.g. apply calls the procedure like a call instruction, so
+            # it can be a tail-call too
+            return ENGINE_PRIMITIVES[proc.proc](ctx, proc, argc, tail)
+        args = ctx.pop_list(argc)
 
         nctx = parent
-        nctx.push(proc.call(ctx.vm, *args))
+        if nctx.shared or nctx.one_shot is not None:
+            nctx = nctx.returned_to()
+        nctx.push(proc.apply(ctx.vm, args))
 
     elif isinstance(proc, Continuation):
         if argc > 1:
             raise WrongArgNumber("Continuation only accept 1 argument")
-        nctx = proc.ctx.clone()
         if argc == 1:
-            nctx.push(ctx.pop())
+            value = ctx.pop()
         else:
-            nctx.push(None)
-        nctx.parent = ctx.parent
+            value = None
+        nctx = proc.resume(ctx)
+        nctx.push(value)
 
     else:
         raise WrongArgType("Not a skime callable: %s" % proc)
@@ -164,9 +502,10 @@ class Instruction(object):
                  'operands',
                  'stack_before',
                  'stack_after',
-                 'code')
+                 'code',
+                 'components')
     def __init__(self, opcode, name, tags, desc, operands,
-                 stack_before, stack_after, code):
+                 stack_before, stack_after, code, components):
         self.opcode = opcode
         self.name = name
         self.tags = tags
@@ -175,6 +514,8 @@ class Instruction(object):
         self.stack_before = stack_before
         self.stack_after = stack_after
         self.code = code
+        # Names of the fused instructions of a superinstruction
+        self.components = components
 
     def length_get(self):
         return len(self.operands)+1
@@ -183,17 +524,30 @@ class Instruction(object):
     length = property(length_get, length_set, 'length of the instruction')
 
 $(instruction_table)
+# Changes whenever the instruction set is changed, compiled code is only
+# valid with the same version
+ISET_VERSION = $(version)
 """
 
 if __name__ == '__main__':
-    iset = yaml.load(open("iset.yml").read())
+    source = open("iset.yml").read()
+    iset = yaml.load(source)
+
+    instructions = iset['instructions']
+    for insn in instructions:
+        insn['components'] = []
+    instructions += gen_superinstructions(instructions,
+                                          iset.get('superinstructions', []))
 
     env = {
         'tags' : gen_tags(iset['tags']),
-        'actions' : gen_actions(iset['instructions']),
-        'instruction_table' : gen_insn_table(iset['instructions']),
-        'action_table' : gen_action_table(iset['instructions']),
-        'tags_table' : gen_tags_table(iset['instructions'])
+        'actions' : gen_actions(instructions),
+        'instruction_table' : gen_insn_table(instructions),
+        'action_table' : gen_action_table(instructions),
+        'threaders' : gen_threaders(instructions),
+        'threader_table' : gen_threader_table(instructions),
+        'tags_table' : gen_tags_table(instructions),
+        'version' : repr(hashlib.md5(source + open("iset_gen.py").read()).hexdigest())
         }
 
     py = open("iset.py", "w")
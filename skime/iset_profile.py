@@ -0,0 +1,100 @@
+# Profile the frequencies of opcode sequences when running Scheme
+# programs. The most frequent sequences are good candidates for the
+# superinstructions in iset.yml. Usage:
+#
+#   python -m skime.iset_profile [-n LENGTH] [-t TOP] file.scm ...
+#
+# Only sequences of instructions that follow each other in the bytecode
+# of the same context are counted, and a control flow instruction can
+# only end a sequence, because those are the only sequences that can be
+# fused. The inlined tests fused with the jump after them in iset.yml
+# are the exception. Superinstructions already in the bytecode are
+# counted as their components.
+
+import sys
+from optparse import OptionParser
+
+from .vm    import VM
+from .iset  import INSTRUCTIONS, INSN_MAP
+from .insns import INSN_ACTION, has_tag, TAG_CTX_SWITCH, TAG_CTRL_FLOW
+
+# The control flow instructions starting a superinstruction, which don't
+# end a sequence
+FUSED_TESTS = set([INSN_MAP[insn.components[0]].opcode
+                   for insn in INSTRUCTIONS
+                   if insn.components and
+                      has_tag(INSN_MAP[insn.components[0]].opcode, TAG_CTRL_FLOW)])
+
+class OpcodeProfiler(object):
+    "Counts the opcode sequences of length 2 to max_length."
+    def __init__(self, max_length=2):
+        self.max_length = max_length
+        self.counts = {}
+
+        # The opcodes executed since the last control flow instruction,
+        # only the last max_length ones are kept.
+        self.window = []
+
+    def components(self, opcode):
+        insn = INSTRUCTIONS[opcode]
+        if insn.components:
+            return [INSN_MAP[name].opcode for name in insn.components]
+        return [opcode]
+
+    def record(self, opcode):
+        for op in self.components(opcode):
+            self.window.append(op)
+            if len(self.window) > self.max_length:
+                del self.window[0]
+            for n in range(2, len(self.window)+1):
+                seq = tuple(self.window[-n:])
+                self.counts[seq] = self.counts.get(seq, 0) + 1
+            if has_tag(op, TAG_CTRL_FLOW) and op not in FUSED_TESTS:
+                self.window = []
+
+    def run(self, ctx):
+        "An engine for VM running instructions like insns.run, but counting them."
+        while ctx.ip < len(ctx.bytecode):
+            opcode = ctx.bytecode[ctx.ip]
+            self.record(opcode)
+            nctx = INSN_ACTION[opcode](ctx)
+            if has_tag(opcode, TAG_CTX_SWITCH):
+                ctx = nctx
+        return ctx.pop()
+
+    def report(self, top=20):
+        "Return a report of the top most frequent sequences."
+        counts = self.counts.items()
+        counts.sort(key=lambda x: x[1], reverse=True)
+        counts = counts[:top]
+
+        lines = ['%12s  sequence' % 'count']
+        for seq, n in counts:
+            lines.append('%12d  %s' % (n, ' '.join([INSTRUCTIONS[op].name
+                                                   for op in seq])))
+        lines.append('')
+        lines.append('superinstructions:')
+        for seq, n in counts:
+            lines.append('  - [%s]' % ', '.join([INSTRUCTIONS[op].name
+                                                for op in seq]))
+        return '\n'.join(lines)
+
+def main(argv):
+    parser = OptionParser(usage="%prog [-n LENGTH] [-t TOP] file.scm ...")
+    parser.add_option('-n', '--length', type='int', default=2,
+                      help="the max length of opcode sequences to count")
+    parser.add_option('-t', '--top', type='int', default=20,
+                      help="the number of sequences to report")
+    options, files = parser.parse_args(argv)
+    if not files:
+        parser.error("no Scheme file to profile")
+
+    profiler = OpcodeProfiler(options.length)
+    for path in files:
+        vm = VM()
+        vm.engine = profiler.run
+        vm.load(path)
+    print profiler.report(options.top)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -5,6 +5,8 @@ from .errors       import SyntaxError
 class Macro(object):
     def __init__(self, env, body):
         self.lexical_parent = env
+        # The syntax-rules form without the keyword, see BytecodeCache
+        self.source = body
         try:
             # Process literals
             literals = body.first
@@ -54,9 +56,9 @@ class SyntaxRule(object):
         return md
 
     def expand(self, env, md):
-        dc_factory = ClosureFactory(env)
-        expr = self.template.expand(dc_factory, md, [])[0]
-        return expr, dc_factory.closures
+        renamer = Renamer(self.env)
+        expr = self.template.expand(renamer, md, [])[0]
+        return expr, renamer.aliases.values()
 
     ########################################
     # Pattern compiling
@@ -213,10 +215,14 @@ class LiteralMatcher(Matcher):
         return env.lookup_location(name)
 
     def match_literal(self, env, expr):
-        if not isinstance(expr, pair) or \
-           not isinstance(expr.first, sym):
+        if not isinstance(expr, pair):
+            raise MatchError("%s: can not match %s" % (self, expr))
+        if isinstance(expr.first, sym):
+            loc = self.get_loc(env, expr.first.name)
+        elif isinstance(expr.first, SymbolClosure):
+            loc = self.get_loc(env, expr.first)
+        else:
             raise MatchError("%s: can not match %s" % (self, expr))
-        loc = self.get_loc(env, expr.first.name)
         if self.loc != loc:
             raise MatchError("%s: can not match %s with different lexical binding" % (self, expr.first.name))
 
@@ -337,17 +343,13 @@ class SequenceMatcher(Matcher):
 ########################################
 class DynamicClosure(object):
     """\
-    A macro is evaluated in the lexical scope of the macro. However,
-    expressions captured by pattern variables should be evaluated
-    in the scope where the macro is expanded. This object is used
-    to wrap the expression and carry with it its dynamic scope.
+    An expression closed in the environment where it belongs to.
 
     slots are:
      - lexical_parent: the environment where the expression belongs to.
      - expression: the expression wrapped.
-     - form: the compiled form of the expression.
     """
-    __slots__ = ('lexical_parent', 'expression', 'form')
+    __slots__ = ('lexical_parent', 'expression')
     
     def __init__(self, env, expr):
         self.lexical_parent = env
@@ -367,49 +369,52 @@ class DynamicClosure(object):
                                                      self.lexical_parent)
 
 class SymbolClosure(DynamicClosure):
+    """\
+    A symbol inserted by a macro expansion. It is an alias of the symbol
+    in the environment where the macro is defined. Each expansion makes
+    new aliases, and an alias is only equal to itself. So a variable
+    bound to an alias can only be referenced by the same alias, not by
+    the code passed to the macro, even if the names are the same. An
+    alias not bound in the expansion refers to the binding of the symbol
+    where the macro is defined (see Environment.lookup_location).
+    """
+    __slots__ = ()
+
+    def __eq__(self, o):
+        return self is o
+    def __ne__(self, o):
+        return self is not o
     def __hash__(self):
-        return self.expression.name.__hash__()
+        return id(self)
+
+    def get_name(self):
+        return self.expression.name
+    name = property(get_name)
+
+    def __str__(self):
+        return self.name
+    def __repr__(self):
+        return "<SymbolClosure name=%s, env=%s>" % (self.name,
+                                                    self.lexical_parent)
 
-class ClosureFactory(object):
-    "Create and hold DynamicClosure."
+class Renamer(object):
+    "Create the aliases of the symbols inserted by an expansion."
     def __init__(self, env):
         self.env = env
-        self.values = []
-        self.closures = []
-
-    def make_closure(self, value):
-        if isinstance(value, DynamicClosure):
-            return value
-        if isinstance(value, sym):
-            sc = self.get_closure(sym)
-            if sc is None:
-                self.values.append(value)
-                sc = SymbolClosure(self.env, value)
-                self.closures.append(sc)
-            return sc
-        if isinstance(value, pair):
-            dc = self.get_closure(sym)
-            if dc is None:
-                self.values.append(value)
-                dc = DynamicClosure(self.env, value)
-                self.closures.append(dc)
-            return dc
-        # other values are considered environment-indenpendent
-        return value
-
-    def get_closure(self, value):
-        # the closures in a macro is generally not too many
-        # so linear search is OK.
-        for i in range(len(self.values)):
-            if value == self.values[i]:
-                return self.closures[i]
-        return None
+        self.aliases = {}
+
+    def alias(self, symbol):
+        "Get the alias of symbol, the same symbol gets the same alias."
+        sc = self.aliases.get(symbol)
+        if sc is None:
+            sc = SymbolClosure(self.env, symbol)
+            self.aliases[symbol] = sc
+        return sc
 
 # There are the following kinds of templates:
 #  - symbol:
-#    - lexical binding: symbol referencing to the lexical binding where the macro is defined
 #    - macro variable symbol: will be replaced by the matched value
-#    - un-recognized symbol: will be renamed to avoid conflict
+#    - other symbols: will be renamed to an alias (SymbolClosure)
 #  - pair: expand recursively
 #  - other: expand as constant
 
@@ -421,7 +426,7 @@ class Template(object):
     def class_name(self):
         return self.__class__.__name__
     
-    def expand(self, dc_factory, md, nflatten=0):
+    def expand(self, renamer, md, nflatten=0):
         "Expand the template under match dict md."
         raise SyntaxError("Attempt to expand an abstract template.")
 
@@ -431,7 +436,9 @@ class ConstantTemplate(Template):
         Template.__init__(self)
         self.value = value
 
-    def expand(self, dc_factory, md, idx=[]):
+    def expand(self, renamer, md, idx=[]):
+        if isinstance(self.value, (sym, SymbolClosure)):
+            return (renamer.alias(self.value), )
         return (self.value, )
     
     def __str__(self):
@@ -444,7 +451,7 @@ class VariableTemplate(Template):
         Template.__init__(self)
         self.name = name
 
-    def expand(self, dc_factory, md, idx=[]):
+    def expand(self, renamer, md, idx=[]):
         val = md.get(self.name, Ellipsis())
         for i in idx:
             val = val[i]
@@ -455,7 +462,7 @@ class VariableTemplate(Template):
             nflatten -= 1
         if len(val) > 0 and isinstance(val[0], Ellipsis):
             raise SyntaxError("Ellipsis after variable %s is less than expected." % self.name)
-        return [dc_factory.make_closure(v) for v in val]
+        return val
 
     def flatten(self, val):
         "Flatten ellipsis."
@@ -498,12 +505,12 @@ class SequenceTemplate(Template):
         elif isinstance(tmpl, SequenceTemplate):
             self.ellipsis_names.extend(tmpl.ellipsis_names)
 
-    def expand(self, dc_factory, md, idx=[]):
-        return self.expand_flatten(dc_factory, md, idx, self.nflatten)
+    def expand(self, renamer, md, idx=[]):
+        return self.expand_flatten(renamer, md, idx, self.nflatten)
 
-    def expand_flatten(self, dc_factory, md, idx, flatten):
+    def expand_flatten(self, renamer, md, idx, flatten):
         if flatten == 0:
-            return self.expand_0(dc_factory, md, idx)
+            return self.expand_0(renamer, md, idx)
         length = 0
         for name in self.ellipsis_names:
             var = md.get(name, Ellipsis())
@@ -520,17 +527,17 @@ class SequenceTemplate(Template):
             res = []
             for i in range(length):
                 idx[-1] = i
-                res.extend(self.expand_flatten(dc_factory, md, idx, flatten-1))
+                res.extend(self.expand_flatten(renamer, md, idx, flatten-1))
             idx.pop()
             return res
         else:
             return ()
 
-    def expand_0(self, dc_factory, md, idx):
+    def expand_0(self, renamer, md, idx):
         elems = []
         for tmpl in self.sequence:
-            elems.extend(tmpl.expand(dc_factory, md, idx))
-        rest = self.tail.expand(dc_factory, md, idx)[0]
+            elems.extend(tmpl.expand(renamer, md, idx))
+        rest = self.tail.expand(renamer, md, idx)[0]
         for elem in reversed(elems):
             rest = pair(elem, rest)
         return [rest]
@@ -2,7 +2,9 @@ import math
 
 from .types.symbol import Symbol as sym
 from .types.pair   import Pair as pair
+from .types.vector import Vector, make_vector
 from .proc         import Procedure
+from .env          import GlobalEnvironment
 from .errors       import WrongArgNumber
 from .errors       import WrongArgType
 from .errors       import MiscError
@@ -15,6 +17,9 @@ class Primitive(object):
     by calling prim.check_arity(3). Then the vm object is inserted as the first
     argument and the primitive called: prim.call(vm, 1, 2, 3). The vm is always
     the first argument of all primitives, but not count as argc.
+
+    The VM calls prim.apply(vm, [1, 2, 3]) with the arguments taken off the
+    operand stack as a list. By default it is the same as prim.call.
     """
     def check_arity(self, argc):
         "Check whether this primitive is OK to execute with argc arguments."
@@ -24,6 +29,10 @@ class Primitive(object):
         "Call the primitive with args."
         raise TypeError("call is not implemented in abstract class Primitive")
 
+    def apply(self, vm, args):
+        "Call the primitive with the arguments in the list args."
+        return self.call(vm, *args)
+
 
 class PyPrimitive(Primitive):
     "Primitive wrapping a Python callable."
@@ -51,9 +60,22 @@ class PyPrimitive(Primitive):
     def call(self, *args):
         return self.proc(*args)
 
+    def apply(self, vm, args):
+        return self.proc(vm, *args)
+
     def __str__(self):
         return "<skime primitive => %s>" % self.proc.__name__
 
+class EnginePrimitive(PyPrimitive):
+    """\
+    A primitive calling procedures, like apply and map. Called from
+    Python (e.g. by VM.apply), it runs them in nested engines like a
+    PyPrimitive. The engines call it with insns.make_call instead, which
+    makes the calls in the dispatch loop, so that they don't nest the
+    Python stack and can be captured by continuations.
+    """
+    pass
+
 class PyCallable(Primitive):
     def __init__(self, proc):
         self.proc = proc
@@ -64,6 +86,9 @@ class PyCallable(Primitive):
     def call(self, vm, *args):
         return self.proc(*args)
 
+    def apply(self, vm, args):
+        return self.proc(*args)
+
 def load_primitives(env):
     "Load primitives into an Environment."
     env.alloc_local('+', PyPrimitive(plus, (-1, -1)))
@@ -103,10 +128,28 @@ def load_primitives(env):
 
     env.alloc_local('list', PyPrimitive(prim_list, (-1, -1)))
 
+    env.alloc_local('make-vector', PyPrimitive(prim_make_vector, (1, 2)))
+    env.alloc_local('vector', PyPrimitive(prim_vector, (-1, -1)))
+    env.alloc_local('vector-length', PyPrimitive(prim_vector_length, (1, 1)))
+    env.alloc_local('vector-ref', PyPrimitive(prim_vector_ref, (2, 2)))
+    env.alloc_local('vector-set!', PyPrimitive(prim_vector_set_x, (3, 3)))
+    env.alloc_local('vector->list', PyPrimitive(prim_vector_to_list, (1, 1)))
+    env.alloc_local('list->vector', PyPrimitive(prim_list_to_vector, (1, 1)))
+    env.alloc_local('vector-fill!', PyPrimitive(prim_vector_fill_x, (2, 2)))
+
+    # The homogeneous numeric vectors, see Vector
+    for tag in ['f64', 's64']:
+        make, build, from_list, predict = make_homogeneous_primitives(tag)
+        env.alloc_local('make-%svector' % tag, PyPrimitive(make, (1, 2)))
+        env.alloc_local('%svector' % tag, PyPrimitive(build, (-1, -1)))
+        env.alloc_local('list->%svector' % tag, PyPrimitive(from_list, (1, 1)))
+        env.alloc_local('%svector?' % tag, PyPrimitive(predict, (1, 1)))
+
     for t,name in [(bool, "boolean?"),
                    (pair, "pair?"),
                    (sym, "symbol?"),
                    (str, "string?"),
+                   (Vector, "vector?"),
                    ((int, long, float, complex), "number?"),
                    ((int, long, float), "rational?"),
                    ((int, long, float), "real?"),
@@ -141,8 +184,9 @@ def load_primitives(env):
     env.alloc_local('null?', PyPrimitive(prim_null_p, (1, 1)))
     env.alloc_local('list?', PyPrimitive(prim_list_p, (1, 1)))
 
-    env.alloc_local('apply', PyPrimitive(prim_apply, (1, -1)))
-    env.alloc_local('map', PyPrimitive(prim_map, (2, -1)))
+    env.alloc_local('apply', EnginePrimitive(prim_apply, (1, -1)))
+    env.alloc_local('map', EnginePrimitive(prim_map, (2, -1)))
+    env.alloc_local('for-each', EnginePrimitive(prim_for_each, (2, -1)))
 
     env.alloc_local('string->symbol', PyPrimitive(prim_string_to_symbol, (1, 1)))
     env.alloc_local('symbol->string', PyPrimitive(prim_symbol_to_string, (1, 1)))
@@ -438,6 +482,52 @@ def prim_list(vm, *args):
         lst = pair(x, lst)
     return lst
 
+def prim_make_vector(vm, k, fill=False):
+    check_length(k)
+    return Vector([fill] * k)
+def prim_vector(vm, *args):
+    return Vector(list(args))
+def prim_vector_length(vm, vec):
+    type_check(vec, Vector)
+    return len(vec.items)
+def prim_vector_ref(vm, vec, k):
+    type_check(vec, Vector)
+    check_index(vec, k)
+    return vec.items[k]
+def prim_vector_set_x(vm, vec, k, obj):
+    type_check(vec, Vector)
+    check_index(vec, k)
+    # the arrays of the numeric vectors take the booleans for integers
+    if type(obj) is bool and type(vec.items) is not list:
+        raise WrongArgType("Can't store %s in a #%s vector" % (obj, vec.tag))
+    try:
+        vec.items[k] = obj
+    except (TypeError, OverflowError):
+        raise WrongArgType("Can't store %s in a #%s vector" % (obj, vec.tag))
+def prim_vector_to_list(vm, vec):
+    type_check(vec, Vector)
+    lst = None
+    for x in reversed(vec.items):
+        lst = pair(x, lst)
+    return lst
+def prim_list_to_vector(vm, lst):
+    return Vector(list(iter_list(lst)))
+def prim_vector_fill_x(vm, vec, fill):
+    type_check(vec, Vector)
+    vec.items[:] = homogeneous_vector(vec.tag, [fill] * len(vec.items)).items
+
+def make_homogeneous_primitives(tag):
+    "Make make-TAGvector, TAGvector, list->TAGvector and TAGvector?."
+    def make(vm, k, fill=0):
+        check_length(k)
+        return homogeneous_vector(tag, [fill] * k)
+    def build(vm, *args):
+        return homogeneous_vector(tag, args)
+    def from_list(vm, lst):
+        return homogeneous_vector(tag, list(iter_list(lst)))
+    def predict(vm, obj):
+        return isinstance(obj, Vector) and obj.tag == tag
+    return make, build, from_list, predict
 
 def prim_apply(vm, proc, *args):
     if len(args) == 0:
@@ -451,25 +541,38 @@ def prim_apply(vm, proc, *args):
         raise WrongArgType("The last argument of apply should be a valid list, but got %s" % args[-1])
     return vm.apply(proc, argv)
 
+def next_args(lists, name):
+    """\
+    Get the arguments of the next call of map or for-each, the first
+    elements of lists, and replace lists with their rests. Return None
+    at the end of the lists.
+    """
+    args = []
+    end = False
+    for i in range(len(lists)):
+        lst = lists[i]
+        if not isinstance(lst, pair):
+            if lst is None:
+                end = True
+            else:
+                raise WrongArgType("Arguments of %s should be valid lists." % name)
+        else:
+            if end:
+                raise MiscError("Lists supplied to %s should be all of the same length." % name)
+            args.append(lst.first)
+            lists[i] = lst.rest
+    if end:
+        if args:
+            raise MiscError("Lists supplied to %s should be all of the same length." % name)
+        return None
+    return args
+
 def prim_map(vm, proc, *lists):
     res = []
+    lists = list(lists)
     while True:
-        args = []
-        end = False
-        lists = list(lists)
-        for i in range(len(lists)):
-            lst = lists[i]
-            if not isinstance(lst, pair):
-                if lst is None:
-                    end = True
-                else:
-                    raise WrongArgType("Arguments of map should be valid lists.")
-            else:
-                if end:
-                    raise MiscError("Lists supplied to map should be all of the same length.")
-                args.append(lst.first)
-                lists[i] = lst.rest
-        if end:
+        args = next_args(lists, 'map')
+        if args is None:
             break
         res.append(vm.apply(proc, args))
     rest = None
@@ -477,6 +580,15 @@ def prim_map(vm, proc, *lists):
         rest = pair(x, rest)
     return rest
 
+def prim_for_each(vm, proc, *lists):
+    lists = list(lists)
+    while True:
+        args = next_args(lists, 'for-each')
+        if args is None:
+            break
+        vm.apply(proc, args)
+    return None
+
 def prim_string_to_symbol(vm, name):
     type_check(name, str)
     return sym(name)
@@ -549,9 +661,32 @@ def type_check(obj, t):
         raise WrongArgType("Expecting type %s, but got %s (type %s)" % \
                            (t, obj, type(obj)))
 
+def check_length(k):
+    type_check(k, (int, long))
+    if k < 0:
+        raise MiscError("The length of a vector can't be negative, but got %d" % k)
+
+def check_index(vec, k):
+    type_check(k, (int, long))
+    if k < 0 or k >= len(vec.items):
+        raise MiscError("Index %d is out of the range of a vector of length %d" % \
+                        (k, len(vec.items)))
+
+def homogeneous_vector(tag, items):
+    "Make a vector of the kind of tag, see Vector."
+    try:
+        return make_vector(tag, items)
+    except (TypeError, OverflowError):
+        raise WrongArgType("Invalid element of a #%s vector" % tag)
+
 def iter_list(lst, excp_t=WrongArgType):
     while isinstance(lst, pair):
         yield lst.first
         lst = lst.rest
     if lst is not None:
         raise excp_t("Not a proper list")
+
+# The primitives loaded by load_primitives, made only once. They don't
+# change and are shared by all the VMs.
+PRIMITIVES = GlobalEnvironment()
+load_primitives(PRIMITIVES)
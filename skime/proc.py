@@ -1,22 +1,25 @@
 from cStringIO        import StringIO
+from array            import array
 
 from .errors          import WrongArgNumber
-from .compiler.disasm import disasm
+from .env             import Frame, Undef
+from .types.pair      import Pair
+from .compiler.disasm import disasm, find_line
 
-class Procedure(object):
+class Code(object):
+    """\
+    The compiled code of a lambda expression. A Code object is created
+    once at compile time and never changed. A Procedure is created from
+    it each time the lambda expression is evaluated.
+    """
     def __init__(self, builder, bytecode):
-        
-        # The Environment created at compile time. A new
-        # Environment will be created when the procedure
-        # is called.
-        #
-        # self.env.parent (i.e. the lexical parent of the
-        # env) might be an Environment created at compile
-        # time. In that case, a 'make-lambda' instruction
-        # will be emitted in the instruction sequence to
-        # fix the parent at run time.
+
+        # The Environment created at compile time. It holds
+        # the names of the local variables, which are used in
+        # debugging. Only a Frame of the values is created
+        # when a procedure of the code is called.
         self.env = builder.env
-        
+
         self.bytecode = bytecode
 
         self.argc = len(builder.args)
@@ -25,13 +28,59 @@ class Procedure(object):
         else:
             self.fixed_argc = self.argc
 
-        self.literals = list(builder.literals)
+        # The number of local variables, including arguments
+        self.nlocals = len(builder.env.locals)
+        # Appended to the arguments to make the local variables
+        self.padding = [Undef()] * (self.nlocals-self.argc)
+
+        # Shared with the form and the other procedures in it
+        self.literals = builder.literals
+
+        # The lambda expression (args . body) compiled, kept for
+        # inlining the calls of the procedure, or None
+        self.source = builder.source
+        # The name the procedure is defined with, or None
+        self.name = builder.name
+
+        # The file the code is read from, the line it starts at, and
+        # the line numbers of the instructions, see line_of
+        self.filename = builder.filename
+        self.line = builder.first_line
+        self.lines = array('i', builder.lines)
+
+        # Filled by Builder.generate
+        self.threaded = None
+
+    def __setstate__(self, state):
+        """\
+        The threaded code is not pickled in files (see BytecodeCache),
+        it is made again when unpickled.
+        """
+        self.__dict__.update(state)
+        if self.threaded is None:
+            # insns can't be imported before this module
+            from .insns import thread_bytecode
+            self.threaded = thread_bytecode(self.bytecode)
+
+    def make_frame(self, lexical_parent, args):
+        """\
+        Create the Frame holding the local variables of a call. The
+        list args is taken over as the local variables, the arguments
+        are not copied unless there is a rest argument.
+        """
+        if self.fixed_argc != self.argc:
+            rest = None
+            for i in range(len(args)-1, self.fixed_argc-1, -1):
+                rest = Pair(args[i], rest)
+            del args[self.fixed_argc:]
+            args.append(rest)
+        if self.padding:
+            args.extend(self.padding)
+        return Frame(lexical_parent, args)
 
-    def lexical_parent_get(self):
-        return self.env.parent
-    def lexical_parent_set(self, parent):
-        self.env.parent = parent
-    lexical_parent = property(lexical_parent_get, lexical_parent_set)
+    def line_of(self, ip):
+        "Get the line number of the instruction at ip, or None."
+        return find_line(self.lines, ip)
 
     def check_arity(self, argc):
         if self.fixed_argc == self.argc:
@@ -42,16 +91,16 @@ class Procedure(object):
             if argc < self.fixed_argc:
                 raise WrongArgNumber("Expecting at least %d arguments, but got %d" %
                                      (self.fixed_argc, argc))
-                
+
     def disasm(self):
         "Show the disassemble of the instructions of the proc. Useful for debug."
         io = StringIO()
         io.write('='*60)
         io.write('\n')
-        io.write('Diasassemble of proc at %X\n' % id(self))
-        
+        io.write('Diasassemble of proc %s at %X\n' % (self.name or '', id(self)))
+
         io.write('arguments: ')
-        args = [self.env.get_name(i) for i in range(self.argc)]
+        args = [str(self.env.get_name(i)) for i in range(self.argc)]
         if self.fixed_argc != self.argc:
             args[-1] = '*'+args[-1]
         io.write(', '.join(args))
@@ -71,3 +120,20 @@ class Procedure(object):
         io.close()
 
         return content
+
+class Procedure(object):
+    """\
+    A closure: the Code of a lambda expression and the Frame (or the
+    Environment of the VM) where the lambda expression is evaluated.
+    """
+    __slots__ = ('code', 'lexical_parent')
+
+    def __init__(self, code, lexical_parent):
+        self.code = code
+        self.lexical_parent = lexical_parent
+
+    def check_arity(self, argc):
+        self.code.check_arity(argc)
+
+    def disasm(self):
+        return self.code.disasm()
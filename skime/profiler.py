@@ -0,0 +1,349 @@
+# Profile where the time goes when running Scheme programs. Usage:
+#
+#   python -m skime.profiler [-t TOP] [-o STACKS] file.scm ...
+#
+# or from Python, by making the profiler the engine of a VM:
+#
+#   profiler = Profiler()
+#   vm.engine = profiler.run
+#   vm.eval_string("(main)")
+#   print profiler.report()
+#
+# The profiler is an engine running the bytecode like insns.run, so a VM
+# not profiled pays nothing for it. It counts the instructions run, the
+# calls of each procedure and primitive and the time spent in them, with
+# and without the procedures they call, and the calls made at each call
+# site. The call sites are the ips of the call instructions, as shown by
+# the disasm of the procedure. The times of the calls are also recorded
+# by calling context, and written as collapsed stacks ("main;f;g 123",
+# in microseconds) read by flamegraph.pl and compatible tools.
+#
+# The superinstructions are run as the instructions they are made of,
+# so the calls they make can be seen. The instructions are counted
+# likewise.
+
+import sys
+import time
+from optparse import OptionParser
+
+from .vm      import VM
+from .iset    import INSTRUCTIONS, INSN_MAP
+from .insns   import INSN_ACTION, has_tag, TAG_CTX_SWITCH, NativeCode
+from .ctx     import add_traceback
+from .proc    import Procedure, Code
+from .prim    import Primitive, EnginePrimitive, PRIMITIVES, prim_apply
+from .call_cc import Continuation
+from .types.pair import Pair
+
+# The opcode run for each opcode: the first instruction of a
+# superinstruction, or else itself
+FIRST_OPCODE = [(insn.components and INSN_MAP[insn.components[0]].opcode)
+                or insn.opcode
+                for insn in INSTRUCTIONS]
+
+OP_RET = INSN_MAP['ret'].opcode
+OP_CALLS_ARGC = [INSN_MAP['call'].opcode, INSN_MAP['tail_call'].opcode]
+TAIL_CALL_OPCODES = [INSN_MAP[name].opcode
+                     for name in ['tail_call', 'tail_call_cc', 'tail_call_1cc']]
+CALL_OPCODES = [INSN_MAP[name].opcode
+                for name in ['call', 'call_cc', 'call_1cc']] + TAIL_CALL_OPCODES
+
+# The key of the top level forms run, all counted as one
+TOPLEVEL = '<toplevel>'
+
+class Stats(object):
+    "The times and the number of calls of a procedure or primitive."
+    __slots__ = ('calls', 'inclusive', 'exclusive', 'active')
+
+    def __init__(self):
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        # The number of calls not returned yet, the time of the
+        # recursive calls is only counted once in inclusive
+        self.active = 0
+
+class CallNode(object):
+    "A calling context: a procedure called from the context of the parent."
+    __slots__ = ('key', 'parent', 'children', 'time')
+
+    def __init__(self, key, parent):
+        self.key = key
+        self.parent = parent
+        self.children = {}
+        # The time spent in the procedure itself
+        self.time = 0.0
+
+    def child(self, key):
+        node = self.children.get(key)
+        if node is None:
+            node = self.children[key] = CallNode(key, self)
+        return node
+
+class Frame(object):
+    "A call being run."
+    __slots__ = ('key', 'start', 'children', 'node')
+
+    def __init__(self, key, start, node):
+        # The Code, Primitive or TOPLEVEL called
+        self.key = key
+        self.start = start
+        # The time spent in the calls made
+        self.children = 0.0
+        self.node = node
+
+class Profiler(object):
+    "An engine for VM profiling the code it runs, see the top of the module."
+    def __init__(self, timer=time.time):
+        self.timer = timer
+
+        # The number of times each opcode is run
+        self.opcodes = [0] * len(INSTRUCTIONS)
+        # The Stats by Code, Primitive or TOPLEVEL
+        self.stats = {}
+        # (caller, ip, callee) => the number of calls
+        self.sites = {}
+        # The root of the calling contexts
+        self.tree = CallNode(None, None)
+
+        # The calls being run, shared by the nested runs (e.g. when a
+        # primitive calls back a procedure)
+        self.stack = []
+
+        # The names of the primitives
+        self.primitives = {}
+        for idx in range(len(PRIMITIVES.cells)):
+            self.primitives[id(PRIMITIVES.cells[idx].value)] = \
+                PRIMITIVES.locals_name[idx]
+
+    ########################################
+    # Recording calls
+    ########################################
+    def enter(self, key):
+        if self.stack:
+            node = self.stack[-1].node.child(key)
+        else:
+            node = self.tree.child(key)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = Stats()
+        stats.calls += 1
+        stats.active += 1
+        self.stack.append(Frame(key, self.timer(), node))
+
+    def leave(self):
+        frame = self.stack.pop()
+        elapsed = self.timer() - frame.start
+        own = elapsed - frame.children
+        frame.node.time += own
+
+        stats = self.stats[frame.key]
+        stats.exclusive += own
+        stats.active -= 1
+        if stats.active == 0:
+            stats.inclusive += elapsed
+        if self.stack:
+            self.stack[-1].children += elapsed
+
+    def form_key(self, form):
+        if isinstance(form, Code):
+            return form
+        if isinstance(form, NativeCode):
+            # run for the primitive of the same name
+            return PRIMITIVES.read_local(PRIMITIVES.find_local(form.name))
+        return TOPLEVEL
+
+    def callee_key(self, callee):
+        if isinstance(callee, Procedure):
+            return callee.code
+        return callee
+
+    def resume(self, ctx, base):
+        """\
+        A continuation is resumed, make the calls being run those of the
+        contexts of ctx.
+        """
+        while len(self.stack) > base:
+            self.leave()
+        contexts = []
+        while ctx is not None and ctx.form is not None:
+            contexts.append(ctx)
+            ctx = ctx.parent
+        for ctx in reversed(contexts):
+            self.enter(self.form_key(ctx.form))
+
+    ########################################
+    # The engine
+    ########################################
+    def run(self, ctx):
+        "An engine for VM running instructions like insns.run, but profiling them."
+        stack = self.stack
+        base = len(stack)
+        self.enter(self.form_key(ctx.form))
+        try:
+            while ctx.ip < len(ctx.bytecode):
+                opcode = FIRST_OPCODE[ctx.bytecode[ctx.ip]]
+                self.opcodes[opcode] += 1
+
+                if opcode in CALL_OPCODES:
+                    ctx = self.call(ctx, opcode, base)
+                    continue
+
+                nctx = INSN_ACTION[opcode](ctx)
+                if has_tag(opcode, TAG_CTX_SWITCH) and nctx is not ctx:
+                    if opcode == OP_RET:
+                        if len(stack) > base:
+                            self.leave()
+                    elif nctx.parent is ctx:
+                        # e.g. an inlined primitive rebound to a procedure
+                        self.enter(self.form_key(nctx.form))
+                    else:
+                        self.resume(nctx, base)
+                    ctx = nctx
+            return ctx.pop()
+        except Exception, e:
+            add_traceback(e, ctx)
+            raise
+        finally:
+            while len(stack) > base:
+                self.leave()
+
+    def call(self, ctx, opcode, base):
+        "Run a call instruction, return the next context."
+        callee = ctx.top()
+        key = self.callee_key(callee)
+        site = (self.stack[-1].key, ctx.ip, key)
+        self.sites[site] = self.sites.get(site, 0) + 1
+
+        if opcode in OP_CALLS_ARGC:
+            args = ctx.stack[len(ctx.stack)-ctx.bytecode[ctx.ip+1]-1:-1]
+            while type(callee) is EnginePrimitive and \
+                      callee.proc is prim_apply and len(args) > 0:
+                # apply calls the procedure in the engine (see make_call),
+                # which is then run like the callee
+                self.enter(key)
+                self.leave()
+                if len(args) > 1:
+                    lst = args.pop()
+                else:
+                    lst = None
+                callee = args.pop(0)
+                while isinstance(lst, Pair):
+                    args.append(lst.first)
+                    lst = lst.rest
+                key = self.callee_key(callee)
+
+        if isinstance(callee, Primitive) and type(callee) is not EnginePrimitive:
+            # the primitive is run by the instruction
+            self.enter(key)
+            try:
+                nctx = INSN_ACTION[opcode](ctx)
+            finally:
+                self.leave()
+            if opcode in TAIL_CALL_OPCODES and len(self.stack) > base:
+                # and returns to the caller of ctx
+                self.leave()
+        else:
+            nctx = INSN_ACTION[opcode](ctx)
+            # map and the like run in contexts of their own too
+            if isinstance(callee, (Procedure, EnginePrimitive)):
+                if opcode in TAIL_CALL_OPCODES and len(self.stack) > base:
+                    self.leave()
+                self.enter(key)
+            else:
+                self.resume(nctx, base)
+        return nctx
+
+    ########################################
+    # Reports
+    ########################################
+    def name(self, key):
+        "Get the name of a Code, Primitive or TOPLEVEL in the reports."
+        if isinstance(key, Code):
+            return key.name or '<lambda>'
+        if isinstance(key, Primitive):
+            return self.primitives.get(id(key), '<primitive>')
+        if isinstance(key, Continuation):
+            return '<continuation>'
+        return key
+
+    def location(self, key, ip=None):
+        "Get ' (file:line)' for a Code or an ip in it, or '' if not known."
+        if isinstance(key, Code) and key.filename is not None:
+            if ip is None:
+                line = key.line
+            else:
+                line = key.line_of(ip)
+            if line is not None:
+                return ' (%s:%d)' % (key.filename, line)
+        return ''
+
+    def report(self, top=20):
+        "Return a report of the top procedures, instructions and call sites."
+        lines = ['%10s %12s %12s  procedure' % ('calls', 'inclusive', 'exclusive')]
+        stats = self.stats.items()
+        stats.sort(key=lambda x: x[1].exclusive, reverse=True)
+        for key, st in stats[:top]:
+            lines.append('%10d %10.3fms %10.3fms  %s' %
+                         (st.calls, st.inclusive*1000, st.exclusive*1000,
+                          self.name(key) + self.location(key)))
+
+        lines.append('')
+        lines.append('%10s  instruction' % 'count')
+        opcodes = [(n, op) for op, n in enumerate(self.opcodes) if n > 0]
+        opcodes.sort(reverse=True)
+        for n, op in opcodes[:top]:
+            lines.append('%10d  %s' % (n, INSTRUCTIONS[op].name))
+
+        lines.append('')
+        lines.append('%10s  call site' % 'count')
+        sites = self.sites.items()
+        sites.sort(key=lambda x: x[1], reverse=True)
+        for (caller, ip, callee), n in sites[:top]:
+            lines.append('%10d  %s+0x%04X -> %s%s' %
+                         (n, self.name(caller), ip, self.name(callee),
+                          self.location(caller, ip)))
+        return '\n'.join(lines)
+
+    def collapsed(self):
+        """\
+        Return the collapsed stacks of the calling contexts, one line
+        each with the time spent in microseconds.
+        """
+        lines = []
+        nodes = [(node, self.name(node.key))
+                 for node in self.tree.children.values()]
+        while nodes:
+            node, path = nodes.pop()
+            usec = int(node.time * 1000000)
+            if usec > 0:
+                lines.append('%s %d' % (path, usec))
+            for child in node.children.values():
+                nodes.append((child, '%s;%s' % (path, self.name(child.key))))
+        lines.sort()
+        return '\n'.join(lines)
+
+def main(argv):
+    parser = OptionParser(usage="%prog [-t TOP] [-o STACKS] file.scm ...")
+    parser.add_option('-t', '--top', type='int', default=20,
+                      help="the number of entries of each table to report")
+    parser.add_option('-o', '--stacks', metavar='STACKS',
+                      help="write the collapsed stacks for flamegraphs to STACKS")
+    options, files = parser.parse_args(argv)
+    if not files:
+        parser.error("no Scheme file to profile")
+
+    profiler = Profiler()
+    for path in files:
+        vm = VM()
+        vm.engine = profiler.run
+        vm.load(path)
+    print profiler.report(options.top)
+    if options.stacks:
+        io = open(options.stacks, 'w')
+        io.write(profiler.collapsed())
+        io.write('\n')
+        io.close()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -16,6 +16,10 @@ class Symbol(object):
         cls.symbols[name] = sym
         return sym
 
+    def __reduce__(self):
+        "Unpickled symbols are interned too."
+        return (Symbol, (self._name,))
+
     def __eq__(self, other):
         return self is other
     def __ne__(self, other):
@@ -0,0 +1,63 @@
+from array import array
+
+# The typecodes of the arrays of the homogeneous numeric vectors, by
+# the tags of their literals
+TYPECODES = {
+    'f64' : 'd',
+    's64' : 'l'
+    }
+TAGS = dict((code, tag) for tag, code in TYPECODES.items())
+
+class Vector(object):
+    """\
+    The vector of Scheme, a fixed number of elements indexed from 0.
+
+    The elements are held in the Python list items:
+
+      Vector([1, 2, 3]) <==> #(1 2 3)
+
+    The homogeneous numeric vectors hold them in an array instead, which
+    takes 8 bytes by element instead of a Python object. Only real
+    numbers can be stored into an f64 vector, where they become floats,
+    and only integers fitting in a C long into an s64 vector:
+
+      Vector(array('d', [1.0, 2.5])) <==> #f64(1.0 2.5)
+      Vector(array('l', [1, 2]))      <==> #s64(1 2)
+    """
+    __slots__ = ['items']
+
+    def __init__(self, items):
+        self.items = items
+
+    def get_tag(self):
+        "The tag of the literals: '', 'f64' or 's64'."
+        if type(self.items) is list:
+            return ''
+        return TAGS[self.items.typecode]
+    tag = property(get_tag)
+
+    def __eq__(self, other):
+        # #(1.0) and #f64(1.0) are not equal
+        return isinstance(other, Vector) and \
+               self.tag == other.tag and \
+               list(self.items) == list(other.items)
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __str__(self):
+        return '#%s(%s)' % (self.get_tag(),
+                            ' '.join([x.__str__() for x in self.items]))
+
+def make_vector(tag, items):
+    """\
+    Make a vector of the kind of tag holding the elements of a sequence.
+    Raise TypeError if an element can't be stored in a numeric vector,
+    the booleans too though Python takes them for integers.
+    """
+    if tag == '':
+        return Vector(list(items))
+    items = list(items)
+    for x in items:
+        if type(x) is bool:
+            raise TypeError("Not a number: %s" % x)
+    return Vector(array(TYPECODES[tag], items))
@@ -1,71 +1,138 @@
 # A Scheme expression is compiled into a Form. The Form object hold the
 # bytecode of the expression. To evaluate the form, a new Context is set up.
 # Instruction pointer and operand stack are held in the Context object.
-# Local variables are held in an Environment object, which are chained
-# through the lexical scope.
+# Local variables are held in an Environment object at compile time. At run
+# time, the values of the local variables of a procedure call are held in a
+# Frame object. Both are chained through the lexical scope. Global variables
+# are held in the Cells of the GlobalEnvironment of the VM instead.
 
-import os.path
+import os
 
-from .ctx               import Context
-from .env               import Environment
+from .ctx               import Context, StackContext
+from .env               import GlobalEnvironment
 from .                  import insns
 from .types.pair        import Pair
 from .proc              import Procedure
-from .prim              import Primitive, load_primitives
-from .insns             import run
+from .prim              import Primitive, PRIMITIVES
+from .insns             import run, run_threaded
 from .types.pair        import Pair as pair
 
-from .compiler.parser   import parse
+from .compiler.parser   import Parser, Reader
 from .compiler.compiler import Compiler
+from .cache             import BytecodeCache
+from .image             import Image
 
 from .errors            import WrongArgType
 
+# The directory of the cache of the forms compiled from the files loaded
+# by VM.load, see BytecodeCache. The cache is only used if it is given,
+# e.g. SKIME_CACHE_DIR=~/.cache/skime
+CACHE_DIR = os.environ.get('SKIME_CACHE_DIR') or None
+
 class VM(object):
 
-    def __init__(self):
+    # The execution engines. 'table' dispatches each instruction through
+    # the INSN_ACTION table, 'threaded' runs the threaded code produced by
+    # Builder.generate.
+    ENGINES = {
+        'table' : run,
+        'threaded' : run_threaded
+        }
+
+    def __init__(self, engine='table', shared_stack=False, cache_dir=CACHE_DIR,
+                 image=None):
+        engine_run = VM.ENGINES.get(engine)
+        if engine_run is None:
+            raise ValueError("No such engine: %s" % engine)
+        self.engine = engine_run
+
+        # With shared_stack, all the contexts push their values onto
+        # one stack instead of a list per context.
+        if shared_stack:
+            self.context_t = StackContext
+            self.stack = []
+        else:
+            self.context_t = Context
+            self.stack = None
+
+        # Without cache_dir, the loaded files are always compiled
+        if cache_dir is None:
+            self.cache = None
+        else:
+            self.cache = BytecodeCache(cache_dir)
+
+        # A VM made from an Image (see snapshot) starts with a copy of
+        # the global variables of the VM the image is taken from
+        if image is not None:
+            self.compiler, self.env = image.restore(self)
+            self.ctx = self.context_t(None, self.env, None)
+            return
+
         self.compiler = Compiler()
-        
-        self.env = Environment()
+        self.env = GlobalEnvironment()
         self.env.vm = self
-        load_primitives(self.env)
+        for idx in range(len(PRIMITIVES.cells)):
+            self.env.alloc_local(PRIMITIVES.locals_name[idx],
+                                 PRIMITIVES.cells[idx].value)
 
-        self.ctx = Context(None, self.env, None)
+        self.ctx = self.context_t(None, self.env, None)
 
         self.load(os.path.join(os.path.dirname(__file__),
                                'scheme',
                                'prim.scm'))
 
+    def snapshot(self):
+        """\
+        Take an Image of the VM. The VMs made from it (by VM(image=...))
+        start with the global variables of this VM, e.g. with the
+        libraries already loaded. Changes made by either VM afterwards
+        are not seen by the other. The continuations held by the global
+        variables can only be invoked in the VMs with the same
+        shared_stack.
+        """
+        return Image(self, self.compiler, self.env)
+
     def run(self, form):
         return form.eval(self.env, self)
 
     def load(self, path):
-        io = open(path)
-        content = io.read()
-        io.close()
+        """\
+        Load a file. The top level forms are read, compiled and run one by
+        one. Return the value of the last form.
+        """
+        if self.cache is not None:
+            return self.cache.load(self, path)
 
-        return self.eval_string("(begin %s)" % content)
+        result = None
+        io = open(path)
+        try:
+            reader = Reader(io, path)
+            for expr in reader:
+                result = self.run(self.compiler.compile(expr, self.env,
+                                                        reader.positions, path))
+        finally:
+            io.close()
+        return result
 
     def eval_string(self, script):
-        return self.run(self.compiler.compile(parse(script), self.env))
+        parser = Parser(script, '<string>')
+        expr = parser.parse()
+        return self.run(self.compiler.compile(expr, self.env,
+                                              parser.positions, parser.name))
 
     def apply(self, proc, args):
         if isinstance(proc, Procedure):
-            proc.check_arity(len(args))
-
-            ctx = Context(proc, proc.env.dup(), self.ctx)
-            for i in range(proc.fixed_argc):
-                ctx.env.assign_local(i, args[i])
-            if proc.fixed_argc != proc.argc:
-                rest = None
-                for i in range(len(args)-1, proc.fixed_argc-1, -1):
-                    rest = Pair(args[i], rest)
-                ctx.env.assign_local(proc.fixed_argc, rest)
+            code = proc.code
+            code.check_arity(len(args))
 
-            return run(ctx)
+            ctx = self.context_t(code,
+                                 code.make_frame(proc.lexical_parent, list(args)),
+                                 self.ctx)
+            return self.engine(ctx)
         
         elif isinstance(proc, Primitive):
             proc.check_arity(len(args))
-            return proc.call(self, *args)
+            return proc.apply(self, args)
         
         else:
             raise WrongArgType("Not a skime callable: %s" % proc)
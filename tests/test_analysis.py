@@ -0,0 +1,118 @@
+from helper import VM, parse
+
+from skime.types.pair import Pair as pair
+
+class TestAnalysis(object):
+    def analyze(self, code):
+        vm = VM()
+        analysis = vm.compiler.analyze(parse(code), vm.env)
+        bindings = {}
+        for binding in analysis.bindings:
+            bindings[str(binding.name)] = binding
+        return analysis, bindings
+
+    def test_bindings(self):
+        analysis, bindings = self.analyze("""
+        (lambda (n)
+          (let ((a 0) (b 0) (c 0) (d 0))
+            (set! a ((lambda (x) (+ x b)) n))
+            (lambda () (set! c d))))""")
+        assert bindings['n'].form == 'lambda'
+        assert not bindings['n'].captured
+
+        assert bindings['a'].mutated
+        assert not bindings['a'].captured
+        # captured by a lambda called in place
+        assert bindings['b'].captured
+        assert not bindings['b'].escaping
+        assert bindings['c'].captured and bindings['c'].mutated
+        assert bindings['c'].escaping
+        assert bindings['d'].escaping
+        assert not bindings['d'].mutated
+        assert bindings['d'].reasons
+
+        free = [[str(x) for x in info.free] for info in analysis.lambdas]
+        assert free == [[], ['b'], ['c', 'd']]
+
+    def test_continuation(self):
+        analysis, bindings = self.analyze("""
+        (let ((a 1))
+          (call/cc (lambda (k) k)))""")
+        assert bindings['a'].escaping
+        assert not bindings['a'].captured
+
+    def test_call(self):
+        # a continuation might be captured by the procedures called,
+        # but not by the primitives
+        analysis, bindings = self.analyze("""
+        (lambda (f)
+          (let ((a 1))
+            (if (car (list a)) (or a (not a))))
+          (let ((b 1))
+            (f b))
+          (let ((c 1))
+            (map car c))
+          (let ((d 1))
+            (cond (d => f)
+                  (else d))))""")
+        assert not bindings['a'].escaping
+        assert bindings['b'].escaping
+        assert bindings['c'].escaping
+        assert bindings['d'].escaping
+        assert bindings['d'].reasons
+
+        analysis, bindings = self.analyze("""
+        (let ((a 1))
+          (cond (a (cons a a))
+                (else a)))""")
+        assert not bindings['a'].escaping
+
+    def test_macro(self):
+        # macro uses are expanded
+        analysis, bindings = self.analyze("""
+        (begin
+          (define-syntax delay-it (syntax-rules ()
+                                    ((_ e) (lambda () e))))
+          (let ((a 1) (b 2))
+            (delay-it a)))""")
+        assert bindings['a'].escaping
+        assert not bindings['b'].escaping
+
+    def test_compile(self):
+        vm = VM()
+        assert vm.eval_string("""
+        (begin
+          (define (foo n)
+            (let ((acc 0) (k #f))
+              (do ((i 0 (+ i 1)))
+                  ((= i n) (cons acc k))
+                (set! acc ((lambda (x) (+ x acc)) i))
+                (let ((j i))
+                  (set! k (lambda () j))))))
+          (let ((res (foo 5)))
+            (list (car res) ((cdr res)))))""") == pair(10, pair(4, None))
+        code = vm.eval_string("foo").disasm()
+        # the let of j compiled into a call, the lambda called in
+        # place is compiled like a let in the frame
+        assert code.count('make_closure') == 1
+
+    def test_analyzed_once(self):
+        from skime.compiler import compiler
+        original = compiler.Analyzer
+        walked = []
+        class Analyzer(original):
+            def walk(self, expr):
+                walked.append(expr)
+                original.walk(self, expr)
+        vm = VM()
+        code = parse("(lambda (a) %s a%s)" % \
+                     (''.join(["(let ((a (+ a %d))) " % i for i in range(20)]),
+                      ')' * 20))
+        compiler.Analyzer = Analyzer
+        try:
+            form = vm.compiler.compile(code, vm.env)
+        finally:
+            compiler.Analyzer = original
+        # the nested lets are analyzed along with the outermost one
+        assert len(walked) < 200
+        assert 'make_closure' not in form.literals[0].disasm()
@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+
+from helper import VM
+
+from skime import cache
+
+from skime.types.pair import Pair as pair
+from skime.errors import ParseError
+
+from nose.tools import assert_raises
+
+LIBRARY = """
+(define-syntax swap!
+  (syntax-rules ()
+    ((_ a b) (let ((tmp a)) (set! a b) (set! b tmp)))))
+(define (square x) (* x x))
+(define (sum-squares a b) (+ (square a) (square b)))
+(define (swapped a b) (swap! a b) (list a b))
+(define table #f64(1 2.5))
+(define (day) (* 60 60 24))
+"""
+
+class TestCache(object):
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'lib.scm')
+        self.write(LIBRARY)
+        # the prelude is cached too
+        VM(cache_dir=self.dir)
+        self.prelude = os.listdir(self.dir)
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, content):
+        io = open(self.path, 'w')
+        io.write(content)
+        io.close()
+
+    def cache_files(self):
+        return [x for x in os.listdir(self.dir)
+                if x.endswith('.skc') and x not in self.prelude]
+
+    def load(self, compile=True):
+        vm = VM(cache_dir=self.dir)
+        if not compile:
+            def fail(sexp, env, positions=None, filename=None):
+                raise AssertionError("compiled %s" % sexp)
+            vm.compiler.compile = fail
+        vm.load(self.path)
+        return vm
+
+    def check(self, vm):
+        assert vm.eval_string("(vector-ref table 1)") == 2.5
+        assert vm.eval_string("(sum-squares 3 4)") == 25
+        assert vm.eval_string("(swapped 1 2)") == pair(2, pair(1, None))
+        assert vm.eval_string("""
+        (let ((x 1) (y 2))
+          (swap! x y)
+          (list x y))""") == pair(2, pair(1, None))
+
+    def test_warm_start(self):
+        self.check(self.load())
+        files = self.cache_files()
+        assert len(files) == 1
+
+        # the form and the macro are read from the cache
+        vm = self.load(compile=False)
+        del vm.compiler.compile
+        self.check(vm)
+        assert self.cache_files() == files
+
+    def test_invalidate(self):
+        self.load()
+        self.write(LIBRARY + "(define (cube x) (* x x x))")
+        vm = self.load()
+        assert vm.eval_string("(cube 2)") == 8
+        assert len(self.cache_files()) == 2
+
+        # the same source compiled with other macros
+        vm = VM(cache_dir=self.dir)
+        vm.eval_string("(define-syntax swap! (syntax-rules () ((_ a b) #f)))")
+        vm.load(self.path)
+        assert len(self.cache_files()) == 3
+
+    def test_compiler_changed(self):
+        self.load()
+        version = cache.COMPILER_VERSION
+        try:
+            cache.COMPILER_VERSION = 'changed'
+            self.check(self.load())
+        finally:
+            cache.COMPILER_VERSION = version
+        # the prelude is compiled again too
+        assert len(self.cache_files()) == 3
+
+    def test_opt_in(self):
+        if not os.environ.get('SKIME_CACHE_DIR'):
+            assert VM().cache is None
+
+    def test_broken_file(self):
+        self.load()
+        for name in self.cache_files():
+            io = open(os.path.join(self.dir, name), 'w')
+            io.write('broken')
+            io.close()
+        self.check(self.load())
+
+    def test_inlined(self):
+        user = os.path.join(self.dir, 'user.scm')
+        io = open(user, 'w')
+        io.write("(define (f x) (square (+ x 1)))")
+        io.close()
+        vm = self.load()
+        vm.load(user)
+        assert 'goto_if_rebound' in vm.eval_string("f").disasm()
+
+        vm = self.load(compile=False)
+        vm.load(user)
+        del vm.compiler.compile
+        assert vm.eval_string("(f 2)") == 9
+        vm.eval_string("(define (square x) 0)")
+        assert vm.eval_string("(f 2)") == 0
+
+        # the guard of the folded call holds the primitive of the VM
+        assert vm.eval_string("*") in vm.eval_string("day").code.literals
+        assert vm.eval_string("(day)") == 86400
+        vm.eval_string("(define (* . args) 0)")
+        assert vm.eval_string("(day)") == 0
+
+    def test_streaming(self):
+        # the forms are run before the rest is parsed
+        self.write(LIBRARY + "(define loaded #t) (oops")
+        for cache_dir in [None, self.dir]:
+            vm = VM(cache_dir=cache_dir)
+            assert_raises(ParseError, vm.load, self.path)
+            assert vm.eval_string("loaded") == True
+        assert self.cache_files() == []
+
+        # the procedures defined before are inlined
+        self.write(LIBRARY + "(define (cube x) (* (square x) x))")
+        vm = self.load()
+        assert 'goto_if_rebound' in vm.eval_string("cube").disasm()
+        vm = self.load(compile=False)
+        del vm.compiler.compile
+        assert vm.eval_string("(cube 3)") == 27
@@ -1,5 +1,9 @@
 import helper
 
+from skime.errors import MiscError
+
+from nose.tools import assert_raises
+
 class TestCallCc(object):
     def __init__(self):
         self.compiler = helper.Compiler()
@@ -18,5 +22,124 @@ class TestCallCc(object):
                  (set! return cont)
                  1)))""") == 2
         assert self.eval(vm, "(return 22)") == 23
-        
-        
+
+    def test_reenter(self):
+        # The frames of g and the top level have changed when the
+        # continuation is invoked again, the captured ones are used
+        code = """
+        (begin
+          (define k #f)
+          (define count 0)
+          (define (f) (+ 100 (call/cc (lambda (c) (set! k c) 1))))
+          (define (g) (list 1 (f) 2))
+          (define result '())
+          (set! result (cons (g) result))
+          (if (< count 2)
+              (begin
+                (set! count (+ count 1))
+                (k count)))
+          result)"""
+        expected = "((1 102 2) (1 101 2) (1 101 2))"
+        for shared_stack in [False, True]:
+            vm = helper.VM(shared_stack=shared_stack)
+            assert self.eval(vm, code) == self.eval(vm, "'%s" % expected)
+
+    def test_reenter_loop(self):
+        # The continuation is captured in a procedure called in the
+        # body of the let, each iteration has its own x
+        code = """
+        (begin
+          (define k #f)
+          (define out '())
+          (define (mark)
+            (call/cc (lambda (c) (if (not k) (set! k c)))))
+          (define (run)
+            (do ((i 0 (+ i 1)))
+                ((>= i 2))
+              (let ((x (* i 10)))
+                (mark)
+                (set! out (cons x out)))))
+          (define count 0)
+          (run)
+          (if (= count 0)
+              (begin
+                (set! count 1)
+                (k #f)))
+          out)"""
+        for shared_stack in [False, True]:
+            vm = helper.VM(shared_stack=shared_stack)
+            assert self.eval(vm, code) == self.eval(vm, "'(0 10 0)")
+
+    def test_call_1cc(self):
+        vm = helper.VM()
+        assert self.eval(vm, "(+ 1 (call/1cc (lambda (k) (+ 10 (k 2)))))") == 3
+        assert self.eval(vm, "(+ 1 (call/1cc (lambda (k) 5)))") == 6
+
+        # a generator of the elements of a list
+        assert self.eval(vm, """
+        (begin
+          (define (make-gen lst)
+            (define return #f)
+            (define resume #f)
+            (define (walk lst)
+              (if (null? lst)
+                  (return 'done)
+                  (begin
+                    (call/1cc
+                      (lambda (next)
+                        (set! resume next)
+                        (return (car lst))))
+                    (walk (cdr lst)))))
+            (lambda ()
+              (call/1cc
+                (lambda (r)
+                  (set! return r)
+                  (if resume
+                      (resume #f)
+                      (walk lst))))))
+          (define g (make-gen '(1 2 3)))
+          (list (g) (g) (g) (g)))""") == self.eval(vm, "'(1 2 3 done)")
+
+    def test_call_1cc_once(self):
+        vm = helper.VM()
+        self.eval(vm, "(define k #f)")
+        self.eval(vm, "(call/1cc (lambda (c) (set! k c) (c 1)))")
+        assert_raises(MiscError, self.eval, vm, "(k 2)")
+
+    def test_call_1cc_returned(self):
+        vm = helper.VM()
+        self.eval(vm, "(define k #f)")
+        assert self.eval(vm, "(+ 1 (call/1cc (lambda (c) (set! k c) 1)))") == 2
+        assert_raises(MiscError, self.eval, vm, "(k 2)")
+
+        # in tail position the call returns to the caller
+        self.eval(vm, "(define (f) (call/1cc (lambda (c) (set! k c) 1)))")
+        assert self.eval(vm, "(+ 1 (f))") == 2
+        assert_raises(MiscError, self.eval, vm, "(k 2)")
+
+        # the continuation of a former iteration of a loop
+        assert_raises(MiscError, self.eval, vm, """
+        (do ((i 0 (+ i 1)))
+            ((= i 2))
+          (call/1cc (lambda (c)
+                      (if (= i 0)
+                          (set! k c)
+                          (k 0)))))""")
+
+    def test_capture_deep(self):
+        # with a shared stack, only the values of the contexts not
+        # shared yet are saved
+        vm = helper.VM(shared_stack=True)
+        self.eval(vm, """
+        (begin
+          (define k #f)
+          (define (deep n)
+            (if (= n 0)
+                (+ (call/cc (lambda (c) (set! k c) 0))
+                   (call/cc (lambda (c) (set! k c) 0)))
+                (+ 1 (deep (- n 1))))))""")
+        assert self.eval(vm, "(deep 500)") == 500
+        cc = self.eval(vm, "k")
+        assert len(cc.ctx.stack) < 5
+        assert len(cc.ctx.parent.saved) < 5
+        assert self.eval(vm, "(list 1 (k 5))") == 505
@@ -0,0 +1,154 @@
+import helper
+
+from skime.types.pair import Pair as pair
+
+from nose.tools import assert_raises
+
+class TestThreadedEngine(object):
+    """\
+    Run programs under the threaded engine and check they behave
+    the same as under the table engine.
+    """
+    def eval(self, engine, code):
+        vm = helper.VM(engine=engine)
+        form = vm.compiler.compile(helper.parse(code), vm.env)
+        return vm.run(form)
+
+    def check(self, code):
+        assert self.eval('threaded', code) == self.eval('table', code)
+
+    def test_basic(self):
+        assert self.eval('threaded', '(+ 1 2 3)') == 6
+        assert self.eval('threaded', '(if #f 1 2)') == 2
+
+    def test_recursion(self):
+        self.check("""
+        (begin
+          (define (fib n)
+            (if (< n 2)
+                n
+                (+ (fib (- n 1)) (fib (- n 2)))))
+          (fib 15))""")
+
+    def test_control_flow(self):
+        self.check("""
+        (do ((i 0 (+ i 1))
+             (acc '() (cons i acc)))
+            ((= i 5) acc))""")
+        self.check("""
+        (cond (#f 5 6)
+              ((+ 2 3) => (lambda (x) (* x x)))
+              (else 10))""")
+
+    def test_reentrant(self):
+        # map calls back into the engine through VM.apply
+        assert self.eval('threaded', "(map (lambda (x) (* x x)) '(1 2 3))") == \
+               pair(1, pair(4, pair(9, None)))
+
+    def test_call_cc(self):
+        vm = helper.VM(engine='threaded')
+        vm.eval_string("(define return #f)")
+        assert vm.eval_string("""
+        (+ 1 (call/cc
+               (lambda (cont)
+                 (set! return cont)
+                 1)))""") == 2
+        assert vm.eval_string("(return 22)") == 23
+
+    def test_unknown_engine(self):
+        assert_raises(ValueError, helper.VM, engine='no-such-engine')
+
+class TestSuperinstructions(object):
+    def compile(self, vm, code):
+        return vm.compiler.compile(helper.parse(code), vm.env)
+
+    def test_fused(self):
+        from skime.iset import INSTRUCTIONS
+
+        vm = helper.VM()
+        form = self.compile(vm, "(define (foo a b) (cons a b))")
+        proc = form.literals[0]
+        insn = INSTRUCTIONS[proc.bytecode[0]]
+        assert insn.components == ['push_local', 'push_local']
+        assert 'push_local_push_local' in proc.disasm()
+
+    def test_fused_test(self):
+        # the inlined tests are fused with the jump after them
+        vm = helper.VM()
+        for test, name in [("(< a b)", 'push_local_push_local_lt2_goto_if_false'),
+                           ("(> a b)", 'gt2_goto_if_false'),
+                           ("(eq? a b)", 'eq_p_goto_if_false'),
+                           ("(null? a)", 'push_local_null_p_goto_if_false'),
+                           ("(not a)", 'not_goto_if_false')]:
+            form = self.compile(vm, "(define (foo a b) (if %s 1 2))" % test)
+            assert name in form.literals[0].disasm()
+
+        for engine in ['table', 'threaded']:
+            for shared_stack in [False, True]:
+                vm = helper.VM(engine=engine, shared_stack=shared_stack)
+                vm.eval_string("""
+                (begin
+                  (define (test a b)
+                    (list (if (< a b) 'y 'n) (if (= a 0) 'y 'n)
+                          (if (null? a) 'y 'n) (if (not a) 'y 'n))))""")
+                assert vm.eval_string("(test 0 1)") == \
+                       helper.parse("(y y n n)")
+                assert vm.eval_string("(test 1.5 1)") == \
+                       helper.parse("(n n n n)")
+                # the values of the primitives rebound are tested
+                vm.eval_string("(set! < (lambda (a b) (if (> a b) #f 'z)))")
+                vm.eval_string("(set! = (lambda (a b) #f))")
+                vm.eval_string("(set! null? (lambda (a) 0))")
+                vm.eval_string("(set! not (lambda (a) #f))")
+                assert vm.eval_string("(test 0 1)") == \
+                       helper.parse("(y n y n)")
+                assert vm.eval_string("(test 2 1)") == \
+                       helper.parse("(n n y n)")
+
+    def test_jump_into_fused(self):
+        # the set_local instructions of the loop are fused, the loop
+        # jumps back to the test in the middle of other sequences
+        for engine in ['table', 'threaded']:
+            vm = helper.VM(engine=engine)
+            assert vm.eval_string("""
+            (do ((a 6 b) (b 9 (remainder a b)))
+                ((= b 0) a))""") == 3
+
+class TestSharedStack(object):
+    "Run programs with all the contexts sharing one value stack."
+    def eval(self, shared_stack, code):
+        vm = helper.VM(shared_stack=shared_stack)
+        return vm.eval_string(code)
+
+    def check(self, code):
+        assert self.eval(True, code) == self.eval(False, code)
+
+    def test_calls(self):
+        self.check("""
+        (begin
+          (define (tak x y z)
+            (if (not (< y x))
+                z
+                (tak (tak (- x 1) y z)
+                     (tak (- y 1) z x)
+                     (tak (- z 1) x y))))
+          (list (tak 12 8 4) (+ 1 (tak 6 4 2))))""")
+
+    def test_reentrant(self):
+        assert self.eval(True, "(map (lambda (x) (+ x 1)) '(1 2 3))") == \
+               pair(2, pair(3, pair(4, None)))
+        # nothing is left on the stack after a run
+        vm = helper.VM(shared_stack=True)
+        vm.eval_string("(list 1 (map car '((1) (2))) 3)")
+        assert vm.stack == []
+
+    def test_call_cc(self):
+        vm = helper.VM(shared_stack=True)
+        vm.eval_string("(define return #f)")
+        assert vm.eval_string("""
+        (list 1 2 (call/cc
+                    (lambda (cont)
+                      (set! return cont)
+                      3)))""") == pair(1, pair(2, pair(3, None)))
+        # the values of the context below the continuation are restored
+        assert vm.eval_string("(return 5)") == pair(1, pair(2, pair(5, None)))
@@ -0,0 +1,112 @@
+import cPickle as pickle
+
+from helper import VM
+
+from skime.types.pair import Pair as pair
+from skime.errors import WrongArgType, MiscError
+from skime.ctx import format_traceback
+from skime.insns import NativeCode, NATIVE_CODE
+from skime.profiler import Profiler
+
+def lst(*items):
+    result = None
+    for item in reversed(items):
+        result = pair(item, result)
+    return result
+
+def vms():
+    for engine in ['table', 'threaded']:
+        for shared_stack in [False, True]:
+            yield VM(engine=engine, shared_stack=shared_stack)
+
+class TestHigherOrder(object):
+    def test_map(self):
+        for vm in vms():
+            assert vm.eval_string("(map (lambda (x) (* x x)) '(1 2 3))") == lst(1, 4, 9)
+            assert vm.eval_string("(map car '((1) (2)))") == lst(1, 2)
+            assert vm.eval_string("(map - '(1 2) '(3 4))") == lst(-2, -2)
+            assert vm.eval_string("(map apply (list + -) '((1 2) (3)))") == lst(3, -3)
+            assert vm.eval_string("(map car '())") is None
+            assert vm.eval_string("(list 1 (map car '((2))) 3)") == lst(1, lst(2), 3)
+            # nothing is left on the stack after a run
+            assert vm.stack in (None, [])
+
+    def test_for_each(self):
+        for vm in vms():
+            vm.eval_string("(define total 0)")
+            assert vm.eval_string("""
+            (for-each (lambda (x y) (set! total (+ total (* x y))))
+                      '(1 2 3) '(4 5 6))""") is None
+            assert vm.eval_string("total") == 32
+            assert vm.eval_string("(for-each car '())") is None
+
+    def test_errors(self):
+        for vm in vms():
+            for source in ["(map cons '(1 2) '(3))", "(for-each cons '(1) '())"]:
+                try:
+                    vm.eval_string(source)
+                except MiscError, e:
+                    assert 'same length' in str(e)
+                else:
+                    assert False
+            try:
+                vm.eval_string("(map (lambda (x) (car x)) '((1) 2))")
+            except WrongArgType, e:
+                assert 'in map' in format_traceback(e)
+            else:
+                assert False
+
+    def test_deep_recursion(self):
+        # recursing through map doesn't nest the Python stack
+        for vm in vms():
+            vm.eval_string("""
+            (begin
+              (define (nest i acc) (if (= i 0) acc (nest (- i 1) (list acc))))
+              (define (depth tree)
+                (if (pair? tree)
+                    (+ 1 (apply max (map depth tree)))
+                    0)))""")
+            assert vm.eval_string("(depth (nest 3000 '()))") == 3000
+
+    def test_apply(self):
+        for vm in vms():
+            assert vm.eval_string("(apply (lambda () 1))") == 1
+            assert vm.eval_string("(apply map car '(((1) (2))))") == lst(1, 2)
+
+    def test_call_cc(self):
+        # a continuation captured in map returns a new list each time,
+        # the state of map is on the stack of its context
+        for vm in vms():
+            assert vm.eval_string("""
+            (let ((k #f) (results '()))
+              (let ((r (map (lambda (x)
+                              (call/cc (lambda (c) (if (= x 2) (set! k c)) x)))
+                            '(1 2 3))))
+                (set! results (cons r results))
+                (if (pair? (cdr results))
+                    results
+                    (k 10))))""") == lst(lst(1, 10, 3), lst(1, 2, 3))
+
+    def test_escape(self):
+        for vm in vms():
+            assert vm.eval_string("""
+            (call/cc (lambda (k)
+                       (for-each (lambda (x) (if (> x 1) (k x))) '(1 2 3))
+                       0))""") == 2
+
+    def test_pickle(self):
+        for code in NATIVE_CODE.values():
+            assert isinstance(code, NativeCode)
+            assert pickle.loads(pickle.dumps(code, 2)) is code
+
+    def test_profiler(self):
+        vm = VM()
+        profiler = Profiler()
+        vm.engine = profiler.run
+        vm.eval_string("(define (sq x) (* x x))")
+        assert vm.eval_string("(map sq '(1 2 3))") == lst(1, 4, 9)
+        assert profiler.stack == []
+        calls = dict((profiler.name(key), st.calls)
+                     for key, st in profiler.stats.items())
+        assert calls['map'] == 1
+        assert calls['sq'] == 3
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+
+from helper import VM
+
+from skime.types.pair import Pair as pair
+from skime.image import load_image
+
+class TestImage(object):
+    def setup(self):
+        self.vm = VM()
+        for code in ["(define (square x) (* x x))",
+                     "(define (f y) (square (+ y 1)))",
+                     "(define lst (list 1 2 3))",
+                     "(define vec (f64vector 1 2))",
+                     "(define count 0)",
+                     "(define (inc!) (set! count (+ count 1)) count)",
+                     "(define-syntax swap! (syntax-rules () ((_ a b) (let ((tmp a)) (set! a b) (set! b tmp)))))",
+                     "(define saved #f)",
+                     "(define (gen) (+ 1 (call/cc (lambda (c) (set! saved c) 1))))"]:
+            self.vm.eval_string(code)
+        assert self.vm.eval_string("(gen)") == 2
+
+    def check(self, vm):
+        assert vm.eval_string("(f 2)") == 9
+        assert vm.eval_string("(let ((a 1) (b 2)) (swap! a b) (list a b))") == \
+               pair(2, pair(1, None))
+        assert vm.eval_string("(inc!)") == 1
+        # the continuation captured in the original VM, only if the
+        # stack modes are the same
+        if (vm.stack is None) == (self.vm.stack is None):
+            assert vm.eval_string("(saved 10)") == 11
+
+    def test_fork(self):
+        image = self.vm.snapshot()
+        for engine in ['table', 'threaded']:
+            for shared_stack in [False, True]:
+                vm = VM(image=image, engine=engine, shared_stack=shared_stack)
+                self.check(vm)
+                vm.eval_string("(set-car! lst 0)")
+                vm.eval_string("(vector-set! vec 0 0)")
+                vm.eval_string("(define (square x) 0)")
+                assert vm.eval_string("(f 2)") == 0
+
+        # the original VM and the image are not changed
+        assert self.vm.eval_string("lst") == pair(1, pair(2, pair(3, None)))
+        assert self.vm.eval_string("(vector-ref vec 0)") == 1.0
+        assert self.vm.eval_string("(list (f 2) count)") == pair(9, pair(0, None))
+        self.check(VM(image=image))
+
+    def test_shared_stack(self):
+        vm = VM(shared_stack=True)
+        vm.eval_string("(define saved #f)")
+        vm.eval_string("(define (gen) (+ 1 (call/cc (lambda (c) (set! saved c) 1))))")
+        assert vm.eval_string("(list 1 (gen) 5)") == \
+               pair(1, pair(2, pair(5, None)))
+        image = vm.snapshot()
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'test.img')
+            image.save(path)
+            images = [image, load_image(path)]
+        finally:
+            shutil.rmtree(tmp)
+        # the contexts waiting for the continuation use the stack of
+        # the VM it is invoked in
+        for image in images:
+            for engine in ['table', 'threaded']:
+                forked = VM(image=image, engine=engine, shared_stack=True)
+                assert forked.eval_string("(saved 10)") == \
+                       pair(1, pair(11, pair(5, None)))
+                assert forked.stack == []
+        assert vm.eval_string("(saved 10)") == pair(1, pair(11, pair(5, None)))
+
+    def test_save(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'test.img')
+            self.vm.snapshot().save(path)
+            image = load_image(path)
+        finally:
+            shutil.rmtree(tmp)
+        self.check(VM(image=image, engine='threaded'))
+        self.check(VM(image=image))
@@ -1,6 +1,12 @@
 from helper import HelperVM
 
 from skime.types.pair import Pair as pair
+from skime.types.symbol import Symbol as sym
+from skime.errors import UnboundVariable
+from skime.compiler.parser import parse
+from skime.vm import VM
+
+from nose.tools import assert_raises
 
 class TestMacro(HelperVM):
     """\
@@ -73,3 +79,81 @@ class TestMacro(HelperVM):
                                  ((_ var) (define var 10))))
           (def10 foo)
           foo)""") == 10
+
+    def test_deep_recursion(self):
+        # macro uses don't nest the interpreter loop on the Python stack
+        assert self.eval("""
+        (begin
+          (define-syntax my-if (syntax-rules ()
+                                 ((_ c a b) (cond (c a) (else b)))))
+          (define (sum n)
+            (my-if (= n 0) 0 (+ n (sum (- n 1)))))
+          (sum 5000))""") == 12502500
+
+    def test_tail_call(self):
+        assert self.eval("""
+        (begin
+          (define-syntax my-if (syntax-rules ()
+                                 ((_ c a b) (cond (c a) (else b)))))
+          (define (count n)
+            (my-if (= n 0) 'done (count (- n 1))))
+          (count 20000))""") == self.eval("'done")
+
+    def test_hygiene(self):
+        # the binding made by the macro doesn't capture the variable
+        # passed to it
+        assert self.eval("""
+        (begin
+          (define-syntax my-or (syntax-rules ()
+                                 ((_) #f)
+                                 ((_ e) e)
+                                 ((_ e r ...) (let ((t e))
+                                                (if t t (my-or r ...))))))
+          (define t 5)
+          (my-or #f t))""") == 5
+
+        # the variables inserted by the macro refer to the bindings
+        # where the macro is defined
+        assert self.eval("""
+        (begin
+          (define-syntax my-if (syntax-rules ()
+                                 ((_ c a b) (cond (c a) (else b)))))
+          (let ((else #f))
+            (my-if #f 1 2)))""") == 2
+
+        # even if they are not bound there, they are not captured by
+        # the variables where the macro is used
+        vm = VM()
+        vm.eval_string("""
+        (define-syntax my-list (syntax-rules ()
+                                 ((_ a) (if a (list a) (helper a)))))""")
+        assert vm.eval_string("""
+        (let ((list (lambda x 'captured)) (if 0))
+          (my-list 1))""") == pair(1, None)
+        assert_raises(UnboundVariable, vm.eval_string, """
+        (let ((helper (lambda x 'captured)))
+          (my-list #f))""")
+        vm.eval_string("(define (helper x) 'global)")
+        assert vm.eval_string("""
+        (let ((helper (lambda x 'captured)))
+          (my-list #f))""") == sym('global')
+
+    def test_plain_bytecode(self):
+        # macro uses are expanded in place, into the same instructions
+        # as the code written by hand
+        vm = VM()
+        form = self.compiler.compile(parse("""
+        (begin
+          (define-syntax swap! (syntax-rules ()
+                                 ((_ a b) (let ((tmp a))
+                                            (set! a b)
+                                            (set! b tmp)))))
+          (define-syntax my-if (syntax-rules ()
+                                 ((_ c a b) (cond (c a) (else b)))))
+          (define (foo x y)
+            (swap! x y)
+            (my-if (< x y) x y)))"""), vm.env)
+        code = form.disasm() + form.literals[0].disasm()
+        assert 'dynamic' not in code
+        assert 'goto_if_false' in code
+        assert 'lt2' in code
@@ -0,0 +1,223 @@
+from helper import VM, parse
+
+from skime.types.symbol import Symbol as sym
+from skime.types.pair import Pair as pair
+from skime.compiler.compiler import Compiler
+from skime.compiler.builder import Builder
+
+from nose.tools import assert_raises
+
+class TestOptimize(object):
+    def eval(self, code, optimize=1):
+        vm = VM()
+        vm.compiler = Compiler(optimize=optimize)
+        return vm.eval_string(code)
+
+    def disasm(self, code, optimize=1):
+        vm = VM()
+        vm.compiler = Compiler(optimize=optimize)
+        form = vm.compiler.compile(parse(code), vm.env)
+        return form.literals[0].disasm()
+
+    def check(self, code):
+        "The result is the same without optimization."
+        val = self.eval(code)
+        assert val == self.eval(code, optimize=0)
+        return val
+
+    def test_fold(self):
+        assert self.check("(* 60 60 24)") == 86400
+        assert self.check("(+ (* 2 3) (- 10 4))") == 12
+        assert self.check("(< 1 2 3)") == True
+        assert self.check("(eq? 'a 'a)") == True
+        code = self.disasm("(lambda () (* 60 (* 60 24)))")
+        assert '86400' in code
+        assert 'goto_if_rebound' in code
+
+        # not folded: shadowed, not pure, or raising errors
+        assert self.check("((lambda (*) (* 2 3)) +)") == 5
+        assert 'mul2' in self.disasm("(lambda (x) (* x 2))")
+        assert 'cons' in self.disasm("(lambda () (cons 1 2))")
+        assert_raises(ZeroDivisionError, self.eval, "(/ 1 0)")
+
+        # nor large numbers
+        def literals(code):
+            vm = VM()
+            vm.compiler = Compiler(optimize=1)
+            return vm.compiler.compile(parse(code), vm.env).literals
+        assert 2**100 in literals("(lambda () (expt 2 100))")
+        lits = literals("(lambda () (list (expt 10 100000) (expt 2 1000)))")
+        assert 10**100000 not in lits
+        assert 2**1000 not in lits
+        assert len(str(self.eval("(expt 10 1000)"))) == 1001
+        big = '1' + '0' * 100
+        assert 10**300 not in literals("(* %s %s %s)" % (big, big, big))
+        assert self.check("(* %s %s %s)" % (big, big, big)) == 10**300
+
+    def test_fold_rebound(self):
+        # the primitives defined or set! in the code are not folded
+        for optimize in [1, 2]:
+            assert self.eval("(begin (define (+ a b) (* a b)) (+ 2 3))",
+                             optimize) == 6
+            assert self.eval("(begin (define (not x) 42) (if (not #t) 1 2))",
+                             optimize) == 1
+            assert self.eval("(begin (set! - +) (- 2 3))", optimize) == 5
+
+        # nor those rebound after the code is compiled
+        for optimize in [1, 2]:
+            vm = VM()
+            vm.compiler = Compiler(optimize=optimize)
+            vm.eval_string("(define (f) (+ 1 2))")
+            vm.eval_string("(define (g) (if (not #t) 1 2))")
+            vm.eval_string("(define (h) (list (* 2 (+ 1 2)) (- 5)))")
+            assert vm.eval_string("(list (f) (g))") == pair(3, pair(2, None))
+            vm.eval_string("(define (+ a b) (* a b))")
+            vm.eval_string("(define (not x) 42)")
+            assert vm.eval_string("(list (f) (g))") == pair(2, pair(1, None))
+            assert vm.eval_string("(h)") == pair(4, pair(-5, None))
+
+    def test_if(self):
+        assert self.check("(if (< 1 2) 'a 'b)") == sym('a')
+        assert self.check("(if (> 1 2) 'a)") == None
+        code = self.disasm("(lambda () (if '(1) 1 (car 1)))")
+        assert 'goto' not in code
+        assert 'car' not in code
+        # the test folded might change
+        code = self.disasm("(lambda () (if (null? '()) 1 (car 1)))")
+        assert 'goto_if_rebound' in code
+        assert 'car' in code
+
+    def test_cond(self):
+        assert self.check("""
+        (cond ((= 1 2) 1)
+              ((+ 1 2) => (lambda (x) (* x x)))
+              (else 3))""") == 9
+        assert self.check("(cond (#f 1) ((null? '())) (else 2))") == True
+        assert self.check("(cond ((= 1 2) 1))") == None
+        # the clauses after a true one are not compiled
+        assert self.eval("(cond (#t 1) (unbound 2))") == 1
+
+    def test_and_or(self):
+        assert self.eval("(and 1 #t)") == True
+        assert self.eval("(and 1 #f unbound)") == False
+        assert self.eval("(or #f 2 unbound)") == 2
+        assert self.eval("(or (car '(#f)) #f)") == False
+        assert self.eval("(list (and) (or))") == pair(True, pair(False, None))
+
+    def test_unreachable(self):
+        vm = VM()
+        for optimize, length in [(0, 4), (1, 2)]:
+            bdr = Builder(vm.env, optimize=optimize)
+            bdr.emit('push_1')
+            bdr.emit('ret')
+            bdr.emit('push_0')
+            bdr.emit('pop')
+            assert len(bdr.generate().bytecode) == length
+
+        # a label is reachable by jumps
+        bdr = Builder(vm.env, optimize=1)
+        bdr.emit('goto', 'end')
+        bdr.emit('push_0')
+        bdr.def_label('end')
+        bdr.emit('push_1')
+        assert len(bdr.generate().bytecode) == 3
+
+    def test_literal_pool(self):
+        vm = VM()
+        form = vm.compiler.compile(parse("""
+        (lambda ()
+          (list 42 42.0 "s" '(1 2) '(1 2)
+                (lambda () (list 42 "s"))))"""), vm.env)
+        # the procedures share the literals of the form
+        code = form.literals[0]
+        assert code.literals is form.literals
+        lits = form.literals
+        assert sorted([type(x).__name__ for x in lits if x == 42]) == \
+               ['float', 'int']
+        assert len([x for x in lits if x == "s"]) == 1
+        # quoted lists are found by identity
+        assert len([x for x in lits if isinstance(x, pair)]) == 2
+
+    def test_inline(self):
+        vm = VM()
+        vm.compiler = Compiler(optimize=2)
+        # the procedures are inlined in the code compiled after they
+        # are defined
+        for code in ["(define (square x) (* x x))",
+                     "(define (twice x) (+ x x))",
+                     "(define (f y) (square (+ y 1)))",
+                     "(define (g +) (twice +))",
+                     "(define (h y) (list (square y) (square (square y))))"]:
+            vm.eval_string(code)
+        assert vm.eval_string("(f 3)") == 16
+        assert vm.eval_string("(g 5)") == 10
+        assert vm.eval_string("(h 2)") == pair(4, pair(16, None))
+        code = vm.eval_string("f").disasm()
+        assert 'goto_if_rebound' in code
+        assert 'mul2' in code
+
+        # the redefined procedure is called
+        vm.eval_string("(define (square x) (- x))")
+        assert vm.eval_string("(f 3)") == -4
+        assert vm.eval_string("(h 2)") == pair(-2, pair(2, None))
+
+    def test_inline_quote(self):
+        # the inlined body gives the same quoted objects
+        for engine in ['table', 'threaded']:
+            vm = VM(engine=engine)
+            vm.compiler = Compiler(optimize=2)
+            vm.eval_string("(define (f) '(1 (a) #(b)))")
+            vm.eval_string("(define (g) (eq? (f) (f)))")
+            assert 'goto_if_rebound' in vm.eval_string("g").disasm()
+            assert vm.eval_string("(g)") == True
+            assert vm.eval_string("(eq? (f) (f))") == True
+            assert vm.eval_string("(f)") == parse("(1 (a) #(b))")
+
+    def test_inline_escaping(self):
+        # the body calling a procedure would be made into a closure,
+        # the call is compiled instead
+        vm = VM()
+        vm.compiler = Compiler(optimize=2)
+        vm.eval_string("(define (q x) (+ x 1))")
+        vm.eval_string("(define (p x) (q x))")
+        vm.eval_string("(define (r y) (list (p y) (p (* y 2))))")
+        code = vm.eval_string("r").disasm()
+        assert 'make_closure' not in code
+        assert 'goto_if_rebound' not in code
+        assert vm.eval_string("(r 1)") == pair(2, pair(3, None))
+
+    def test_not_inlined(self):
+        vm = VM()
+        vm.compiler = Compiler(optimize=2, inline_budget=5)
+        for code in ["(define (fact n) (if (= n 0) 1 (* n (fact (- n 1)))))",
+                     "(define (adder n) (lambda (x) (+ x n)))",
+                     "(define (big x) (+ x x x x x x))",
+                     "(define (f n) (list (fact n) ((adder n) 1) (big n)))"]:
+            vm.eval_string(code)
+        assert vm.eval_string("(f 3)") == pair(6, pair(4, pair(18, None)))
+        assert 'goto_if_rebound' not in vm.eval_string("f").disasm()
+
+    def test_inline_size(self):
+        # the nested inlined calls share the budget
+        from skime.proc import Code
+        vm = VM()
+        vm.compiler = Compiler(optimize=2)
+        vm.eval_string("(define (f0 x) (+ x 1))")
+        for n in range(1, 8):
+            form = vm.compiler.compile(parse(
+                "(define (f%d x) (f%d (f%d (f%d x))))" % (n, n-1, n-1, n-1)),
+                                       vm.env)
+            vm.run(form)
+            size = sum([len(x.bytecode) for x in form.literals
+                        if isinstance(x, Code)])
+            assert size < 200
+        assert vm.eval_string("(f7 0)") == 3**7
+        assert 'goto_if_rebound' in vm.eval_string("f1").disasm()
+
+    def test_applied_lambda(self):
+        assert self.check("((lambda (x y) (+ x y)) 1 2)") == 3
+        assert self.eval("((lambda (x y) (+ x y)) 1 2)", optimize=2) == 3
+        code = self.disasm("(lambda (a) ((lambda (x) (* x a)) 2))", optimize=2)
+        assert 'make_closure' not in code
+        code = self.disasm("(lambda (a) ((lambda (x) (lambda () x)) a))", optimize=2)
+        assert 'make_closure' in code
@@ -1,9 +1,12 @@
 import helper
 
-from skime.compiler.parser import parse as p
+from cStringIO import StringIO
+
+from skime.compiler.parser import parse as p, Reader
 from skime.errors import ParseError
 from skime.types.symbol import Symbol as sym
 from skime.types.pair import Pair as pair
+from skime.types.vector import Vector
 
 from nose.tools import assert_almost_equal
 from nose.tools import assert_raises
@@ -20,6 +23,13 @@ class TestNumber(object):
         assert_almost_equal(p('-0.0'), 0.0)
         assert_almost_equal(p('2.5'), 2.5)
         assert_almost_equal(p('-200.75'), -200.75)
+        assert_almost_equal(p('.5'), 0.5)
+        assert_almost_equal(p('-.5'), -0.5)
+        assert_almost_equal(p('+.25'), 0.25)
+        assert p('5.') == 5.0
+        assert p('.5+.5i') == 0.5+0.5j
+        assert p('(.5 -.5)') == pair(0.5, pair(-0.5, None))
+        assert_raises(ParseError, p, '.5a')
 
     def test_complex(self):
         assert p('0+i') == 1j
@@ -43,6 +53,9 @@ class TestString(object):
         assert p(r'""') == ''
         assert p(r'"tab\t"') == 'tab\t'
         assert p(r'"newline\n"') == 'newline\n'
+        assert p(r'"unknown\q"') == r'unknown\q'
+        assert p('"two\nlines"') == 'two\nlines'
+        assert_raises(ParseError, p, '"foo')
 
 class TestSymbol(object):
     def test_symbol(self):
@@ -51,6 +64,8 @@ class TestSymbol(object):
         assert p('string->number') == sym('string->number')
         assert p('number?') == sym('number?')
         assert p('...') == sym('...')
+        assert p('-') == sym('-')
+        assert p('->x') == sym('->x')
 
 class TestBool(object):
     def test_bool(self):
@@ -65,13 +80,57 @@ class TestPair(object):
 
     def test_pair(self):
         assert p('(1 . 2)') == pair(1, 2)
-        assert p('(1 .2)') == pair(1, 2)
+        assert p('(1 . -2)') == pair(1, -2)
+        # not a dot but a number
+        assert p('(1 .2)') == pair(1, pair(0.2, None))
         assert p('(1 2 . 3)') == pair(1, pair(2, 3))
     
     def test_fail(self):
         assert_raises(ParseError, p, '(')
         assert_raises(ParseError, p, '(1 . 2 3)')
         assert_raises(ParseError, p, '(1))')
+        assert_raises(ParseError, p, '(1 . )')
+        assert_raises(ParseError, p, ')')
+
+    def test_deep(self):
+        # the lists are not read by recursion
+        res = p('(' * 5000 + ')' * 5000)
+        for i in range(4999):
+            assert res.rest is None
+            res = res.first
+        assert res is None
+
+    def test_line(self):
+        try:
+            p('(a\n "b\nc"\n ; (\n 1/)')
+        except ParseError, e:
+            assert ':5 ' in str(e)
+        else:
+            assert False
+
+
+class TestVector(object):
+    def test_vector(self):
+        assert p('#(1 "a" (b))') == Vector([1, "a", pair(sym('b'), None)])
+        assert p('#()') == Vector([])
+        assert p('#(#(1))') == Vector([Vector([1])])
+        assert p("'#(a)") == pair(sym('quote'), pair(Vector([sym('a')]), None))
+
+    def test_numeric(self):
+        v = p('#f64(1 2.5)')
+        assert v.tag == 'f64'
+        assert v.items.typecode == 'd'
+        assert v.items.tolist() == [1.0, 2.5]
+        assert p('#s64(1 -2)').items.tolist() == [1, -2]
+        assert p('#f64(1)') != p('#(1.0)')
+
+    def test_fail(self):
+        assert_raises(ParseError, p, '#(1')
+        assert_raises(ParseError, p, '#(1 . 2)')
+        assert_raises(ParseError, p, '#s64(1.5)')
+        assert_raises(ParseError, p, '#f64(a)')
+        assert_raises(ParseError, p, '#f32(1)')
+        assert_raises(ParseError, p, '#s64(#t)')
 
 
 class TestQuote(object):
@@ -114,3 +173,54 @@ class TestComment(object):
         assert_raises(ParseError, p, "; this is only comnent")
         assert_raises(ParseError, p, "; this is only comnent\n")
         assert_raises(ParseError, p, "\n\n  ; this is only comnent\n\n")
+
+class TestReader(object):
+    SOURCE = """\
+(define (foo x) ; a comment
+  (+ x 1))
+sym 12 "a string"
+; the end"""
+
+    def read(self, chunk_size):
+        return list(Reader(StringIO(self.SOURCE), chunk_size=chunk_size))
+
+    def test_chunks(self):
+        data = self.read(65536)
+        assert len(data) == 4
+        assert data[1:] == [sym('sym'), 12, "a string"]
+        for size in [1, 2, 3, 7]:
+            assert self.read(size) == data
+
+    def test_feed(self):
+        reader = Reader()
+        reader.feed('(define x')
+        assert list(reader) == []
+        assert reader.pending()
+        reader.feed(' 1) x')
+        assert list(reader) == [p('(define x 1)')]
+        reader.feed('yz')
+        reader.close()
+        assert list(reader) == [sym('xyz')]
+        assert not reader.pending()
+
+    def test_line(self):
+        reader = Reader(StringIO(self.SOURCE), chunk_size=5)
+        reader.next()
+        assert reader.line == 2
+        reader.next()
+        assert reader.line == 3
+
+    def test_positions(self):
+        reader = Reader(StringIO(self.SOURCE), chunk_size=5)
+        expr = reader.next()
+        body = expr.rest.rest.first
+        assert reader.positions[id(expr)] == (1, 1)
+        assert reader.positions[id(expr.rest.first)] == (1, 9)
+        assert reader.positions[id(body)] == (2, 3)
+        # the positions of the lists only
+        assert len(reader.positions) == 3
+
+    def test_fail(self):
+        reader = Reader(StringIO("1 (2 3"), chunk_size=2)
+        assert reader.next() == 1
+        assert_raises(ParseError, reader.next)
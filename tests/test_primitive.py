@@ -1,3 +1,4 @@
+import helper
 from helper import HelperVM
 
 from skime.errors       import WrongArgType
@@ -6,6 +7,7 @@ from skime.errors       import MiscError
 
 from skime.types.pair   import Pair as pair
 from skime.types.symbol import Symbol as sym
+from skime.types.vector import Vector
 
 from nose.tools import assert_raises
 
@@ -142,3 +144,124 @@ class TestMap(HelperVM):
         assert_raises(WrongArgNumber, self.eval, "(map (lambda (x y) (pair x y)) '(1 2))")
         assert_raises(WrongArgType, self.eval, "(map + '(1 2 3 . 4))")
         assert_raises(MiscError, self.eval, "(map + '(1 2) '(3 4 5))")
+
+class TestVector(HelperVM):
+    def test_vector(self):
+        assert self.eval("#(1 2)") == Vector([1, 2])
+        assert self.eval("(vector 1 'a)") == Vector([1, sym('a')])
+        assert self.eval("(make-vector 2 'a)") == Vector([sym('a'), sym('a')])
+        assert self.eval("(vector-length (make-vector 3))") == 3
+        assert self.eval("(vector-ref #(1 2) 1)") == 2
+        assert self.eval("""
+        (let ((v (make-vector 2 0)))
+          (vector-set! v 1 'a)
+          v)""") == Vector([0, sym('a')])
+        assert self.eval("(vector->list #(1 2))") == pair(1, pair(2, None))
+        assert self.eval("(list->vector '(1 2))") == Vector([1, 2])
+        assert self.eval("""
+        (let ((v (vector 1 2)))
+          (vector-fill! v 0)
+          v)""") == Vector([0, 0])
+        assert self.eval("(vector? #(1))") == True
+        assert self.eval("(vector? '(1))") == False
+        assert self.eval("(equal? #(1 (2)) (vector 1 (list 2)))") == True
+        assert self.eval("(eq? #(1) #(1))") == False
+        assert str(self.eval("(vector 1 (list 2) #())")) == "#(1 (2) #())"
+
+        assert_raises(WrongArgType, self.eval, "(vector-ref '(1) 0)")
+        assert_raises(WrongArgType, self.eval, "(vector-ref #(1) 'a)")
+        assert_raises(MiscError, self.eval, "(vector-ref #(1) 1)")
+        assert_raises(MiscError, self.eval, "(vector-ref #(1) -1)")
+        assert_raises(MiscError, self.eval, "(vector-set! #(1) 1 0)")
+        assert_raises(MiscError, self.eval, "(make-vector -1)")
+        assert_raises(WrongArgType, self.eval, "(list->vector '(1 . 2))")
+
+    def test_numeric(self):
+        v = self.eval("(make-f64vector 2)")
+        assert v.items.typecode == 'd'
+        assert v.items.tolist() == [0.0, 0.0]
+        assert str(self.eval("(f64vector 1 2.5)")) == "#f64(1.0 2.5)"
+        assert str(self.eval("(list->s64vector '(1 2))")) == "#s64(1 2)"
+        assert self.eval("""
+        (let ((v (make-s64vector 2 1)))
+          (vector-set! v 0 5)
+          (list (vector-ref v 0) (vector-length v) (vector->list v)))""") == \
+          pair(5, pair(2, pair(pair(5, pair(1, None)), None)))
+        assert self.eval("(f64vector? #f64(1))") == True
+        assert self.eval("(f64vector? #s64(1))") == False
+        assert self.eval("(vector? #s64(1))") == True
+        assert self.eval("(equal? #f64(1) #f64(1.0))") == True
+        assert self.eval("(equal? #f64(1) #(1.0))") == False
+
+        assert_raises(WrongArgType, self.eval, "(vector-set! #s64(1) 0 1.5)")
+        assert_raises(WrongArgType, self.eval, "(vector-set! #s64(1) 0 (expt 2 70))")
+        assert_raises(WrongArgType, self.eval, "(vector-set! #f64(1) 0 'a)")
+        assert_raises(WrongArgType, self.eval, "(vector-fill! #f64(1) 'a)")
+        assert_raises(WrongArgType, self.eval, "(s64vector 1 'a)")
+        # the booleans are not numbers
+        assert_raises(WrongArgType, self.eval, "(vector-set! #s64(1) 0 #t)")
+        assert_raises(WrongArgType, self.eval, "(vector-set! #f64(1) 0 #f)")
+        assert_raises(WrongArgType, self.eval, "(vector-fill! #s64(1) #t)")
+        assert_raises(WrongArgType, self.eval, "(f64vector 1 #t)")
+        assert_raises(WrongArgType, self.eval, "(make-f64vector 2 #t)")
+        assert_raises(WrongArgType, self.eval, "(list->s64vector '(#f))")
+        assert self.eval("""
+        (let ((v (vector 1 2)))
+          (vector-set! v 0 #t)
+          (vector-ref v 0))""") == True
+
+class TestInlinePrimitive(HelperVM):
+    def test_inlined(self):
+        vm = helper.VM()
+        form = vm.compiler.compile(helper.parse("(define (foo a b) (+ a (car b)))"),
+                                   vm.env)
+        code = form.literals[0].disasm()
+        assert 'add2' in code
+        assert 'car' in code
+        assert 'call' not in code
+
+        form = vm.compiler.compile(helper.parse("(define (foo v) (vector-set! v 0 (vector-ref v 1)))"),
+                                   vm.env)
+        code = form.literals[0].disasm()
+        assert 'vector_ref' in code
+        assert 'vector_set' in code
+        assert 'call' not in code
+
+    def test_semantics(self):
+        assert self.eval('(+ 1 2)') == 3
+        assert self.eval('(+ 1.5 2)') == 3.5
+        assert self.eval('(- 1 2)') == -1
+        assert self.eval('(< 1 2)') == True
+        assert self.eval('(>= 1 2)') == False
+        assert self.eval('(= 2 2.0)') == True
+        assert self.eval("(car '(1 2))") == 1
+        assert self.eval("(cdr '(1))") == None
+        assert self.eval("(null? '())") == True
+        assert self.eval("(eq? 'a 'a)") == True
+        assert_raises(WrongArgType, self.eval, '(+ 1 "foo")')
+        assert_raises(WrongArgType, self.eval, '(car 1)')
+        assert_raises(WrongArgType, self.eval, '(= 1 "foo")')
+
+    def test_shadowed(self):
+        assert self.eval("((lambda (+) (+ 1 2)) -)") == -1
+        assert self.eval("""
+        (begin
+          (define (foo car) (car 5))
+          (foo (lambda (x) (* x 2))))""") == 10
+
+    def test_rebound(self):
+        assert self.eval("""
+        (begin
+          (define (foo a b) (+ a b))
+          (set! + (lambda (a b) (- a b)))
+          (foo 5 3))""") == 2
+        assert self.eval("""
+        (begin
+          (define (foo a) (null? a))
+          (set! null? (lambda (a) 'rebound))
+          (foo 5))""") == sym('rebound')
+        assert self.eval("""
+        (begin
+          (define (foo v) (vector-ref v 0))
+          (set! vector-ref (lambda (v k) k))
+          (foo #(1)))""") == 0
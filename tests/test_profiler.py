@@ -0,0 +1,85 @@
+import re
+
+from helper import VM
+
+from skime.iset import INSTRUCTIONS
+from skime.profiler import Profiler
+
+from nose.tools import assert_raises
+
+class TestProfiler(object):
+    def setup(self):
+        self.vm = VM()
+        # Each reading of the timer takes a microsecond
+        self.clock = [0]
+        def timer():
+            self.clock[0] += 1
+            return self.clock[0] / 1000000.0
+        self.profiler = Profiler(timer)
+        self.vm.eval_string("""
+        (define (fib n)
+          (if (< n 2)
+              n
+              (+ (fib (- n 1)) (fib (- n 2)))))""")
+        self.vm.eval_string("""
+        (define (loop i acc)
+          (if (= i 0) acc (loop (- i 1) (+ acc 1))))""")
+        self.vm.engine = self.profiler.run
+
+    def stats(self, name):
+        for key, st in self.profiler.stats.items():
+            if self.profiler.name(key) == name:
+                return st
+        return None
+
+    def test_calls(self):
+        assert self.vm.eval_string("(fib 10)") == 55
+        assert self.vm.eval_string("(loop 100 0)") == 100
+        assert self.vm.eval_string("(apply + '(1 2))") == 3
+        # apply calls fib in the engine
+        assert self.vm.eval_string("(apply apply fib '((5)))") == 5
+        assert self.profiler.stack == []
+
+        assert self.stats('fib').calls == 177 + 15
+        # tail calls are calls too
+        assert self.stats('loop').calls == 101
+        assert self.stats('apply').calls == 3
+        fib = self.stats('fib')
+        assert 0 < fib.exclusive <= fib.inclusive
+        top = self.stats('<toplevel>')
+        assert top.calls == 4
+        assert top.inclusive > fib.inclusive + self.stats('loop').inclusive
+
+    def test_sites(self):
+        self.vm.eval_string("(fib 5)")
+        code = self.vm.eval_string("fib").code
+        sites = [(ip, n) for (caller, ip, callee), n in self.profiler.sites.items()
+                 if caller is code and callee is code]
+        # the two recursive calls
+        assert len(sites) == 2
+        assert sum([n for ip, n in sites]) == 14
+        for ip, n in sites:
+            assert INSTRUCTIONS[code.bytecode[ip]].name in ['call', 'tail_call']
+            assert '%04X' % ip in code.disasm()
+
+    def test_continuation(self):
+        assert self.vm.eval_string("""
+        (+ 1 (call/cc (lambda (k) (fib 3) (k 10) 20)))""") == 11
+        assert self.profiler.stack == []
+        assert self.stats('fib').calls == 5
+
+        # errors unwind the calls
+        assert_raises(Exception, self.vm.eval_string, "(fib 'x)")
+        assert self.profiler.stack == []
+
+    def test_report(self):
+        self.vm.eval_string("(fib 6)")
+        report = self.profiler.report()
+        assert re.search(r'^ +25 .* fib \(<string>:2\)$', report, re.M)
+        assert re.search(r'fib\+0x.* -> fib \(<string>:5\)$', report, re.M)
+
+        lines = self.profiler.collapsed().split('\n')
+        for line in lines:
+            assert re.match(r'^\S+ \d+$', line)
+        paths = [line.split()[0] for line in lines]
+        assert '<toplevel>;fib;fib;fib' in paths
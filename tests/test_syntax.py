@@ -1,4 +1,4 @@
-from helper import HelperVM
+from helper import HelperVM, VM, parse
 
 from skime.types.symbol import Symbol as sym
 from skime.types.pair import Pair as pair
@@ -40,6 +40,26 @@ class TestSyntax(HelperVM):
         assert self.eval("((lambda (x . y) y) 1)") == None
         assert self.eval("((lambda (x . y) (first y)) 1 2 3)") == 2
 
+    def test_closure(self):
+        # each evaluation of a lambda expression makes a new closure
+        assert self.eval("""
+        (begin
+          (define (make-counter)
+            (let ((n 0))
+              (lambda () (set! n (+ n 1)) n)))
+          (define c1 (make-counter))
+          (c1)
+          (c1)
+          (define c2 (make-counter))
+          (list (c1) (c2)))""") == pair(3, pair(1, None))
+
+        assert self.eval("""
+        (begin
+          (define (make-adder n) (lambda (x) (+ x n)))
+          (define add1 (make-adder 1))
+          (define add5 (make-adder 5))
+          (list (add1 10) (add5 10)))""") == pair(11, pair(15, None))
+
     def test_call(self):
         assert self.eval("(- 5 4)") == 1
 
@@ -65,6 +85,26 @@ class TestSyntax(HelperVM):
         assert self.eval("(set! pair 10)") == 10
         assert_raises(UnboundVariable, self.eval, "(set! var-not-exist 10)")
 
+    def test_global(self):
+        vm = VM()
+        vm.eval_string("""
+        (begin
+          (define x 1)
+          (define (foo)
+            (lambda ()
+              (lambda ()
+                (set! x (+ x 1))
+                (car (list x))))))""")
+        code = vm.eval_string("((foo))").disasm()
+        assert 'push_global' in code and 'set_global' in code
+        assert 'depth' not in code
+        assert vm.eval_string("(((foo)))") == 2
+        # defining again is seen by the code compiled before
+        vm.eval_string("(define x 10)")
+        assert vm.eval_string("(((foo)))") == 11
+        vm.eval_string("(define (car x) 'redefined)")
+        assert vm.eval_string("(((foo)))") == sym('redefined')
+
     def test_let(self):
         assert self.eval("""
         (let ((a 3) (b 2))
@@ -80,6 +120,63 @@ class TestSyntax(HelperVM):
         assert self.eval("(let () #t)") == True
         assert self.eval("(let ())") == None
 
+    def test_let_in_frame(self):
+        # the variables of let in procedures are kept in the frame
+        assert self.eval("""
+        (begin
+          (define (foo x)
+            (let ((y (+ x 1)))
+              (let ((x (* y 2)))
+                (list x y))))
+          (foo 1))""") == pair(4, pair(2, None))
+
+        # the scope ends with the let
+        assert self.eval("""
+        (begin
+          (define (foo x)
+            (+ (let ((x 10)) x) x))
+          (foo 1))""") == 11
+
+        assert self.eval("""
+        (begin
+          (define (foo x)
+            (let* ((x (+ x 1)) (x (* x 2)))
+              x))
+          (foo 1))""") == 4
+
+        assert self.eval("""
+        (begin
+          (define (foo)
+            (let ()
+              (define a 5)
+              (letrec ((b (+ a 1)))
+                (list a b))))
+          (foo))""") == pair(5, pair(6, None))
+
+        vm = VM()
+        form = vm.compiler.compile(parse("""
+        (define (foo n)
+          (let ((acc 0))
+            (do ((i 0 (+ i 1)))
+                ((= i n) acc)
+              (set! acc (+ acc i)))))"""), vm.env)
+        code = form.literals[0].disasm()
+        assert 'call' not in code
+        vm.run(form)
+        assert vm.eval_string("(foo 5)") == 10
+
+    def test_let_captured(self):
+        # each closure made in the loop captures a variable of its own
+        assert self.eval("""
+        (begin
+          (define (foo)
+            (let ((fs '()))
+              (do ((i 0 (+ i 1)))
+                  ((= i 3) (map (lambda (f) (f)) fs))
+                (let ((j i))
+                  (set! fs (cons (lambda () j) fs))))))
+          (foo))""") == pair(2, pair(1, pair(0, None)))
+
     def test_do(self):
         assert self.eval("""
         (do ((a 6 b) (b 9 (remainder a b)))
@@ -109,3 +206,12 @@ class TestSyntax(HelperVM):
         assert_raises(SyntaxError, self.eval, """
         (cond (else 5)
               (#t 6))""")
+
+        assert self.eval("""
+        (cond (#f 5 6)
+              (else 10))""") == 10
+
+        assert self.eval("""
+        (cond (#f)
+              (#f => (lambda (x) x))
+              (else (+ 1 2)))""") == 3
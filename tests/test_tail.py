@@ -0,0 +1,69 @@
+from helper import VM
+
+from skime.types.pair import Pair as pair
+from skime.errors import WrongArgType
+
+# Loops whose procedure f calls itself in a tail position, and raises
+# an error at the end, with the contexts being run recorded
+LOOPS = [
+    "(define (f n) (cond ((= n 0) (car 0)) (else (f (- n 1)))))",
+    "(define (f n) (cond ((= n 0) (car 0)) ((> n 0) (f (- n 1)))))",
+    "(define (f n) (cond ((= n 0) (car 0)) ((- n 1) => f)))",
+    "(define (f n) (and #t (if (= n 0) (car 0) (f (- n 1)))))",
+    "(define (f n) (or (= n -1) (if (= n 0) (car 0) (f (- n 1)))))",
+    "(define (f n) (if (= n 0) (car 0) (apply f (list (- n 1)))))",
+    "(define (f n) (if (= n 0) (car 0) (apply f (- n 1) '())))",
+    "(define (f n) (if (= n 0) (car 0) (call/cc (lambda (k) (f (- n 1))))))",
+    "(define (f n) (if (= n 0) (car 0) (call/1cc (lambda (k) (f (- n 1))))))",
+]
+
+class TestTailCall(object):
+    def contexts(self, vm, source):
+        "Run a loop, return the number of contexts at its end."
+        vm.eval_string(source)
+        try:
+            # the nested engines of apply would exhaust the Python stack
+            vm.eval_string("(f 500)")
+        except WrongArgType, e:
+            return len(e.skime_traceback)
+        assert False
+
+    def test_constant_space(self):
+        for engine in ['table', 'threaded']:
+            for shared_stack in [False, True]:
+                for optimize in [0, 2]:
+                    vm = VM(engine=engine, shared_stack=shared_stack)
+                    vm.compiler.optimize = optimize
+                    for source in LOOPS:
+                        # the top level form and f
+                        assert self.contexts(vm, source) == 2
+
+    def test_and_or(self):
+        # the value ending them is returned from tail position
+        vm = VM()
+        for optimize in [0, 2]:
+            vm.compiler.optimize = optimize
+            assert vm.eval_string("(+ 1 ((lambda (x) (or x 2)) 3))") == 4
+            assert vm.eval_string("(+ 1 ((lambda (x) (or #f x)) 3))") == 4
+            assert vm.eval_string("((lambda (x) (and x 2)) #f)") is False
+            assert vm.eval_string("(+ 1 ((lambda (x) (and x 2)) 1))") == 3
+            assert vm.eval_string("(+ 1 ((lambda (x) (cond (x))) 4))") == 5
+
+    def test_call_cc(self):
+        # the continuation of a call/cc in tail position returns to
+        # the caller
+        vm = VM()
+        vm.eval_string("(define (h f) (call/cc f))")
+        assert vm.eval_string("""
+        (let ((k #f) (count 0))
+          (let ((v (h (lambda (c) (set! k c) 1))))
+            (set! count (+ count 1))
+            (if (< count 3)
+                (k (* v 2))
+                (list v count))))""") == pair(4, pair(3, None))
+
+    def test_apply(self):
+        vm = VM()
+        assert vm.eval_string("(apply + 1 2 '(3 4))") == 10
+        assert vm.eval_string("(apply apply (list + (list 1 2)))") == 3
+        assert vm.eval_string("(apply (lambda x x) '())") is None
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+
+from helper import VM
+
+from skime.ctx import format_traceback
+from skime.errors import WrongArgType, SyntaxError
+
+SOURCE = """\
+(define (first x)
+  (car x))
+
+(define (second x)
+  (define y (cdr x))
+  (list (first
+         y)))
+"""
+
+class TestTraceback(object):
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'lib.scm')
+        io = open(self.path, 'w')
+        io.write(SOURCE)
+        io.close()
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def error(self, vm, code):
+        try:
+            vm.eval_string(code)
+        except WrongArgType, e:
+            return e
+        assert False
+
+    def check(self, vm):
+        first = vm.eval_string("first").code
+        assert first.filename == self.path
+        assert first.line == 1
+        assert first.line_of(len(first.bytecode)-1) == 2
+
+        e = self.error(vm, "(second '(1 . 2))")
+        lines = format_traceback(e).split('\n')
+        assert lines[-4:] == [
+            '  File "<string>", line 1, in <toplevel>',
+            '  File "%s", line 6, in second' % self.path,
+            '  File "%s", line 2, in first' % self.path,
+            'WrongArgType: %s' % e]
+
+        # the runs nested in a primitive
+        e = self.error(vm, "(apply second\n (list (cons 1 2)))")
+        assert [form.line_of(ip) for form, ip in e.skime_traceback] == [2, 6, 1]
+
+    def load(self, **kw):
+        vm = VM(**kw)
+        # first would be inlined into second
+        vm.compiler.inline_budget = 0
+        vm.load(self.path)
+        return vm
+
+    def test_engines(self):
+        for engine in ['table', 'threaded']:
+            self.check(self.load(engine=engine, cache_dir=None))
+
+    def test_cache(self):
+        # compiled, then read from the cache
+        for i in range(2):
+            self.check(self.load(cache_dir=self.dir))
+
+    def test_compile_error(self):
+        vm = VM()
+        try:
+            vm.eval_string("(define (f)\n  (if))")
+        except SyntaxError, e:
+            assert e.location == ('<string>', 2, 3)
+            assert str(e).startswith('<string>:2:3 ')
+        else:
+            assert False